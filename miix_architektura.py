@@ -4,18 +4,24 @@ bl_info = {
     "category": "Object",
 }
 
-import bpy, bmesh, os, re, unicodedata, datetime, math, threading, json, hashlib
+import bpy, bmesh, os, re, unicodedata, datetime, math, threading, json, hashlib, queue, tempfile, time, io, shutil, functools
 from mathutils import Vector, Matrix
 from bpy_extras.object_utils import world_to_camera_view
 from bpy.props import EnumProperty, IntProperty, StringProperty, FloatProperty, BoolProperty, CollectionProperty, PointerProperty, FloatVectorProperty
 from bpy.types import Panel, Operator
 from bpy.app.handlers import persistent
+from contextlib import contextmanager
 
 try:
     import ezdxf
 except ImportError:
     ezdxf = None
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 # Predefiniowane kolory Proneko (RGB 0-255)
 PRONEKO_COLORS = [
@@ -314,7 +320,7 @@ def import_layers_from_text():
             new_layer.expanded = layer_data.get('expanded', False)
             imported_count += 1
         except Exception as e:
-            debug_log(f"Błąd importu warstwy {layer_data.get('name', 'unknown')}: {e}")
+            debug_log(f"Błąd importu warstwy {layer_data.get('name', 'unknown')}: {e}", level='ERROR')
     
     return {'FINISHED'}, f"Zaimportowano {imported_count} warstw z '{text_name}'"
 
@@ -323,7 +329,7 @@ def auto_export_layers_to_text():
     try:
         export_layers_to_text()
     except Exception as e:
-        debug_log(f"Błąd automatycznego eksportu warstw: {e}")
+        debug_log(f"Błąd automatycznego eksportu warstw: {e}", level='ERROR')
 
 def auto_import_layers_from_text():
     """Automatyczny import warstw z Text bloku przy otwieraniu pliku"""
@@ -334,237 +340,572 @@ def auto_import_layers_from_text():
             if result == {'FINISHED'}:
                 debug_log(f"Auto-import warstw: {message}")
     except Exception as e:
-        debug_log(f"Błąd automatycznego importu warstw: {e}")
+        debug_log(f"Błąd automatycznego importu warstw: {e}", level='ERROR')
 
 # --- SYSTEM CACHE DXF -------------------------------------------------------
 
     import json
+import mmap, sys
+from array import array
 import hashlib
 from datetime import datetime
 
-# Globalny cache w pamięci dla szybkiego dostępu
+# Cache DXF to plik poboczny obok .blend: indeks JSON + spakowane tablice
+# float64/int32 mapowane do pamięci (mmap). Ładowanie leniwe, zapis zbiorczy
+# raz na koniec eksportu (flush przez save_dxf_cache).
+DXF_CACHE_VERSION = 4
+DXF_CACHE_INDEX_EXT = ".miix_dxf_cache.idx"
+DXF_CACHE_DATA_EXT = ".miix_dxf_cache.bin"
+
+# Indeks cache (version, blend_file, last_updated, objects) - wpisy bez geometrii
 _dxf_memory_cache = {}
-_cache_file_path = None
+_dxf_cache_blob = None       # mmap pliku .bin (tylko do odczytu)
+_dxf_cache_pending = {}      # obj_name -> spakowana geometria czekająca na zapis
+_dxf_cache_dirty = False
+_dxf_cache_touched = set()   # klucze odczytane/zapisane od ostatniego zapisu (przycinanie)
 
-def get_cache_text_block():
-    """Zwraca lub tworzy Text blok dla cache DXF"""
-    cache_name = "MIIX_DXF_Cache"
-    
-    # Sprawdź czy Text blok już istnieje
-    if cache_name in bpy.data.texts:
-        return bpy.data.texts[cache_name]
-    
-    # Utwórz nowy Text blok
-    cache_text = bpy.data.texts.new(cache_name)
-    cache_text.from_string(json.dumps({
-        'version': '1.0',
+def get_cache_file_path():
+    """Zwraca bazową ścieżkę plików cache obok pliku .blend (None dla niezapisanego pliku)"""
+    if not bpy.data.filepath:
+        return None
+    blend_dir = os.path.dirname(bpy.data.filepath)
+    blend_name = os.path.splitext(os.path.basename(bpy.data.filepath))[0]
+    return os.path.join(blend_dir, blend_name)
+
+def _empty_dxf_cache_index():
+    return {
+        'version': DXF_CACHE_VERSION,
+        'byteorder': sys.byteorder,
         'blend_file': bpy.data.filepath,
         'last_updated': datetime.now().isoformat(),
         'objects': {}
-    }, indent=2, ensure_ascii=False))
-    
-    return cache_text
-
-def get_cache_file_path():
-    """Zwraca ścieżkę do pliku cache obok pliku .blend (zachowana dla kompatybilności)"""
-    global _cache_file_path
-    if _cache_file_path:
-        return _cache_file_path
-    
-    if bpy.data.filepath:
-        blend_dir = os.path.dirname(bpy.data.filepath)
-        blend_name = os.path.splitext(os.path.basename(bpy.data.filepath))[0]
-        _cache_file_path = os.path.join(blend_dir, f"{blend_name}.miix_dxf_cache.json")
-        return _cache_file_path
-    return None
+    }
 
-def calculate_object_fingerprint(obj):
-    """Oblicza unikalny fingerprint obiektu na podstawie geometrii i ustawień"""
-    if obj.type not in ['MESH', 'FONT']:
-        return None
-    
-    try:
-        # Podstawowe dane obiektu
-        fingerprint_data = {
-            'name': obj.name,
-            'type': obj.type,
-            'transform': [list(row) for row in obj.matrix_world],
-        }
-        
-        # DXF settings z Custom Properties (będą dodane później)
-        fingerprint_data['dxf_settings'] = {
-            'layer': obj.get("miix_dxf_layer", ""),
-            'boundary_edges': obj.get("miix_dxf_boundary_edges", True),
-            'internal_edges': obj.get("miix_dxf_internal_edges", False),
-            'hatches': obj.get("miix_dxf_hatches", True),
-        }
-        
-        # Geometry data
-        if obj.type == 'MESH':
-            deps = bpy.context.evaluated_depsgraph_get()
-            eval_obj = obj.evaluated_get(deps)
-            mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps)
-            
-            try:
-                # Hash vertices i faces - tylko podstawowe dane
-                fingerprint_data['geometry'] = {
-                    'vertex_count': len(mesh.vertices),
-                    'face_count': len(mesh.polygons),
-                    'edge_count': len(mesh.edges),
-                    'bbox': [list(obj.bound_box[i]) for i in range(8)]
-                }
-            finally:
-                bpy.data.meshes.remove(mesh)
-                
-        elif obj.type == 'FONT':
-            # Dla fontów - tekst, rozmiar, font
-            fingerprint_data['font_data'] = {
-                'body': obj.data.body,
-                'size': obj.data.size,
-                'font': obj.data.font.name if obj.data.font else 'default',
-                'offset': obj.data.offset,
-                'extrude': obj.data.extrude,
-                'bevel_depth': obj.data.bevel_depth,
-            }
-        
-        # Oblicz hash
-        json_str = json.dumps(fingerprint_data, sort_keys=True)
-        return hashlib.md5(json_str.encode()).hexdigest()
-        
-    except Exception as e:
-        debug_log(f"Błąd obliczania fingerprint dla {obj.name}: {e}")
-        return None
+def _close_dxf_cache_blob():
+    global _dxf_cache_blob
+    if _dxf_cache_blob is not None:
+        try:
+            _dxf_cache_blob.close()
+        except (BufferError, ValueError):
+            # Żywe memoryview trzymają mapę - zwolni ją garbage collector
+            pass
+        _dxf_cache_blob = None
+
+def _pack_geometry(geometry_data):
+    """Rozdziela geometrię na tablice float64/int32 i metadane JSON"""
+    arrays = {}
+    meta = {}
+    for key, value in geometry_data.items():
+        if isinstance(value, (list, tuple)) and value:
+            first = value[0]
+            rows = value if isinstance(first, (list, tuple)) else [(v,) for v in value]
+            flat = [c for row in rows for c in row]
+            if all(isinstance(c, (int, float)) and not isinstance(c, bool) for c in flat):
+                typecode = 'i' if all(isinstance(c, int) for c in flat) else 'd'
+                widths = {len(row) for row in rows}
+                if not isinstance(first, (list, tuple)):
+                    arrays[key] = (typecode, 0, array(typecode, flat), None)
+                elif len(widths) == 1:
+                    arrays[key] = (typecode, widths.pop(), array(typecode, flat), None)
+                else:
+                    arrays[key] = (typecode, -1, array(typecode, flat),
+                                   array('i', [len(row) for row in rows]))
+                continue
+        meta[key] = value
+    return arrays, meta
+
+def _unpack_array(typecode, width, values, lengths):
+    """Odtwarza listę (krotek) ze spakowanej tablicy"""
+    if width == 0:
+        return list(values)
+    if width > 0:
+        it = iter(values)
+        return list(zip(*[it] * width))
+    out = []
+    start = 0
+    for n in lengths:
+        out.append(list(values[start:start + n]))
+        start += n
+    return out
+
+def _blob_view(typecode, offset, count):
+    """Widok memoryview na fragment zmapowanego pliku .bin (bez kopiowania)"""
+    size = array(typecode).itemsize
+    return memoryview(_dxf_cache_blob)[offset:offset + count * size].cast(typecode)
 
 def load_dxf_cache():
-    """Ładuje cache z Text bloku Blendera"""
-    global _dxf_memory_cache
+    """Leniwie ładuje indeks cache i mapuje plik danych do pamięci"""
+    global _dxf_memory_cache, _dxf_cache_blob, _dxf_cache_pending, _dxf_cache_dirty
+    
+    _close_dxf_cache_blob()
+    _dxf_cache_pending = {}
+    _dxf_cache_dirty = False
+    _dxf_cache_touched.clear()
+    _dxf_memory_cache = _empty_dxf_cache_index()
+    
+    # Stary cache w Text bloku (JSON z całą geometrią) tylko puchnie z .blend
+    legacy = bpy.data.texts.get("MIIX_DXF_Cache")
+    if legacy is not None:
+        bpy.data.texts.remove(legacy)
+        debug_log("Usunięto stary cache DXF z Text bloku")
+    
+    base = get_cache_file_path()
+    if not base:
+        return _dxf_memory_cache
     
+    index_path = base + DXF_CACHE_INDEX_EXT
+    data_path = base + DXF_CACHE_DATA_EXT
     try:
-        cache_text = get_cache_text_block()
-        if cache_text and cache_text.as_string():
-            _dxf_memory_cache = json.loads(cache_text.as_string())
-            debug_log(f"Cache załadowany z Text bloku: {len(_dxf_memory_cache.get('objects', {}))} obiektów")
+        if not (os.path.exists(index_path) and os.path.exists(data_path)):
             return _dxf_memory_cache
+        with open(index_path, 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('version') != DXF_CACHE_VERSION or index.get('byteorder') != sys.byteorder:
+            debug_log("Cache DXF w innym formacie - pomijam")
+            return _dxf_memory_cache
+        if os.path.getsize(data_path):
+            with open(data_path, 'rb') as f:
+                _dxf_cache_blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        _dxf_memory_cache = index
+        debug_log(f"Cache załadowany z {index_path}: {len(index.get('objects', {}))} obiektów")
     except Exception as e:
-        debug_log(f"Błąd ładowania cache z Text bloku: {e}")
-    
-    # Fallback - utwórz nowy cache
-    _dxf_memory_cache = {
-        'version': '1.0',
-        'blend_file': bpy.data.filepath,
-        'last_updated': datetime.now().isoformat(),
-        'objects': {}
-    }
+        debug_log(f"Błąd ładowania cache DXF: {e}", level='ERROR')
+        _close_dxf_cache_blob()
+        _dxf_memory_cache = _empty_dxf_cache_index()
     return _dxf_memory_cache
 
-def save_dxf_cache():
-    """Zapisuje cache do Text bloku Blendera"""
-    global _dxf_memory_cache
+def save_dxf_cache(prune_prefix=None):
+    """Zbiorczo zapisuje zmiany cache do plików pobocznych (raz na eksport).
     
-    if not _dxf_memory_cache:
+    prune_prefix: wpisy o tym prefiksie klucza (np. "Kamera|"), których eksport
+    nie odczytał ani nie zapisał, są usuwane - znikają części po usuniętych
+    lub przemianowanych obiektach.
+    """
+    global _dxf_memory_cache, _dxf_cache_blob, _dxf_cache_pending, _dxf_cache_dirty
+    
+    if _dxf_memory_cache and prune_prefix:
+        objects = _dxf_memory_cache.get('objects', {})
+        stale = [key for key in objects
+                 if key.startswith(prune_prefix) and key not in _dxf_cache_touched]
+        for key in stale:
+            del objects[key]
+            _dxf_cache_pending.pop(key, None)
+        if stale:
+            _dxf_cache_dirty = True
+            debug_log(f"Cache: usunięto {len(stale)} nieużywanych wpisów {prune_prefix}*")
+    _dxf_cache_touched.clear()
+    
+    if not _dxf_memory_cache or not _dxf_cache_dirty:
+        return False
+    
+    base = get_cache_file_path()
+    if not base:
+        # Niezapisany .blend - cache żyje tylko w pamięci
         return False
     
+    index_path = base + DXF_CACHE_INDEX_EXT
+    data_path = base + DXF_CACHE_DATA_EXT
     try:
+        objects = {}
+        offset = 0
+        with open(data_path + ".tmp", 'wb') as out:
+            for obj_name, entry in _dxf_memory_cache.get('objects', {}).items():
+                packed = _dxf_cache_pending.get(obj_name)
+                new_arrays = {}
+                if packed is not None:
+                    arrays, meta = packed
+                    for key, (typecode, width, values, lengths) in arrays.items():
+                        data = values.tobytes()
+                        out.write(data)
+                        slot = [typecode, width, offset, len(values)]
+                        offset += len(data)
+                        if lengths is not None:
+                            data = lengths.tobytes()
+                            out.write(data)
+                            slot += [offset, len(lengths)]
+                            offset += len(data)
+                        new_arrays[key] = slot
+                elif _dxf_cache_blob is not None:
+                    # Niezmieniony wpis - kopiuj bajty ze starej mapy
+                    meta = entry.get('meta', {})
+                    for key, slot in entry.get('arrays', {}).items():
+                        slot = list(slot)
+                        for pos, typecode in zip(range(2, len(slot), 2), (slot[0], 'i')):
+                            start, count = slot[pos], slot[pos + 1]
+                            size = count * array(typecode).itemsize
+                            out.write(_dxf_cache_blob[start:start + size])
+                            slot[pos] = offset
+                            offset += size
+                        new_arrays[key] = slot
+                else:
+                    continue
+                objects[obj_name] = {**entry, 'arrays': new_arrays, 'meta': meta}
+        
+        _dxf_memory_cache['objects'] = objects
         _dxf_memory_cache['last_updated'] = datetime.now().isoformat()
         _dxf_memory_cache['blend_file'] = bpy.data.filepath
+        with open(index_path + ".tmp", 'w', encoding='utf-8') as f:
+            json.dump(_dxf_memory_cache, f, ensure_ascii=False, separators=(',', ':'))
+        
+        _close_dxf_cache_blob()
+        os.replace(data_path + ".tmp", data_path)
+        os.replace(index_path + ".tmp", index_path)
+        _dxf_cache_pending = {}
+        _dxf_cache_dirty = False
         
-        cache_text = get_cache_text_block()
-        cache_json = json.dumps(_dxf_memory_cache, indent=2, ensure_ascii=False)
-        cache_text.from_string(cache_json)
+        if offset:
+            with open(data_path, 'rb') as f:
+                _dxf_cache_blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
         
-        debug_log(f"Cache zapisany do Text bloku: {len(_dxf_memory_cache.get('objects', {}))} obiektów")
+        debug_log(f"Cache zapisany: {len(objects)} obiektów, {offset / 1024:.1f} KB")
         return True
     except Exception as e:
-        debug_log(f"Błąd zapisu cache do Text bloku: {e}")
+        debug_log(f"Błąd zapisu cache DXF: {e}", level='ERROR')
         return False
 
-def get_cached_geometry(obj):
-    """Pobiera cached geometry dla obiektu"""
-    global _dxf_memory_cache
+def clear_dxf_cache():
+    """Czyści cache w pamięci i usuwa pliki poboczne"""
+    global _dxf_memory_cache, _dxf_cache_pending, _dxf_cache_dirty
+    _close_dxf_cache_blob()
+    _dxf_memory_cache = _empty_dxf_cache_index()
+    _dxf_cache_pending = {}
+    _dxf_cache_dirty = False
+    _dxf_cache_touched.clear()
+    base = get_cache_file_path()
+    if base:
+        for ext in (DXF_CACHE_INDEX_EXT, DXF_CACHE_DATA_EXT):
+            if os.path.exists(base + ext):
+                os.remove(base + ext)
+
+@persistent
+def reset_dxf_cache_on_load(dummy):
+    """Po otwarciu innego pliku cache zostanie wczytany od nowa przy pierwszym użyciu"""
+    global _dxf_memory_cache, _dxf_cache_pending, _dxf_cache_dirty
+    _close_dxf_cache_blob()
+    _dxf_memory_cache = {}
+    _dxf_cache_pending = {}
+    _dxf_cache_dirty = False
+    _dxf_cache_touched.clear()
+
+# Właściwości pomijane w hashu RNA (bez wpływu na geometrię)
+RNA_HASH_SKIP = {'rna_type', 'name', 'is_override_data_editable', 'show_expanded', 'is_active'}
+# Węzły i gniazda - dodatkowo układ w edytorze węzłów (u modyfikatorów np. 'width'
+# to szerokość fazy, więc te nazwy pomijane są tylko w grupach węzłów)
+NODE_HASH_SKIP = RNA_HASH_SKIP | {'location', 'width', 'height', 'dimensions', 'select', 'hide',
+                                  'label', 'color', 'use_custom_color', 'show_options',
+                                  'show_preview'}
+
+def _hash_rna_values(h, owner, depth=0, visited=None, skip=RNA_HASH_SKIP):
+    """Dokłada do hasha wartości właściwości RNA (modyfikatory, ustawienia fontu)"""
+    visited = set() if visited is None else visited
+    for prop in owner.bl_rna.properties:
+        ident = prop.identifier
+        if ident in skip:
+            continue
+        try:
+            value = getattr(owner, ident)
+        except AttributeError:
+            continue
+        if prop.type == 'POINTER':
+            if value is None:
+                h.update(b'-')
+            elif isinstance(value, bpy.types.ID):
+                # Blok danych wskazany przez modyfikator (boolean, array, node_group...) - z zawartością
+                _hash_id(h, value, visited)
+            elif depth == 0 and hasattr(value, 'bl_rna'):
+                _hash_rna_values(h, value, depth + 1, visited, skip)
+        elif prop.type != 'COLLECTION':
+            if isinstance(value, set):
+                # Enum flag - kolejność zbioru zależy od randomizacji hashy
+                value = sorted(value)
+            elif getattr(prop, 'array_length', 0):
+                value = tuple(value)
+            h.update(f"{ident}={value!r};".encode())
+
+def _hash_mesh_data(h, mesh):
+    """Dokłada do hasha surowe dane mesh (foreach_get - bez ewaluacji depsgraph)"""
+    for collection, attr, typecode, width in ((mesh.vertices, 'co', 'f', 3),
+                                              (mesh.edges, 'vertices', 'i', 2),
+                                              (mesh.polygons, 'loop_total', 'i', 1),
+                                              (mesh.loops, 'vertex_index', 'i', 1)):
+        buf = array(typecode, bytes(4 * width * len(collection)))
+        collection.foreach_get(attr, buf)
+        h.update(buf)
+
+def _hash_node_tree(h, tree, visited):
+    """Dokłada do hasha zawartość grupy węzłów: węzły, wartości wejść i połączenia"""
+    for node in tree.nodes:
+        h.update(f"{node.bl_idname}:{node.name}|".encode())
+        _hash_rna_values(h, node, 1, visited, NODE_HASH_SKIP)
+        for socket in node.inputs:
+            h.update(f"{socket.identifier}:{socket.is_linked}|".encode())
+            if hasattr(socket, 'default_value'):
+                _hash_rna_values(h, socket, 1, visited, NODE_HASH_SKIP)
+    for link in tree.links:
+        h.update(f"{link.from_node.name}.{link.from_socket.identifier}>"
+                 f"{link.to_node.name}.{link.to_socket.identifier}:{link.is_muted}|".encode())
+
+def _hash_object(h, obj, visited):
+    """Dokłada do hasha obiekt: transformację, modyfikatory (z celami) i dane"""
+    h.update(f"{obj.name}|{obj.type}|".encode())
+    h.update(repr([tuple(row) for row in obj.matrix_world]).encode())
+    
+    # Modyfikatory zmieniają ewaluowaną geometrię - typ i wszystkie parametry
+    for mod in obj.modifiers:
+        h.update(f"{mod.type}:{mod.show_viewport}|".encode())
+        _hash_rna_values(h, mod, 0, visited)
+        # Wejścia Geometry Nodes są ID properties modyfikatora
+        for key in mod.keys():
+            value = mod[key]
+            if isinstance(value, bpy.types.ID):
+                _hash_id(h, value, visited)
+            else:
+                h.update(f"{key}={getattr(value, 'to_list', lambda: value)()!r};".encode())
+    
+    if obj.type == 'MESH':
+        _hash_mesh_data(h, obj.data)
+    elif obj.type == 'FONT':
+        # Dla fontów - treść i wszystkie ustawienia krzywej tekstu (rozmiar, fonty, wyrównanie...)
+        h.update(obj.data.body.encode())
+        _hash_rna_values(h, obj.data, 0, visited)
+    elif obj.data is not None:
+        _hash_id(h, obj.data, visited)
+
+def _hash_id(h, value, visited):
+    """Dokłada do hasha blok danych ID razem z zawartością (z ochroną przed cyklami)"""
+    h.update(f"{type(value).__name__}:{value.name_full}|".encode())
+    pointer = value.as_pointer()
+    if pointer in visited:
+        return
+    visited.add(pointer)
+    if isinstance(value, bpy.types.Object):
+        _hash_object(h, value, visited)
+    elif isinstance(value, bpy.types.NodeTree):
+        _hash_node_tree(h, value, visited)
+    elif isinstance(value, bpy.types.Collection):
+        for ob in value.all_objects:
+            _hash_id(h, ob, visited)
+    elif isinstance(value, bpy.types.Mesh):
+        _hash_mesh_data(h, value)
+    elif isinstance(value, bpy.types.Curve):
+        _hash_rna_values(h, value, 1, visited)
+
+def calculate_object_fingerprint(obj):
+    """Tani fingerprint obiektu: transformacja + hash danych + ustawienia DXF (bez ewaluacji).
+    
+    Obiekty, grupy węzłów i kolekcje wskazane przez modyfikatory wchodzą do hasha
+    z zawartością, więc zmiana np. cuttera booleana unieważnia fingerprint.
+    """
+    if obj.type not in ['MESH', 'FONT']:
+        return None
     
+    try:
+        h = hashlib.md5()
+        h.update(f"{DXF_CACHE_VERSION}|".encode())
+        
+        # DXF settings z Custom Properties
+        h.update(repr((
+            obj.get("miix_dxf_layer", ""),
+            obj.get("miix_dxf_boundary_edges", True),
+            obj.get("miix_dxf_internal_edges", False),
+            obj.get("miix_dxf_hatches", True),
+        )).encode())
+        
+        _hash_object(h, obj, {obj.as_pointer()})
+        return h.hexdigest()
+        
+    except Exception as e:
+        debug_log(f"Błąd obliczania fingerprint dla {obj.name}: {e}", level='ERROR')
+        return None
+
+def pack_dxf_record(record):
+    """Spłaszcza rekord 2D eksportu (hatche w światowym XY + odcinki) do tablic cache"""
+    points = []
+    loops = []
+    regions = []
+    islands = []
+    for island in record['hatches']:
+        islands.append(len(island))
+        for outer, holes in island:
+            regions.append(1 + len(holes))
+            for loop in (outer, *holes):
+                loops.append(len(loop))
+                points.extend(loop)
+    return {
+        'hatch_points': points,
+        'hatch_loops': loops,
+        'hatch_regions': regions,
+        'hatch_islands': islands,
+        'lines': list(record['lines']),
+        'solid': record['solid'],
+    }
+
+def pack_dxf_entities(entities):
+    """Spłaszcza listę encji (rodzaj, dxfattribs, opcje, pętle punktów) do tablic cache"""
+    ops = []
+    loops = []
+    points = []
+    for kind, dxfattribs, options, entity_loops in entities:
+        ops.append([kind, dxfattribs, options, len(entity_loops)])
+        for loop in entity_loops:
+            loops.append(len(loop))
+            points.extend(loop)
+    return {'entities': ops, 'entity_loops': loops, 'entity_points': points}
+
+def unpack_dxf_entities(geometry):
+    """Odtwarza listę encji zapisaną przez pack_dxf_entities"""
+    points = geometry.get('entity_points', [])
+    loop_sizes = iter(geometry.get('entity_loops', []))
+    pos = 0
+    entities = []
+    for kind, dxfattribs, options, loop_count in geometry.get('entities', []):
+        loops = []
+        for _ in range(loop_count):
+            n = next(loop_sizes)
+            loops.append(points[pos:pos + n])
+            pos += n
+        entities.append((kind, dxfattribs, options, loops))
+    return entities
+
+def unpack_dxf_record(geometry):
+    """Odtwarza rekord 2D eksportu z geometrii zapisanej przez pack_dxf_record"""
+    points = geometry.get('hatch_points', [])
+    loop_sizes = iter(geometry.get('hatch_loops', []))
+    region_sizes = iter(geometry.get('hatch_regions', []))
+    pos = 0
+    hatches = []
+    for region_count in geometry.get('hatch_islands', []):
+        island = []
+        for _ in range(region_count):
+            loops = []
+            for _ in range(next(region_sizes)):
+                n = next(loop_sizes)
+                loops.append(points[pos:pos + n])
+                pos += n
+            island.append((loops[0], loops[1:]))
+        hatches.append(island)
+    return {'hatches': hatches, 'solid': geometry.get('solid', False),
+            'lines': geometry.get('lines', [])}
+
+def _cache_lookup(obj_name, fingerprint):
+    """Geometria wpisu cache (None gdy brak lub fingerprint się zmienił)"""
     if not _dxf_memory_cache:
         load_dxf_cache()
     
-    obj_name = obj.name
+    _dxf_cache_touched.add(obj_name)
     if obj_name not in _dxf_memory_cache.get('objects', {}):
         return None
     
     cached_obj = _dxf_memory_cache['objects'][obj_name]
-    current_fingerprint = calculate_object_fingerprint(obj)
-    
-    if current_fingerprint != cached_obj.get('fingerprint'):
+    if fingerprint != cached_obj.get('fingerprint'):
         debug_log(f"Cache nieaktualny dla {obj_name} - fingerprint się zmienił")
         return None
     
+    packed = _dxf_cache_pending.get(obj_name)
+    if packed is not None:
+        arrays, meta = packed
+        geometry = dict(meta)
+        for key, (typecode, width, values, lengths) in arrays.items():
+            geometry[key] = _unpack_array(typecode, width, values, lengths)
+    else:
+        if _dxf_cache_blob is None:
+            return None
+        geometry = dict(cached_obj.get('meta', {}))
+        for key, slot in cached_obj.get('arrays', {}).items():
+            typecode, width, offset, count = slot[:4]
+            values = _blob_view(typecode, offset, count)
+            lengths = _blob_view('i', slot[4], slot[5]) if width < 0 else None
+            geometry[key] = _unpack_array(typecode, width, values, lengths)
+    
     debug_log(f"Używam cache dla {obj_name}")
-    return cached_obj.get('cached_geometry')
+    return geometry
 
-def cache_object_geometry(obj, geometry_data):
-    """Zapisuje geometry obiektu do cache"""
-    global _dxf_memory_cache
+def _cache_store(obj_name, fingerprint, geometry_data, **info):
+    """Dodaje wpis do cache w pamięci (zapis na dysk w save_dxf_cache)"""
+    global _dxf_cache_dirty
     
     if not _dxf_memory_cache:
         load_dxf_cache()
     
-    fingerprint = calculate_object_fingerprint(obj)
-    if not fingerprint:
-        return False
-    
-    obj_name = obj.name
     _dxf_memory_cache['objects'][obj_name] = {
         'fingerprint': fingerprint,
         'last_modified': datetime.now().isoformat(),
-        'type': obj.type,
-        'layer_name': obj.get("miix_dxf_layer", ""),
-        'dxf_settings': {
-            'boundary_edges': obj.get("miix_dxf_boundary_edges", True),
-            'internal_edges': obj.get("miix_dxf_internal_edges", False),
-            'hatches': obj.get("miix_dxf_hatches", True),
-        },
-        'cached_geometry': geometry_data
+        **info,
     }
+    _dxf_cache_pending[obj_name] = _pack_geometry(geometry_data)
+    _dxf_cache_touched.add(obj_name)
+    _dxf_cache_dirty = True
+
+def get_cached_geometry(obj, fingerprint=None):
+    """Pobiera cached geometry dla obiektu (None gdy brak lub fingerprint się zmienił)"""
+    return _cache_lookup(obj.name, fingerprint or calculate_object_fingerprint(obj))
+
+def cache_object_geometry(obj, geometry_data, fingerprint=None):
+    """Zapisuje geometry obiektu do cache (w pamięci - zapis na dysk w save_dxf_cache)"""
+    fingerprint = fingerprint or calculate_object_fingerprint(obj)
+    if not fingerprint:
+        return False
     
-    debug_log(f"Cache: zapisano geometrię dla {obj_name} (vertices: {len(geometry_data.get('vertices', []))}, edges: {len(geometry_data.get('edges', []))}, type: {geometry_data.get('export_type', 'unknown')})")
-    
-    # Zapisz cache do Text bloku
-    save_dxf_cache()
+    obj_name = obj.name
+    _cache_store(obj_name, fingerprint, geometry_data,
+                 type=obj.type,
+                 layer_name=obj.get("miix_dxf_layer", ""),
+                 dxf_settings={
+                     'boundary_edges': obj.get("miix_dxf_boundary_edges", True),
+                     'internal_edges': obj.get("miix_dxf_internal_edges", False),
+                     'hatches': obj.get("miix_dxf_hatches", True),
+                 })
+    
+    debug_log(f"Cache: zapisano geometrię dla {obj_name} (odcinki: {len(geometry_data.get('lines', [])) // 4}, hatche: {len(geometry_data.get('hatch_islands', []))}, type: {geometry_data.get('export_type', 'unknown')})")
     return True
 
+def get_cached_entities(key, fingerprint):
+    """Lista encji 2D zapisana dla celu eksportu (kamera|obiekt) lub None"""
+    geometry = _cache_lookup(key, fingerprint)
+    return unpack_dxf_entities(geometry) if geometry is not None else None
+
+def cache_dxf_entities(key, fingerprint, entities):
+    """Zapisuje listę encji 2D wyemitowanych dla celu eksportu (kamera|obiekt)"""
+    _cache_store(key, fingerprint, pack_dxf_entities(entities), type='ENTITIES')
+
 def invalidate_object_cache(obj_name):
     """Usuwa obiekt z cache (np. gdy został zmodyfikowany)"""
-    global _dxf_memory_cache
+    global _dxf_cache_dirty
     
     if not _dxf_memory_cache:
         return
     
     if obj_name in _dxf_memory_cache.get('objects', {}):
         del _dxf_memory_cache['objects'][obj_name]
+        _dxf_cache_pending.pop(obj_name, None)
+        _dxf_cache_dirty = True
         debug_log(f"Cache invalidated dla {obj_name}")
 
 def get_dxf_cache_statistics():
     """Zwraca statystyki cache"""
-    global _dxf_memory_cache
-    
     if not _dxf_memory_cache:
         load_dxf_cache()
     
     total_objects = len(_dxf_memory_cache.get('objects', {}))
     cache_size_kb = 0
-    cache_location = "Brak"
-    
-    try:
-        cache_text = get_cache_text_block()
-        if cache_text and cache_text.as_string():
-            cache_size_kb = len(cache_text.as_string().encode('utf-8')) / 1024
-            cache_location = f"Text blok: {cache_text.name}"
-    except:
-        pass
+    cache_location = "Tylko w pamięci (niezapisany plik .blend)"
+    cache_file = None
+    
+    base = get_cache_file_path()
+    if base:
+        cache_file = base + DXF_CACHE_DATA_EXT
+        cache_location = os.path.dirname(cache_file)
+        for ext in (DXF_CACHE_INDEX_EXT, DXF_CACHE_DATA_EXT):
+            try:
+                cache_size_kb += os.path.getsize(base + ext) / 1024
+            except OSError:
+                pass
     
     return {
         'total_objects': total_objects,
         'cache_size_kb': cache_size_kb,
         'cache_location': cache_location,
-        'cache_file': None  # Zachowana dla kompatybilności
+        'cache_file': cache_file
     }
 
 # --- KONIEC SYSTEMU CACHE DXF -----------------------------------------------
@@ -603,6 +944,14 @@ def set_object_hatches(obj, value):
     """Ustawia ustawienie kreskowania w Custom Properties"""
     obj["miix_dxf_hatches"] = value
 
+def get_camera_hidden_lines(cam):
+    """Pobiera ustawienie usuwania krawędzi zasłoniętych kamery z Custom Properties"""
+    return cam.get("miix_hidden_lines", False)
+
+def set_camera_hidden_lines(cam, value):
+    """Ustawia ustawienie usuwania krawędzi zasłoniętych kamery w Custom Properties"""
+    cam["miix_hidden_lines"] = value
+
 def get_object_cache_key(obj, operation_type, origin=None, normal=None, cam_params=None):
     """Tworzy unikalny klucz cache dla obiektu i operacji"""
     try:
@@ -753,59 +1102,64 @@ MATERIAL_TYPES = [
     "Przekrój", "Silikat", "Styrodur", "Styropian", "Wełna", "Żelbet"
 ]
 
+# Typy materiałów rozpoznawane po specjalnych znacznikach w nazwie (pozostałe po samej nazwie typu)
+SPECIAL_MATERIAL_TYPES = {
+    "Powierzchnie - tekst": ("Powierzchnia",),
+    "Powierzchnie - brutto": ("Powierzchnia-brutto",),
+    "Powierzchnie - netto": ("Powierzchnia-netto",),
+    "Drzwi": ("#Stolarka_drzwi",),
+    "Okna": ("#Stolarka_okno",),
+    "Meble": ("#Meble",),
+    "Oś": ("#Oś", "#Os"),
+    "Przekrój": ("#Przekrój", "#Przekroj"),
+}
+
+# Indeks nazw obiektów per typ materiału, przebudowywany gdy zmieni się lista obiektów
+_material_type_index = {"names": None, "index": {}}
+
+@functools.lru_cache(maxsize=8192)
+def _material_types_for_name(name):
+    """Typy materiałów (MATERIAL_TYPES), do których obiekt może należeć wg nazwy"""
+    types = []
+    for material_type in MATERIAL_TYPES:
+        markers = SPECIAL_MATERIAL_TYPES.get(material_type, (material_type,))
+        if any(marker in name for marker in markers):
+            types.append(material_type)
+    return tuple(types)
+
+def _get_material_type_index():
+    """Indeks {typ materiału: [nazwy obiektów]} w kolejności bpy.data.objects"""
+    names = tuple(bpy.data.objects.keys())
+    if names != _material_type_index["names"]:
+        index = {}
+        for name in names:
+            for material_type in _material_types_for_name(name):
+                index.setdefault(material_type, []).append(name)
+        _material_type_index["names"] = names
+        _material_type_index["index"] = index
+    return _material_type_index["index"]
+
 def get_objects_by_material_type(material_type):
     """Zwraca obiekty odpowiadające danemu typowi materiału."""
+    if material_type not in MATERIAL_TYPES:
+        # Typ spoza listy - wszystkie obiekty z tym słowem w nazwie
+        return [obj for obj in bpy.data.objects if material_type in obj.name]
+    
+    candidates = [bpy.data.objects[name] for name in _get_material_type_index().get(material_type, ())]
     objects = []
     
     if material_type == "Powierzchnie - tekst":
         # Obiekty Font z "Powierzchnia" w nazwie + ich dzieci
-        for obj in bpy.data.objects:
-            if obj.type == 'FONT' and "Powierzchnia" in obj.name:
+        for obj in candidates:
+            if obj.type == 'FONT':
                 objects.append(obj)
-                # Dodaj dzieci
                 objects.extend(obj.children)
-    elif material_type == "Powierzchnie - brutto":
-        # Obiekty MESH z "Powierzchnia" w nazwie, ale NIE dzieci obiektów Font
-        for obj in bpy.data.objects:
-            if (obj.type == 'MESH' and "Powierzchnia-brutto" in obj.name and 
-                not (obj.parent and obj.parent.type == 'FONT')):
-                objects.append(obj)
-    elif material_type == "Powierzchnie - netto":
-        # Obiekty MESH z "Powierzchnia" w nazwie, ale NIE dzieci obiektów Font
-        for obj in bpy.data.objects:
-            if (obj.type == 'MESH' and "Powierzchnia-netto" in obj.name and 
-                not (obj.parent and obj.parent.type == 'FONT')):
-                objects.append(obj)
-    elif material_type == "Drzwi":
-        # Szukaj obiektów z nazwą "#Stolarka_drzwi"
-        for obj in bpy.data.objects:
-            if "#Stolarka_drzwi" in obj.name:
-                objects.append(obj)
-    elif material_type == "Okna":
-        # Szukaj obiektów z nazwą "#Stolarka_okno"
-        for obj in bpy.data.objects:
-            if "#Stolarka_okno" in obj.name:
-                objects.append(obj)
-    elif material_type == "Meble":
-        # Szukaj obiektów z nazwą "#Meble"
-        for obj in bpy.data.objects:
-            if "#Meble" in obj.name:
-                objects.append(obj)
-    elif material_type == "Oś":
-        # Szukaj obiektów z nazwą "#Oś"
-        for obj in bpy.data.objects:
-            if "#Oś" in obj.name or "#Os" in obj.name:
-                objects.append(obj)
-    elif material_type == "Przekrój":
-        # Szukaj obiektów z nazwą "#Przekrój"
-        for obj in bpy.data.objects:
-            if "#Przekrój" in obj.name or "#Przekroj" in obj.name:
-                objects.append(obj)
+    elif material_type in ("Powierzchnie - brutto", "Powierzchnie - netto"):
+        # Obiekty MESH, ale NIE dzieci obiektów Font
+        objects = [obj for obj in candidates
+                   if obj.type == 'MESH' and not (obj.parent and obj.parent.type == 'FONT')]
     else:
-        # Standardowe materiały - wszystkie obiekty z tym słowem w nazwie
-        for obj in bpy.data.objects:
-            if material_type in obj.name:
-                objects.append(obj)
+        objects = candidates
     
     return objects
 
@@ -1068,6 +1422,18 @@ LINE_SCALE = 1.0
 HATCH_LW   = 9
 HATCH_CLR  = 7   # ⟵ zmieniony z 1
 MERGE_TOL  = 1e-6  # tolerancja łączenia końców linii
+PLINEGEN_FLAG = 128  # LWPOLYLINE: ciągły wzór rodzaju linii przez wierzchołki
+HATCH_UNION_TOL = 1e-4  # tolerancja sumowania obrysów hatchy (jednostki DXF)
+SIMPLIFY_DUP_TOL = 1e-4  # punkty bliżej niż to (jednostki DXF) są scalane
+SIMPLIFY_TOL_M = 0.001   # tolerancja Douglas-Peucker w metrach modelu (× SCALE_DXF)
+DEDUP_TOL = 1e-3         # odległość odcinków uznanych za pokrywające się (jednostki DXF)
+DEDUP_ANG_TOL = 1e-3     # tolerancja kąta odcinków współliniowych (rad)
+HIDDEN_LINE_MAX_RES = 2048  # dłuższy bok bufora głębokości (px)
+HIDDEN_LINE_BIAS = 0.01     # bias głębokości krawędzi zasłoniętych (m)
+HIDDEN_LINE_REL_BIAS = 2e-3  # bias względny (× głębokość)
+
+# Statystyki ostatniego eksportu rzutu (dla raportu operatora)
+DXF_EXPORT_STATS = {}
 
 LAYER_CFG = {
     "orth": {
@@ -1292,126 +1658,132 @@ def _should_export_edge(e, obj_n, mesh):
     angle_deg = math.degrees(math.acos(max(min(cos_angle, 1.0), -1.0)))
     return angle_deg > 20
 
+POLISH_CHARS_TABLE = str.maketrans("ąćęłńóśźżĄĆĘŁŃÓŚŹŻ", "acelnoszzACELNOSZZ")
+
 def normalize_polish_chars(text):
     """Normalizuje polskie znaki do wersji bez diakrytyków."""
-    replacements = {
-        'ą': 'a', 'ć': 'c', 'ę': 'e', 'ł': 'l', 'ń': 'n', 'ó': 'o', 'ś': 's', 'ź': 'z', 'ż': 'z',
-        'Ą': 'A', 'Ć': 'C', 'Ę': 'E', 'Ł': 'L', 'Ń': 'N', 'Ó': 'O', 'Ś': 'S', 'Ź': 'Z', 'Ż': 'Z'
-    }
-    for polish, latin in replacements.items():
-        text = text.replace(polish, latin)
-    return text
+    return text.translate(POLISH_CHARS_TABLE)
 
 def rgb_to_truecolor_int(rgb):
     """Zamienia tuple RGB na int dla DXF (group code 420)."""
     r, g, b = rgb
     return (r << 16) + (g << 8) + b
 
+def _compile_substring_rules(rules):
+    """Kompiluje tabelę reguł [(podciągi, typ[, wykluczenia]), ...] do jednego wyrażenia.
+    
+    Zwraca funkcję tekst → typ pierwszej (wg kolejności w tabeli) pasującej reguły
+    lub None. Reguła nie pasuje, gdy tekst zawiera któryś z jej podciągów wykluczających.
+    Podciągi różnych reguł nie mogą być swoimi prefiksami.
+    """
+    rank = {}
+    for index, (patterns, *_) in enumerate(rules):
+        for pattern in patterns:
+            rank.setdefault(pattern, index)
+    # Lookahead znajduje podciągi na każdej pozycji, także nakładające się
+    regex = re.compile("(?=(%s))" % "|".join(re.escape(p) for p in rank))
+    
+    def match(text):
+        for index in sorted({rank[token] for token in regex.findall(text)}):
+            _, value, *excluded = rules[index]
+            if not any(x in text for x in (excluded[0] if excluded else ())):
+                return value
+        return None
+    return match
+
+_match_obszar_collection = _compile_substring_rules([
+    (("działki", "dzialki"), "dzialki"),
+    (("-linie_zabudowy",), "linie_zabudowy"),
+    (("-granice",), "granice"),
+    (("-mury",), "mury"),
+    (("-ogrodzenia",), "ogrodzenia"),
+    (("-wiaty",), "wiaty"),
+    (("-drogi",), "drogi"),
+    (("-chodniki",), "chodniki"),
+    (("-podjazdy",), "podjazdy"),
+    (("-parkingi",), "parkingi"),
+    (("-tarasy",), "tarasy"),
+    (("-ogrodki",), "ogrodki"),
+    (("-skarpy",), "skarpy"),
+    (("-zieleń", "-zielen"), "zieleń"),
+    (("-opaski",), "opaski"),
+    (("-place_zabaw",), "place_zabaw"),
+    (("-wody",), "wody"),
+    (("-budynki",), "budynki"),
+])
+
+_match_obszar_object = _compile_substring_rules([
+    (("dach",), "dachy"),
+    (("klatki_schodowe", "klatka_schodowa"), "klatki_schodowe"),
+    (("parter",), "parter"),
+])
+
+_match_uzbrojenie_object = _compile_substring_rules([
+    (("#instalacje",), "instalacje"),
+    (("#sieci",), "sieci"),
+    (("#przyłącza", "#przylacza"), "przylacza"),
+])
+
+_match_uzbrojenie_medium = _compile_substring_rules([
+    (("woda",), "w", ("kanalizacja",)),
+    (("kanalizacja_sanitarna", "kanalizacja sanitarna"), "ks"),
+    (("kanalizacja_deszczowa", "kanalizacja deszczowa"), "kd"),
+    (("ciepło", "cieplo"), "co"),
+    (("gaz",), "gaz"),
+    (("elektryka", "energia"), "en"),
+    (("teletechnika",), "tt"),
+])
+
+_match_special_opis_name = _compile_substring_rules([
+    (("#opis-poziom",), "opis_poziom"),
+    (("#opis-spadek",), "opis_spadek"),
+])
+
+_match_special_opis_collection = _compile_substring_rules([
+    (("opis-uzbrojenie-kanalizacja_deszczowa",), "opis_uzbrojenie_kd"),
+    (("opis-deszcz",), "opis_deszcz"),
+    (("opis-przekroje",), "opis_przekroje"),
+])
+
+KONDYGNACJA_RE = re.compile(r'kondygnacja\.?(\d+)')
+
+@functools.lru_cache(maxsize=1024)
 def get_obszar_type_from_collection(coll_name):
-    name = coll_name.lower()
-    if "działki" in name or "dzialki" in name:
-        return "dzialki"
-    if "-linie_zabudowy" in name:
-        return "linie_zabudowy"
-    if "-granice" in name:
-        return "granice"
-    if "-mury" in name:
-        return "mury"
-    if "-ogrodzenia" in name:
-        return "ogrodzenia"
-    if "-wiaty" in name:
-        return "wiaty"
-    if "-drogi" in name:
-        return "drogi"
-    if "-chodniki" in name:
-        return "chodniki"
-    if "-podjazdy" in name:
-        return "podjazdy"
-    if "-parkingi" in name:
-        return "parkingi"
-    if "-tarasy" in name:
-        return "tarasy"
-    if "-ogrodki" in name:
-        return "ogrodki"
-    if "-skarpy" in name:
-        return "skarpy"
-    if "-zieleń" in name or "-zielen" in name:
-        return "zieleń"
-    if "-opaski" in name:
-        return "opaski"
-    if "-place_zabaw" in name:
-        return "place_zabaw"
-    if "-wody" in name:
-        return "wody"
-    if "-budynki" in name:
-        return "budynki"
-    return None
+    return _match_obszar_collection(coll_name.lower())
 
+@functools.lru_cache(maxsize=4096)
 def get_obszar_type_from_object_name(obj_name):
     """Rozpoznaje typ obszaru na podstawie nazwy obiektu."""
     name = obj_name.lower()
-    # Kondygnacje
-    if "kondygnacja" in name and any(c.isdigit() for c in name):
-        # Sprawdź czy to kondygnacja wyższa niż parter (2, 3, 4...)
-        import re
-        match = re.search(r'kondygnacja\.?(\d+)', name)
-        if match:
-            level = int(match.group(1))
-            if level == 1:
-                return "parter"
-            elif level >= 2:
-                return "wyzsze_kondygnacje"
-    # Dachy
-    if "dach" in name:
-        return "dachy"
-    # Klatki schodowe
-    if "klatki_schodowe" in name or "klatka_schodowa" in name:
-        return "klatki_schodowe"    # Parter
-    if "parter" in name:
-        return "parter"
-    return None
+    # Kondygnacje: 1 - parter, 2, 3, 4... - wyższe kondygnacje
+    match = KONDYGNACJA_RE.search(name)
+    if match:
+        level = int(match.group(1))
+        if level == 1:
+            return "parter"
+        elif level >= 2:
+            return "wyzsze_kondygnacje"
+    return _match_obszar_object(name)
+
+@functools.lru_cache(maxsize=1024)
+def _uzbrojenie_collection_info(coll_name):
+    """(medium, czy kolekcja Opis) dla nazwy kolekcji"""
+    name = coll_name.lower()
+    return _match_uzbrojenie_medium(name), "opis" in name
 
-def get_uzbrojenie_type(obj_name, collections, for_edges=False):
-    """Rozpoznaje typ uzbrojenia na podstawie nazwy obiektu i kolekcji."""
-    name = obj_name.lower()
-    
-    # Określ typ obiektu
-    obj_type = None
-    if "#instalacje" in name:
-        obj_type = "instalacje"
-    elif "#sieci" in name:
-        obj_type = "sieci"
-    elif "#przyłącza" in name or "#przylacza" in name:
-        obj_type = "przylacza"
-    
+@functools.lru_cache(maxsize=4096)
+def _uzbrojenie_type(obj_name, coll_names, for_edges):
+    obj_type = _match_uzbrojenie_object(obj_name.lower())
     if not obj_type:
         return None
     
-    # Określ medium na podstawie kolekcji
+    # Medium z ostatniej pasującej kolekcji, Opis z dowolnej
     medium = None
     is_opis = False
-    
-    for coll in collections:
-        coll_name = coll.name.lower()
-        # Sprawdź czy to kolekcja Opis
-        if "opis" in coll_name:
-            is_opis = True
-        
-        # Sprawdź medium
-        if "woda" in coll_name and "kanalizacja" not in coll_name:
-            medium = "w"
-        elif "kanalizacja_sanitarna" in coll_name or "kanalizacja sanitarna" in coll_name:
-            medium = "ks"
-        elif "kanalizacja_deszczowa" in coll_name or "kanalizacja deszczowa" in coll_name:
-            medium = "kd"
-        elif "ciepło" in coll_name or "cieplo" in coll_name:
-            medium = "co"
-        elif "gaz" in coll_name:
-            medium = "gaz"
-        elif "elektryka" in coll_name or "energia" in coll_name:
-            medium = "en"
-        elif "teletechnika" in coll_name:
-            medium = "tt"
+    for coll_name in coll_names:
+        coll_medium, coll_opis = _uzbrojenie_collection_info(coll_name)
+        medium = coll_medium or medium
+        is_opis = is_opis or coll_opis
     
     if not medium:
         return None
@@ -1425,37 +1797,33 @@ def get_uzbrojenie_type(obj_name, collections, for_edges=False):
     else:
         return f"{medium}_{obj_type}"
 
-def get_special_opis_type(obj_name, collections):
-    """Rozpoznaje specjalne typy opisów na podstawie nazwy obiektu i kolekcji."""
+def get_uzbrojenie_type(obj_name, collections, for_edges=False):
+    """Rozpoznaje typ uzbrojenia na podstawie nazwy obiektu i kolekcji."""
+    return _uzbrojenie_type(obj_name, tuple(coll.name for coll in collections), for_edges)
+
+@functools.lru_cache(maxsize=4096)
+def _special_opis_type(obj_name, coll_names):
     name = obj_name.lower()
-    
-    # Sprawdź obiekty z "#opis-poziom" w nazwie
-    if "#opis-poziom" in name:
-        return "opis_poziom"
-    
-    # Sprawdź obiekty z "#opis-spadek" w nazwie
-    if "#opis-spadek" in name:
-        return "opis_spadek"
-    
-    # Sprawdź obiekty "etykieta" w kolekcji "Opis-Ogólne"
-    if "etykieta" in name:
-        for coll in collections:
-            if "opis-ogólne" in coll.name.lower() or "opis-ogolne" in coll.name.lower():
-                return "opis_ogolne"
-    
-    # Sprawdź kolekcje dla innych opisów
-    for coll in collections:
-        coll_name = coll.name.lower()
-        if "opis-uzbrojenie-kanalizacja_deszczowa" in coll_name:
-            return "opis_uzbrojenie_kd"
-        elif "opis-deszcz" in coll_name:
-            return "opis_deszcz"
-        elif "opis-przekroje" in coll_name:
-            # Rozróżnij między mesh a font dla różnych grubości
-            return "opis_przekroje"
-    
+    opis_type = _match_special_opis_name(name)
+    if opis_type:
+        return opis_type
+    
+    lowered = [coll_name.lower() for coll_name in coll_names]
+    # Obiekty "etykieta" w kolekcji "Opis-Ogólne"
+    if "etykieta" in name and any("opis-ogólne" in c or "opis-ogolne" in c for c in lowered):
+        return "opis_ogolne"
+    
+    # Pierwsza kolekcja z innym opisem
+    for coll_name in lowered:
+        opis_type = _match_special_opis_collection(coll_name)
+        if opis_type:
+            return opis_type
     return None
 
+def get_special_opis_type(obj_name, collections):
+    """Rozpoznaje specjalne typy opisów na podstawie nazwy obiektu i kolekcji."""
+    return _special_opis_type(obj_name, tuple(coll.name for coll in collections))
+
 def _add_obszar_layer(doc, name, color, weight, linetype=None):
     if name in doc.layers:
         return
@@ -1473,6 +1841,80 @@ def _add_obszar_layer(doc, name, color, weight, linetype=None):
             **({"linetype": linetype} if linetype else {})
         })
 
+def _resolve_layer_color(color_type, index, rgb, proneko=None):
+    """Zwraca (indeks ACI, RGB 0-255 lub None) dla ustawień koloru warstwy."""
+    if color_type == 'RGB':
+        return 7, tuple(int(c * 255) for c in rgb)
+    if color_type == 'PRONEKO':
+        return 7, tuple(int(c * 255) for c in get_proneko_color_rgb(proneko))
+    return index, None
+
+class ObszarLayerStyle:
+    """Ustawienia warstwy obiektu obszaru rozwiązane raz na eksport.
+    
+    line_attribs to gotowe dxfattribs dla linii; kolory zgodne z kolorem
+    warstwy w dokumencie są pomijane (BYLAYER).
+    """
+    __slots__ = ("name", "line_attribs", "hatch_color", "hatch_true_color",
+                 "hatch_pattern", "hatch_scale", "hatch_rotation")
+    
+    def __init__(self, doc, name, line_color, hatch_color,
+                 hatch_pattern="SOLID", hatch_scale=1.0, hatch_rotation=0.0):
+        self.name = name
+        self.hatch_pattern = hatch_pattern
+        self.hatch_scale = hatch_scale
+        self.hatch_rotation = hatch_rotation
+        
+        layer_color = (None, None)
+        if name in doc.layers:
+            layer = doc.layers.get(name)
+            if layer.dxf.hasattr("true_color"):
+                layer_color = (None, layer.dxf.true_color)
+            else:
+                layer_color = (layer.dxf.color, None)
+        
+        def resolve(color):
+            index, rgb = color
+            true_color = rgb_to_truecolor_int(rgb) if rgb is not None else None
+            if true_color is not None:
+                return (None, None) if true_color == layer_color[1] else (index, true_color)
+            if layer_color[1] is None and index == layer_color[0]:
+                return (None, None)
+            return (index, None)
+        
+        self.line_attribs = {"layer": name}
+        index, true_color = resolve(line_color)
+        if true_color is not None:
+            self.line_attribs["true_color"] = true_color
+        elif index is not None:
+            self.line_attribs["color"] = index
+        
+        index, self.hatch_true_color = resolve(hatch_color)
+        self.hatch_color = 256 if index is None else index
+    
+    @classmethod
+    def from_scene_layer(cls, doc, layer):
+        return cls(doc, layer.name,
+                   _resolve_layer_color(layer.line_color_type, layer.line_color_index,
+                                        layer.line_color_rgb, layer.line_color_proneko),
+                   _resolve_layer_color(layer.hatch_color_type, layer.hatch_color_index,
+                                        layer.hatch_color_rgb, layer.hatch_color_proneko),
+                   layer.hatch_pattern, layer.hatch_scale, layer.hatch_rotation)
+    
+    @classmethod
+    def from_config(cls, doc, cfg):
+        color = cfg.get("color", 7)
+        color = (7, color) if isinstance(color, tuple) else (color, None)
+        return cls(doc, cfg.get("layer", "0"), color, color,
+                   cfg.get("hatch_pattern", "SOLID"), cfg.get("hatch_scale", 1.0),
+                   cfg.get("hatch_rotation", 0.0))
+    
+    def apply_hatch_color(self, hatch):
+        """Ustawia kolor hatcha (po set_*_fill, które nadpisują kolor)."""
+        hatch.dxf.color = self.hatch_color
+        if self.hatch_true_color is not None:
+            hatch.dxf.true_color = self.hatch_true_color
+
 # -----------------------------------------------------------------------------
 # Parser nazwy ➜ warstwa -------------------------------------------------------
 # -----------------------------------------------------------------------------
@@ -1481,95 +1923,55 @@ CATEGORY_RE = re.compile(r"#?(orth|elewacja|pir|porotherm|silikat|styropian|styr
 KIND_RE     = re.compile(r"_(przekroj|przekrój|widok|nad)$", re.I)
 OPIS_RE     = re.compile(r"#?opis-konstrukcja", re.I)
 
+# Klasyfikator nazw warstw: kategorie (#Oś, #Przekrój) mają pierwszeństwo przed
+# sufiksem rodzaju, materiały rozstrzyga kolejność w LAYER_MATERIALS
+LAYER_CATEGORIES = ("os", "przekroj")
+LAYER_MATERIALS = ("zelbet", "styropian", "styrodur", "welna", "porotherm", "silikat",
+                   "orth", "beton", "posadzka", "elewacja", "drewno", "pir")
+LAYER_TOKEN_RE = re.compile(r"#(%s)" % "|".join(LAYER_CATEGORIES + LAYER_MATERIALS))
+LAYER_KIND_RE = re.compile(r"_(przekroj|widok|nad|special)(?:\.\d+)?$")
+
+@functools.lru_cache(maxsize=4096)
+def classify_layer_name(name):
+    """Klasyfikuje nazwę obiektu: (kategoria lub materiał, rodzaj) albo (None, None)"""
+    stripped = normalize_polish_chars(name.lower())
+    tokens = LAYER_TOKEN_RE.findall(stripped)
+    
+    # Obiekt kategorii (os, przekroj) - niezależnie od sufiksu konfiguracja 'przekroj'
+    for token in tokens:
+        if token in LAYER_CATEGORIES:
+            return token, "przekroj"
+    
+    # Obiekt z sufiksem _przekroj, _widok, _nad lub _special (z opcjonalnymi numerami)
+    kind_match = LAYER_KIND_RE.search(stripped)
+    if not kind_match:
+        return None, None
+    material = min(tokens, key=LAYER_MATERIALS.index) if tokens else None
+    return material, kind_match.group(1)
+
+def _layer_config(category, kind):
+    """Konfiguracja LAYER_CFG dla klasyfikacji (None dla nazw bez warstwy)"""
+    if kind is None:
+        return None
+    return LAYER_CFG.get(category, {}).get(kind) or {"layer": "0"}
+
 def parse_layer_from_name(name: str):
     """Parsuje nazwę obiektu i zwraca konfigurację warstwy."""
+    return _layer_config(*classify_layer_name(name))
 
-    
-    # Normalizuj polskie znaki
-    stripped = normalize_polish_chars(name.lower())
+def assign_object_layer(ob):
+    """Zapisuje klasyfikację nazwy i warstwę obiektu w Custom Properties"""
+    category, kind = classify_layer_name(ob.name)
+    ob["miix_layer_class"] = {"name": ob.name, "category": category or "", "kind": kind or ""}
+    props = _layer_config(category, kind)
+    ob["miix_layer"] = props["layer"] if props else "0"
 
-    
-    # Sprawdź czy to obiekt kategorii (os, przekroj)
-    category_match = re.search(r'#(os|oś|przekroj|przekrój)', stripped)
-    if category_match:
-        kind = category_match.group(1)
-        if kind in ['os', 'oś']:
-            kind = 'os'
-        elif kind in ['przekroj', 'przekrój']:
-            kind = 'przekroj'
-        # Zwróć konfigurację z LAYER_CFG - dla obiektów bez sufiksu użyj 'przekroj'
-        layer_config = LAYER_CFG.get(kind, {}).get('przekroj')
-        if layer_config:
-            return layer_config
-        else:
-            return {"layer": "0"}
-    
-    # Sprawdź czy to obiekt z sufiksem _przekroj, _widok, _nad lub _special (z opcjonalnymi numerami)
-    kind_match = re.search(r'_(przekroj|przekrój|widok|nad|special)(?:\.\d+)?$', stripped)
-    if kind_match:
-        kind = kind_match.group(1)
-        if kind in ['przekroj', 'przekrój']:
-            kind = 'przekroj'
-        elif kind == 'special':
-            # Dla obiektów _special, sprawdź czy to #Oś czy #Przekrój i użyj odpowiedniej konfiguracji
-            if '#oś' in stripped or '#os' in stripped:
-                kind = 'przekroj'  # Używamy konfiguracji przekroj dla osi (wszystkie suffixe mają tę samą warstwę)
-                category_kind = 'os'
-                layer_config = LAYER_CFG.get(category_kind, {}).get(kind)
-                if layer_config:
-                    return layer_config
-            elif '#przekroj' in stripped or '#przekrój' in stripped:
-                kind = 'przekroj'  # Używamy konfiguracji przekroj dla przekrojów
-                category_kind = 'przekroj'
-                layer_config = LAYER_CFG.get(category_kind, {}).get(kind)
-                if layer_config:
-                    return layer_config
-        
-        # Najpierw sprawdź czy to obiekt kategorii (os, przekroj) z suffixem
-        category_match = re.search(r'#(os|oś|przekroj|przekrój)', stripped)
-        if category_match:
-            category_kind = category_match.group(1)
-            if category_kind in ['os', 'oś']:
-                category_kind = 'os'
-            elif category_kind in ['przekroj', 'przekrój']:
-                category_kind = 'przekroj'
-            # Zwróć konfigurację z LAYER_CFG dla kategorii (wszystkie suffixe mają tę samą warstwę)
-            layer_config = LAYER_CFG.get(category_kind, {}).get(kind)
-            if layer_config:
-                return layer_config
-        
-        # Jeśli nie kategoria, sprawdź typ materiału z nazwy
-        material_type = None
-        material_patterns = {
-            'zelbet': r'#(żelbet|zelbet)',
-            'styropian': r'#styropian',
-            'styrodur': r'#styrodur', 
-            'welna': r'#(wełna|welna)',
-            'porotherm': r'#porotherm',
-            'silikat': r'#silikat',
-            'orth': r'#orth',
-            'beton': r'#beton',
-            'posadzka': r'#posadzka',
-            'elewacja': r'#elewacja',
-            'drewno': r'#drewno',
-            'pir': r'#pir'
-        }
-        
-        for mat_type, pattern in material_patterns.items():
-            if re.search(pattern, stripped):
-                material_type = mat_type
-                break
-        
-        if material_type:
-            # Pobierz konfigurację warstwy
-            layer_config = LAYER_CFG.get(material_type, {}).get(kind)
-            if layer_config:
-                return layer_config
-        
-        # Fallback - zwróć podstawową konfigurację
-        return {"layer": "0"}
-    
-    return None
+def get_object_layer_config(ob):
+    """Konfiguracja warstwy obiektu - z klasyfikacji zapisanej przy tworzeniu, jeśli nazwa się nie zmieniła"""
+    stored = ob.get("miix_layer_class")
+    if stored is not None and stored.get("name") == ob.name:
+        return _layer_config(stored.get("category") or None, stored.get("kind") or None)
+    return parse_layer_from_name(ob.name)
 
 # -----------------------------------------------------------------------------
 # Płaszczyzna przekroju --------------------------------------------------------
@@ -1594,12 +1996,264 @@ def _new_mesh_from_bmesh(bm, name, coll):
     mesh = bpy.data.meshes.new(name)
     bm.to_mesh(mesh); bm.free()
     ob = bpy.data.objects.new(name, mesh)
-    props = parse_layer_from_name(name)
-    ob["miix_layer"] = props["layer"] if props else "0"
+    assign_object_layer(ob)
     coll.objects.link(ob)
     return ob
 
 
+def derived_source_signature(src_obj, cam, fingerprint=None, occluders_key=None, scene=None):
+    """Sygnatura źródła obiektów pochodnych (geometria, transformacja, nazwa, kamera, clip).
+    
+    Obejmuje też projekcję kamery (typ, ogniskowa, sensor, ortho_scale, przesunięcie)
+    i rozdzielczość renderu sceny - od nich zależy bufor głębokości widoku.
+    occluders_key - sygnatura wszystkich przesłaniających obiektów, gdy kamera
+    usuwa krawędzie zasłonięte (widok zależy wtedy od całej sceny).
+    """
+    if fingerprint is None:
+        fingerprint = calculate_object_fingerprint(src_obj)
+    if not fingerprint:
+        return None
+    data = cam.data
+    render = (scene or bpy.context.scene).render
+    return hashlib.md5(repr((
+        fingerprint, [tuple(row) for row in cam.matrix_world],
+        data.clip_start, data.clip_end, occluders_key,
+        data.type, data.lens, data.sensor_width, data.sensor_height, data.sensor_fit,
+        data.ortho_scale, data.shift_x, data.shift_y,
+        render.resolution_x, render.resolution_y, render.resolution_percentage,
+        render.pixel_aspect_x, render.pixel_aspect_y,
+    )).encode()).hexdigest()
+
+def remove_objects_with_data(objects):
+    """Usuwa obiekty razem z meshami, które zostają bez użytkowników"""
+    for ob in objects:
+        mesh = ob.data if ob.type == 'MESH' else None
+        bpy.data.objects.remove(ob, do_unlink=True)
+        if mesh is not None and mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+
+
+# -----------------------------------------------------------------------------
+# Widok – usuwanie krawędzi zasłoniętych (bufor głębokości CPU) ---------------
+
+def _max_filter3(z):
+    """Maksimum z sąsiedztwa 3×3 piksela - krawędzie na sylwetkach zostają widoczne"""
+    out = z.copy()
+    for axis in (0, 1):
+        src = out.copy()
+        lo = [slice(None), slice(None)]
+        hi = [slice(None), slice(None)]
+        lo[axis], hi[axis] = slice(1, None), slice(None, -1)
+        lo, hi = tuple(lo), tuple(hi)
+        np.maximum(out[lo], src[hi], out=out[lo])
+        np.maximum(out[hi], src[lo], out=out[hi])
+    return out
+
+
+class DepthBuffer:
+    """Bufor głębokości widoku kamery liczony na CPU (NumPy) z trójkątów obiektów.
+    
+    Głębokość to odległość wzdłuż osi kamery (jak test zmin/zmax w depth_mesh),
+    geometria przed płaszczyzną cięcia (zmin) nie zasłania. Krawędź jest widoczna,
+    jeśli nie leży za maksimum bufora z sąsiedztwa 3×3 (plus bias).
+    """
+    
+    def __init__(self, ctx, cam, objects, zmin, key=None):
+        frame = cam.data.view_frame(scene=ctx.scene)
+        self.key = key
+        self.zmin = zmin
+        self.ortho = cam.data.type == 'ORTHO'
+        self.dist = -frame[0].z
+        self.min_x, self.max_x = frame[2].x, frame[1].x
+        self.min_y, self.max_y = frame[1].y, frame[0].y
+        span_x, span_y = self.max_x - self.min_x, self.max_y - self.min_y
+        scale = HIDDEN_LINE_MAX_RES / max(span_x, span_y)
+        self.width = max(1, int(math.ceil(span_x * scale)))
+        self.height = max(1, int(math.ceil(span_y * scale)))
+        self.cam_inv = np.array(cam.matrix_world.normalized().inverted(), dtype=np.float64)
+        self.zbuf = np.full((self.height, self.width), np.inf, dtype=np.float64)
+        
+        deps = ctx.evaluated_depsgraph_get()
+        for obj in objects:
+            eval_obj = obj.evaluated_get(deps)
+            try:
+                mesh = eval_obj.to_mesh()
+            except RuntimeError:
+                continue
+            try:
+                if mesh is None:
+                    continue
+                mesh.calc_loop_triangles()
+                n_verts, n_tris = len(mesh.vertices), len(mesh.loop_triangles)
+                if not n_verts or not n_tris:
+                    continue
+                co = np.empty(3 * n_verts, dtype=np.float32)
+                mesh.vertices.foreach_get("co", co)
+                tris = np.empty(3 * n_tris, dtype=np.int32)
+                mesh.loop_triangles.foreach_get("vertices", tris)
+                matrix = np.array(eval_obj.matrix_world, dtype=np.float64)
+                world = co.reshape(-1, 3).astype(np.float64) @ matrix[:3, :3].T + matrix[:3, 3]
+                self._rasterize(world, tris.reshape(-1, 3))
+            finally:
+                eval_obj.to_mesh_clear()
+        
+        self.zmax3 = _max_filter3(self.zbuf)
+    
+    def _project(self, world):
+        """Punkty świata (N×3) → współrzędne pikseli bufora i głębokość"""
+        return self._project_local(world @ self.cam_inv[:3, :3].T + self.cam_inv[:3, 3])
+    
+    def _project_local(self, local):
+        """Punkty w układzie kamery (N×3) → współrzędne pikseli bufora i głębokość"""
+        depth = -local[:, 2]
+        x, y = local[:, 0], local[:, 1]
+        if not self.ortho:
+            with np.errstate(divide='ignore', invalid='ignore'):
+                f = self.dist / depth
+            x, y = x * f, y * f
+        px = (x - self.min_x) * (self.width / (self.max_x - self.min_x))
+        py = (y - self.min_y) * (self.height / (self.max_y - self.min_y))
+        return px, py, depth
+    
+    def _clip_near(self, corners):
+        """Przycina trójkąty (T×3×3, układ kamery) do płaszczyzny bliskiej z = zmin.
+        
+        Trójkąt z jednym wierzchołkiem przed płaszczyzną daje jeden mniejszy trójkąt,
+        z dwoma - czworokąt (dwa trójkąty). Części przed zmin i tak nie zasłaniają.
+        """
+        near = max(self.zmin, 1e-6)
+        depth = -corners[:, :, 2]
+        inside = depth >= near
+        count = inside.sum(1)
+        out = [corners[count == 3]]
+        
+        def rotated(sel, first):
+            # Wierzchołki w kolejności cyklicznej od wskazanego (zachowuje obieg)
+            order = (first[:, None] + np.arange(3)) % 3
+            return (np.take_along_axis(corners[sel], order[:, :, None], 1),
+                    np.take_along_axis(depth[sel], order, 1))
+        
+        def cut(p, q, dp, dq):
+            # Punkt na odcinku p-q o głębokości near
+            return p + (q - p) * ((dp - near) / (dp - dq))[:, None]
+        
+        sel = np.flatnonzero(count == 1)
+        if len(sel):
+            c, d = rotated(sel, np.argmax(inside[sel], 1))
+            a, b1, c1 = c[:, 0], c[:, 1], c[:, 2]
+            out.append(np.stack((a, cut(a, b1, d[:, 0], d[:, 1]),
+                                 cut(a, c1, d[:, 0], d[:, 2])), 1))
+        sel = np.flatnonzero(count == 2)
+        if len(sel):
+            c, d = rotated(sel, np.argmin(inside[sel], 1))
+            o, b1, c1 = c[:, 0], c[:, 1], c[:, 2]
+            pb = cut(b1, o, d[:, 1], d[:, 0])
+            pc = cut(c1, o, d[:, 2], d[:, 0])
+            out.append(np.stack((pb, b1, c1), 1))
+            out.append(np.stack((pb, c1, pc), 1))
+        return np.concatenate(out)
+    
+    def _rasterize(self, world, tris):
+        """Wpisuje trójkąty do bufora (minimum głębokości w środkach pikseli)"""
+        local = world @ self.cam_inv[:3, :3].T + self.cam_inv[:3, 3]
+        corners = local[tris]
+        if not self.ortho:
+            # Perspektywa: wierzchołki za kamerą nie mają rzutu - przycięcie przed rzutowaniem
+            corners = self._clip_near(corners)
+            if not len(corners):
+                return
+        px, py, depth = self._project_local(corners.reshape(-1, 3))
+        x, y, z = px.reshape(-1, 3), py.reshape(-1, 3), depth.reshape(-1, 3)
+        w, h = self.width, self.height
+        area = (x[:, 1] - x[:, 0]) * (y[:, 2] - y[:, 0]) - (x[:, 2] - x[:, 0]) * (y[:, 1] - y[:, 0])
+        keep = ((z.max(1) >= self.zmin) & (np.abs(area) > 1e-12)
+                & (x.max(1) >= 0) & (x.min(1) < w) & (y.max(1) >= 0) & (y.min(1) < h))
+        if not keep.any():
+            return
+        x, y, z, area = x[keep], y[keep], z[keep], area[keep]
+        # Perspektywa: głębokość interpolowana jako 1/z (liniowa w przestrzeni ekranu)
+        attr = z if self.ortho else 1.0 / z
+        
+        x0 = np.clip(np.floor(x.min(1)), 0, w - 1).astype(np.int64)
+        x1 = np.clip(np.floor(x.max(1)), 0, w - 1).astype(np.int64)
+        y0 = np.clip(np.floor(y.min(1)), 0, h - 1).astype(np.int64)
+        y1 = np.clip(np.floor(y.max(1)), 0, h - 1).astype(np.int64)
+        size = np.maximum(x1 - x0, y1 - y0) + 1
+        
+        def fill(sel, sw, sh):
+            oy, ox = np.divmod(np.arange(sw * sh), sw)
+            step = max(1, (1 << 22) // (sw * sh))
+            for c in range(0, len(sel), step):
+                t = sel[c:c + step]
+                gx = x0[t, None] + ox
+                gy = y0[t, None] + oy
+                cx, cy = gx + 0.5, gy + 0.5
+                tx, ty, ta = x[t], y[t], area[t, None]
+                b0 = ((tx[:, 1, None] - cx) * (ty[:, 2, None] - cy)
+                      - (tx[:, 2, None] - cx) * (ty[:, 1, None] - cy)) / ta
+                b1 = ((tx[:, 2, None] - cx) * (ty[:, 0, None] - cy)
+                      - (tx[:, 0, None] - cx) * (ty[:, 2, None] - cy)) / ta
+                b2 = 1.0 - b0 - b1
+                inside = ((b0 >= -1e-9) & (b1 >= -1e-9) & (b2 >= -1e-9)
+                          & (gx <= x1[t, None]) & (gy <= y1[t, None]))
+                val = b0 * attr[t, 0, None] + b1 * attr[t, 1, None] + b2 * attr[t, 2, None]
+                d = val if self.ortho else 1.0 / val
+                inside &= d >= self.zmin
+                np.minimum.at(self.zbuf, (gy[inside], gx[inside]), d[inside])
+        
+        # Małe trójkąty partiami o wspólnym rozmiarze szablonu, duże pojedynczo
+        prev = 0
+        for s in (2, 4, 8, 16, 32, 64):
+            sel = np.flatnonzero((size > prev) & (size <= s))
+            if len(sel):
+                fill(sel, s, s)
+            prev = s
+        for t in np.flatnonzero(size > prev):
+            fill(np.array([t]), int(x1[t] - x0[t]) + 1, int(y1[t] - y0[t]) + 1)
+    
+    def visible_pieces(self, segments):
+        """Dzieli odcinki świata (w1, w2) na widoczne fragmenty, zasłonięte pomija"""
+        if not segments:
+            return []
+        a = np.array([w1[:] for w1, _ in segments], dtype=np.float64)
+        b = np.array([w2[:] for _, w2 in segments], dtype=np.float64)
+        ax, ay, _ = self._project(a)
+        bx, by, _ = self._project(b)
+        length = np.nan_to_num(np.hypot(bx - ax, by - ay), posinf=0.0)
+        # Próbki co ~1 px wzdłuż odcinka
+        n = np.clip(np.ceil(length) + 1, 2, 4 * HIDDEN_LINE_MAX_RES).astype(np.int64)
+        starts = np.cumsum(n) - n
+        edge = np.repeat(np.arange(len(segments)), n)
+        t = (np.arange(int(n.sum())) - starts[edge]) / (n[edge] - 1)
+        px, py, depth = self._project(a[edge] + (b - a)[edge] * t[:, None])
+        
+        ix = np.floor(np.nan_to_num(px, nan=-1.0, posinf=-1.0, neginf=-1.0)).astype(np.int64)
+        iy = np.floor(np.nan_to_num(py, nan=-1.0, posinf=-1.0, neginf=-1.0)).astype(np.int64)
+        inb = (ix >= 0) & (ix < self.width) & (iy >= 0) & (iy < self.height)
+        visible = ~inb
+        d = depth[inb]
+        visible[inb] = d <= self.zmax3[iy[inb], ix[inb]] + HIDDEN_LINE_BIAS + HIDDEN_LINE_REL_BIAS * d
+        counts = np.add.reduceat(visible.astype(np.int64), starts)
+        
+        pieces = []
+        for i, (w1, w2) in enumerate(segments):
+            count, total = counts[i], n[i]
+            if count == total:
+                pieces.append((w1, w2))
+                continue
+            if count == 0:
+                continue
+            run = np.concatenate(([0], visible[starts[i]:starts[i] + total].astype(np.int8), [0]))
+            bounds = np.flatnonzero(np.diff(run))
+            direction = w2 - w1
+            for s0, s1 in zip(bounds[::2], bounds[1::2]):
+                if s1 - s0 < 2:
+                    continue
+                pieces.append((w1 + direction * float(s0 / (total - 1)),
+                               w1 + direction * float((s1 - 1) / (total - 1))))
+        return pieces
+
+
 def section_mesh(src_obj, origin, normal, coll):
     """Cached wersja section_mesh z wykluczaniem obiektów"""
     global CACHE_STATS
@@ -1627,8 +2281,7 @@ def section_mesh(src_obj, origin, normal, coll):
         mesh.update()
         
         ob = bpy.data.objects.new(section_name, mesh)
-        props = parse_layer_from_name(section_name)
-        ob["miix_layer"] = props["layer"] if props else "0"
+        assign_object_layer(ob)
         coll.objects.link(ob)
         
         # Zaznacz że obiekt ma przekrój
@@ -1822,8 +2475,115 @@ def special_mesh(src_obj, coll, suffix="_special"):
     
     return result_obj
 
-def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix):
-    """Cached wersja depth_mesh"""
+def _view_edge_filter(mesh, obj2w, cam, cos_tol=COS_TOL):
+    """Indeksy krawędzi mesha, które mogą być widoczne z kamery (filtr przed rzutowaniem).
+    
+    Ściany są klasyfikowane jako przednie/tylne względem kierunku patrzenia.
+    Zostają sylwetki (przejście przednia/tylna), krawędzie brzegowe, luźne
+    i nie-manifold oraz załamania między ścianami przednimi. Odpadają krawędzie
+    między ścianami współpłaszczyznowymi oraz między dwiema ścianami tylnymi -
+    te ostatnie tylko w zamkniętych bryłach (spójna część bez krawędzi brzegowych
+    i nie-manifold); tył otwartej powierzchni jest widoczny jak przód.
+    """
+    n_edges, n_polys, n_loops = len(mesh.edges), len(mesh.polygons), len(mesh.loops)
+    normal_matrix = obj2w.to_3x3().inverted_safe().transposed()
+    cam_dir = -cam.matrix_world.to_3x3().col[2].normalized()
+    cam_loc = cam.matrix_world.translation
+    ortho = cam.data.type == 'ORTHO'
+    
+    if np is None:
+        edge_faces = [[] for _ in range(n_edges)]
+        for poly in mesh.polygons:
+            for li in poly.loop_indices:
+                edge_faces[mesh.loops[li].edge_index].append(poly)
+        
+        # Spójne części (union-find po wspólnych krawędziach) i części otwarte
+        parent = list(range(n_polys))
+        
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+        
+        for faces in edge_faces:
+            for f in faces[1:]:
+                ra, rb = find(faces[0].index), find(f.index)
+                if ra != rb:
+                    parent[rb] = ra
+        open_roots = {find(faces[0].index) for faces in edge_faces if faces and len(faces) != 2}
+        
+        keep = []
+        for ei, faces in enumerate(edge_faces):
+            if len(faces) == 2:
+                normals = [(normal_matrix @ f.normal).normalized() for f in faces]
+                views = [cam_dir if ortho else obj2w @ f.center - cam_loc for f in faces]
+                front = [n.dot(v) < 0 for n, v in zip(normals, views)]
+                closed = find(faces[0].index) not in open_roots
+                if front[0] == front[1] and ((not front[0] and closed)
+                                             or normals[0].dot(normals[1]) > cos_tol):
+                    continue
+            keep.append(ei)
+        return keep
+    
+    loop_edge = np.empty(n_loops, dtype=np.int32)
+    mesh.loops.foreach_get("edge_index", loop_edge)
+    loop_total = np.empty(n_polys, dtype=np.int32)
+    mesh.polygons.foreach_get("loop_total", loop_total)
+    loop_face = np.repeat(np.arange(n_polys), loop_total)
+    
+    # Dwie ściany każdej krawędzi z pętli posortowanych po krawędzi
+    face_count = np.bincount(loop_edge, minlength=n_edges)
+    order = np.argsort(loop_edge, kind='stable')
+    first = np.searchsorted(loop_edge[order], np.arange(n_edges))
+    two = np.flatnonzero(face_count == 2)
+    f1 = loop_face[order[first[two]]]
+    f2 = loop_face[order[first[two] + 1]]
+    
+    normals = np.empty(3 * n_polys, dtype=np.float32)
+    mesh.polygons.foreach_get("normal", normals)
+    normals = normals.reshape(-1, 3) @ np.array(normal_matrix, dtype=np.float64).T
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1e-12)[:, None]
+    if ortho:
+        front = normals @ np.array(cam_dir) < 0
+    else:
+        centers = np.empty(3 * n_polys, dtype=np.float32)
+        mesh.polygons.foreach_get("center", centers)
+        matrix = np.array(obj2w, dtype=np.float64)
+        view = centers.reshape(-1, 3) @ matrix[:3, :3].T + matrix[:3, 3] - np.array(cam_loc)
+        front = (normals * view).sum(1) < 0
+    
+    # Spójne części ścian: etykieta = najmniejszy indeks ściany (podpinanie korzeni
+    # + skracanie ścieżek); część z krawędzią brzegową lub nie-manifold jest otwarta
+    label = np.arange(n_polys)
+    while True:
+        l1, l2 = label[f1], label[f2]
+        if np.array_equal(l1, l2):
+            break
+        low = np.minimum(l1, l2)
+        np.minimum.at(label, l1, low)
+        np.minimum.at(label, l2, low)
+        while True:
+            jumped = label[label]
+            if np.array_equal(jumped, label):
+                break
+            label = jumped
+    open_faces = loop_face[np.isin(loop_edge, np.flatnonzero(face_count != 2))]
+    closed = ~np.isin(label, label[open_faces])
+    
+    coplanar = (normals[f1] * normals[f2]).sum(1) > cos_tol
+    a, b = front[f1], front[f2]
+    keep = np.ones(n_edges, dtype=bool)
+    # Tył otwartej powierzchni jest widoczny - tam tylne ściany traktowane jak przednie
+    keep[two] = (a != b) | ((a | ~closed[f1]) & ~coplanar)
+    return np.flatnonzero(keep).tolist()
+
+
+def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix, occlusion=None):
+    """Cached wersja depth_mesh
+    
+    occlusion - opcjonalny DepthBuffer; krawędzie zasłonięte są usuwane lub dzielone.
+    """
     global CACHE_STATS
     
     # Specjalne obiekty #Oś i #Przekrój są obsługiwane przez special_mesh()
@@ -1852,7 +2612,7 @@ def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix):
     # Przygotuj parametry cache
     cam_params = (
         tuple(tuple(row) for row in cam.matrix_world),
-        zmin, zmax, suffix
+        zmin, zmax, suffix, occlusion.key if occlusion is not None else None
     )
     cache_key = get_object_cache_key(src_obj, f"depth{suffix}", origin, normal, cam_params)
     
@@ -1871,8 +2631,7 @@ def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix):
         mesh.update()
         
         ob = bpy.data.objects.new(depth_name, mesh)
-        props = parse_layer_from_name(depth_name)
-        ob["miix_layer"] = props["layer"] if props else "0"
+        assign_object_layer(ob)
         coll.objects.link(ob)
         
         return ob
@@ -1891,14 +2650,12 @@ def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix):
         return None
     
     
-    bm_src = bmesh.new()
-    bm_src.from_mesh(src)
-    
     # Cache obliczenia raz
     obj2w = eval_obj.matrix_world
     cam_inv = cam.matrix_world.inverted()
     scene = ctx.scene
-    obj_n = obj2w.to_3x3()
+    verts = src.vertices
+    edges = src.edges
     
     # Lambda functions
     project = lambda w: w - ((w-origin).dot(normal)) * normal
@@ -1906,21 +2663,13 @@ def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix):
     
     bm_dst = bmesh.new()
     vmap = {}
+    segments = []
     
-    # Zoptymalizowana pętla
-    for e in bm_src.edges:
-        # Sprawdź normalne (jeśli edge ma 2 faces) - Blender 4.3 fix
-        v1, v2 = e.verts[0].index, e.verts[1].index
-        connected_faces = [f for f in bm_src.faces if v1 in [v.index for v in f.verts] and v2 in [v.index for v in f.verts]]
-        
-        if len(connected_faces) == 2:
-            n1 = obj_n @ connected_faces[0].normal
-            n2 = obj_n @ connected_faces[1].normal
-            if n1.normalized().dot(n2.normalized()) > COS_TOL: 
-                continue
-        
+    # Zoptymalizowana pętla - tylko krawędzie, które przeszły filtr widoku
+    for ei in _view_edge_filter(src, obj2w, cam):
         # Transform vertices
-        w1, w2 = obj2w @ e.verts[0].co, obj2w @ e.verts[1].co
+        i1, i2 = edges[ei].vertices
+        w1, w2 = obj2w @ verts[i1].co, obj2w @ verts[i2].co
         
         # Depth test
         z1, z2 = -(cam_inv @ w1).z, -(cam_inv @ w2).z
@@ -1931,6 +2680,13 @@ def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix):
         if not (in_fov(world_to_camera_view(scene, cam, w1)) and in_fov(world_to_camera_view(scene, cam, w2))): 
                 continue
         
+        segments.append((w1, w2))
+    
+    # Usuwanie krawędzi zasłoniętych innymi obiektami
+    if occlusion is not None:
+        segments = occlusion.visible_pieces(segments)
+    
+    for w1, w2 in segments:
         # Project points
         p1, p2 = project(w1), project(w2)
         k1, k2 = tuple(round(c, 5) for c in p1), tuple(round(c, 5) for c in p2)  # Mniejsza precyzja
@@ -1972,7 +2728,6 @@ def depth_mesh(src_obj, cam, origin, normal, coll, ctx, zmin, zmax, suffix):
         bm_dst.free()
         BMESH_CACHE[cache_key] = None  # Cache negative result
         
-    bm_src.free()
     bpy.data.meshes.remove(src)
     return result_obj
 
@@ -1986,91 +2741,972 @@ def _pt_key(pt):
             round(pt[1] / MERGE_TOL) * MERGE_TOL)
 
 
-def _merge_lines_to_polylines(msp):
-    """Scala entity LINE w jedną lub więcej `LWPOLYLINE` na warstwę.
-    Optymalizowana wersja z limitem czasu.
-    """
-    import time
-    from ezdxf.lldxf import const as dxfconst
-    PLINEGEN = getattr(dxfconst, "LWPOLYLINE_PLINEGEN", 128)
+def _chain_segments(segments):
+    """Łączy odcinki (start, end) w maksymalne ciągi po węzłach _pt_key.
     
-    start_time = time.time()
-    MAX_TIME = 30  # Maximum 30 seconds for line merging
+    Graf końców odcinków w słowniku (węzeł → odcinki), każdy odcinek
+    odwiedzany raz - czas liniowy. Ciągi kończą się w rozgałęzieniach
+    i na wolnych końcach. Zwraca listę (punkty, zamknięta); pętla
+    zamknięta nie powtarza pierwszego punktu.
+    """
+    ends = []
+    links = {}
+    for start, end in segments:
+        a, b = _pt_key(start), _pt_key(end)
+        if a == b:
+            continue
+        links.setdefault(a, []).append(len(ends))
+        links.setdefault(b, []).append(len(ends))
+        ends.append((a, b))
+    
+    used = bytearray(len(ends))
+    
+    def walk(node, i):
+        """Idzie od węzła przez węzły stopnia 2, zwraca kolejne węzły"""
+        path = []
+        while True:
+            node_links = links[node]
+            if len(node_links) != 2:
+                break
+            i = node_links[1] if node_links[0] == i else node_links[0]
+            if used[i]:
+                break
+            used[i] = 1
+            a, b = ends[i]
+            node = b if a == node else a
+            path.append(node)
+        return path
+    
+    chains = []
+    for i, (a, b) in enumerate(ends):
+        if used[i]:
+            continue
+        used[i] = 1
+        forward = walk(b, i)
+        if forward and forward[-1] == a:
+            points = [a, b] + forward[:-1]
+            chains.append((points, len(points) > 2))
+        else:
+            chains.append((walk(a, i)[::-1] + [a, b] + forward, False))
+    return chains
 
-    by_layer = {}
-    all_lines = list(msp.query("LINE"))
-    
-    for ln in all_lines:
-        by_layer.setdefault(ln.dxf.layer, []).append(ln)
 
-    for layer, segs in by_layer.items():
-        # Skip if taking too long
-        if time.time() - start_time > MAX_TIME:
-            break
-            
-        # Limit segments per layer for performance
-        if len(segs) > 1000:
-            segs = segs[:1000]
-            
-        raw = [(_pt_key(ln.dxf.start), _pt_key(ln.dxf.end), ln) for ln in segs]
-        pending = raw.copy()
-        paths = []
-
-        while pending and time.time() - start_time < MAX_TIME:
-            s, e, _ = pending.pop()
-            path = [s, e]
-            grown = True
-            max_growth = 100  # Limit path growth for performance
-            growth_count = 0
-            
-            while grown and growth_count < max_growth and time.time() - start_time < MAX_TIME:
-                grown = False
-                growth_count += 1
-                for seg in pending[:]:  # Copy list to avoid modification issues
-                    s2, e2, _ = seg
-                    if s2 == path[-1]:
-                        path.append(e2)
-                        pending.remove(seg)
-                        grown = True
-                        break
-                    if e2 == path[-1]:
-                        path.append(s2)
-                        pending.remove(seg)
-                        grown = True
-                        break
-                    if s2 == path[0]:
-                        path.insert(0, e2)
-                        pending.remove(seg)
-                        grown = True
-                        break
-                    if e2 == path[0]:
-                        path.insert(0, s2)
-                        pending.remove(seg)
-                        grown = True
-                        break
-            paths.append(path)
+# -----------------------------------------------------------------------------
+# DXF – upraszczanie polilinii -------------------------------------------------
+# -----------------------------------------------------------------------------
 
-        # Create new polylines
-        for pts in paths:
-            if time.time() - start_time > MAX_TIME:
-                break
-            coords = [(x, y) for x, y in pts]
-            closed = len(coords) > 2 and coords[0] == coords[-1]
-            poly = msp.add_lwpolyline(coords, dxfattribs={
-                "layer": layer,
-                "ltscale": LINE_SCALE,
-            }, close=closed)
-            poly.dxf.flags |= PLINEGEN
-
-        # Remove old lines
-        for _, _, ln in raw:
-            try:
-                msp.delete_entity(ln)
-            except:
-                pass  # Ignore if already deleted
+def _douglas_peucker(pts, tol):
+    """Douglas-Peucker (iteracyjnie) - pierwszy i ostatni punkt zawsze zostają."""
+    keep = [False] * len(pts)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(pts) - 1)]
+    while stack:
+        s, e = stack.pop()
+        if e - s < 2:
+            continue
+        (x1, y1), (x2, y2) = pts[s], pts[e]
+        dx, dy = x2 - x1, y2 - y1
+        length = math.hypot(dx, dy)
+        dmax, imax = -1.0, s
+        for i in range(s + 1, e):
+            px, py = pts[i]
+            if length > 0.0:
+                d = abs(dy * (px - x1) - dx * (py - y1)) / length
+            else:
+                d = math.hypot(px - x1, py - y1)
+            if d > dmax:
+                dmax, imax = d, i
+        if dmax > tol:
+            keep[imax] = True
+            stack.append((s, imax))
+            stack.append((imax, e))
+    return [p for p, k in zip(pts, keep) if k]
+
+def _simplify_polyline(points, closed, cos_tol=COS_TOL, tolerance=0.0):
+    """Usuwa zdublowane i współliniowe wierzchołki, opcjonalnie Douglas-Peucker.
+    
+    Końce otwartego ciągu (wspólne z innymi ciągami) i pierwszy wierzchołek
+    pętli zostają zawsze. Pętla zamknięta wraca bez powtórzonego punktu
+    i z co najmniej 3 wierzchołkami.
+    """
+    pts = []
+    for p in points:
+        if pts and abs(p[0] - pts[-1][0]) <= SIMPLIFY_DUP_TOL and abs(p[1] - pts[-1][1]) <= SIMPLIFY_DUP_TOL:
+            continue
+        pts.append(p)
+    if closed and len(pts) > 1 and abs(pts[0][0] - pts[-1][0]) <= SIMPLIFY_DUP_TOL \
+            and abs(pts[0][1] - pts[-1][1]) <= SIMPLIFY_DUP_TOL:
+        pts.pop()
+    if len(pts) < 3:
+        return pts
+    
+    # Wierzchołek współliniowy: kierunek wejścia i wyjścia zgodny w granicy cos_tol
+    out = [pts[0]]
+    n = len(pts)
+    for i in range(1, n if closed else n - 1):
+        ax, ay = out[-1]
+        bx, by = pts[i]
+        cx, cy = pts[(i + 1) % n]
+        ux, uy, vx, vy = bx - ax, by - ay, cx - bx, cy - by
+        norm = math.hypot(ux, uy) * math.hypot(vx, vy)
+        if norm > 0.0 and (ux * vx + uy * vy) / norm >= cos_tol:
+            continue
+        out.append(pts[i])
+    if not closed:
+        out.append(pts[-1])
+    
+    if tolerance > 0.0 and len(out) > 2:
+        if closed:
+            reduced = _douglas_peucker(out + [out[0]], tolerance)[:-1]
+            if len(reduced) >= 3:
+                out = reduced
+        else:
+            out = _douglas_peucker(out, tolerance)
+    return out if not closed or len(out) >= 3 else pts
 
 # -----------------------------------------------------------------------------
-# DXF eksport -----------------------------------------------------------------
+# DXF – usuwanie pokrywających się odcinków -----------------------------------
+# -----------------------------------------------------------------------------
+
+def _merge_intervals(intervals, tol):
+    """Suma przedziałów [t0, t1] (stykające się w granicy tol są łączone)."""
+    merged = []
+    for t0, t1 in sorted(intervals):
+        if merged and t0 <= merged[-1][1] + tol:
+            merged[-1][1] = max(merged[-1][1], t1)
+        else:
+            merged.append([t0, t1])
+    return merged
+
+def _subtract_intervals(intervals, covered, tol):
+    """Przedziały (posortowane, rozłączne) pomniejszone o covered; kawałki < tol odpadają."""
+    out = []
+    j = 0
+    for t0, t1 in intervals:
+        while j < len(covered) and covered[j][1] <= t0 + tol:
+            j += 1
+        k = j
+        start = t0
+        while k < len(covered) and covered[k][0] < t1 - tol:
+            if covered[k][0] - start > tol:
+                out.append([start, covered[k][0]])
+            start = max(start, covered[k][1])
+            k += 1
+        if t1 - start > tol:
+            out.append([start, t1])
+    return out
+
+def _layer_kind_ranks():
+    """Priorytet warstw z LAYER_CFG dla konfliktów: przekrój, widok, nad."""
+    order = {"przekroj": 0, "widok": 1, "nad": 2}
+    ranks = {}
+    for cat in LAYER_CFG.values():
+        for kind, cfg in cat.items():
+            rank = order.get(kind, len(order))
+            ranks[cfg["layer"]] = min(rank, ranks.get(cfg["layer"], rank))
+    return ranks
+
+def _dedup_collinear_segments(parts, rule='LAYER', tol=DEDUP_TOL, ang_tol=DEDUP_ANG_TOL):
+    """Usuwa pokrywające się i współliniowo zachodzące odcinki polilinii.
+    
+    parts - listy encji (rodzaj, dxfattribs, opcje, pętle) w kolejności rysowania,
+    zmieniane w miejscu. Odcinki trafiają do hasha przestrzennego po parametrach
+    prostej (kąt, odległość od początku układu); grupa współliniowa to odcinki
+    w granicy ang_tol/tol od prostej odniesienia, w każdej zostaje suma przedziałów. Reguła konfliktu między warstwami:
+      'LAYER' - tylko w obrębie jednej warstwy,
+      'KIND'  - także między warstwami, wygrywa przekrój, potem widok, potem nad,
+      'ORDER' - także między warstwami, wygrywa warstwa wcześniejsza w kolejności rysowania.
+    Zmienione polilinie są ponownie łączone w ciągi. Zwraca (liczba zastąpionych
+    odcinków, liczba kawałków wstawionych w ich miejsce).
+    """
+    seg_owner = []   # (indeks części, indeks encji)
+    seg_points = []
+    seg_line = []    # (kąt, odległość)
+    layer_order = {}
+    for pi, entities in enumerate(parts):
+        for ei, (kind, dxfattribs, options, loops) in enumerate(entities):
+            if kind != 'LWPOLYLINE':
+                continue
+            layer_order.setdefault(dxfattribs.get("layer", "0"), len(layer_order))
+            pts = loops[0]
+            count = len(pts) if options.get('close') else len(pts) - 1
+            for k in range(count):
+                p, q = pts[k], pts[(k + 1) % len(pts)]
+                dx, dy = q[0] - p[0], q[1] - p[1]
+                if math.hypot(dx, dy) <= tol:
+                    continue
+                angle = math.atan2(dy, dx) % math.pi
+                if angle >= math.pi - ang_tol / 2:
+                    angle -= math.pi
+                dist = -math.sin(angle) * p[0] + math.cos(angle) * p[1]
+                seg_owner.append((pi, ei))
+                seg_points.append((p, q))
+                seg_line.append((angle, dist))
+    
+    # Hash przestrzenny prostych. Grupa to odcinki z sąsiednich kubełków leżące w granicy
+    # tolerancji od prostej odniesienia (pierwszy nieprzydzielony odcinek) - sprawdzane
+    # względem niej, więc powoli dryfujące odcinki nie sklejają się w jedną grupę
+    buckets = {}
+    for i, (angle, dist) in enumerate(seg_line):
+        buckets.setdefault((round(angle / ang_tol), round(dist / tol)), []).append(i)
+    
+    assigned = [False] * len(seg_line)
+    groups = []
+    for i, (angle, dist) in enumerate(seg_line):
+        if assigned[i]:
+            continue
+        assigned[i] = True
+        members = [i]
+        sn, cs = math.sin(angle), math.cos(angle)
+        # Prosta o kącie α+π to ta sama prosta z odległością -d - przy końcach zakresu
+        # kątów sąsiedzi leżą też w kubełkach po drugiej stronie zawinięcia
+        aliases = [(angle, dist)]
+        if angle < ang_tol:
+            aliases.append((angle + math.pi, -dist))
+        if angle > math.pi - 2 * ang_tol:
+            aliases.append((angle - math.pi, -dist))
+        for alias_angle, alias_dist in aliases:
+            a, d = round(alias_angle / ang_tol), round(alias_dist / tol)
+            for na in (a - 1, a, a + 1):
+                for nd in (d - 1, d, d + 1):
+                    for j in buckets.get((na, nd), ()):
+                        if assigned[j]:
+                            continue
+                        # Różnica kierunków modulo π
+                        diff = (seg_line[j][0] - angle + math.pi / 2) % math.pi - math.pi / 2
+                        if abs(diff) > ang_tol:
+                            continue
+                        if all(abs(-sn * p[0] + cs * p[1] - dist) <= tol for p in seg_points[j]):
+                            assigned[j] = True
+                            members.append(j)
+        # Odniesienie (najmniejszy indeks) zostaje pierwsze
+        groups.append(sorted(members))
+    
+    layer_rank = _layer_kind_ranks() if rule == 'KIND' else layer_order
+    removed = set()
+    added = []   # (indeks części, dxfattribs, p, q)
+    for members in groups:
+        if len(members) < 2:
+            continue
+        angle = seg_line[members[0]][0]
+        ux, uy = math.cos(angle), math.sin(angle)
+        ref = seg_points[members[0]][0]
+        t_ref = ux * ref[0] + uy * ref[1]
+        
+        # Podgrupy rozstrzygane razem: warstwa (LAYER) albo cała grupa wg priorytetu
+        by_group = {}
+        for i in members:
+            pi, ei = seg_owner[i]
+            layer = parts[pi][ei][1].get("layer", "0")
+            group_key = layer if rule == 'LAYER' else None
+            by_group.setdefault(group_key, []).append(i)
+        
+        for seg_ids in by_group.values():
+            if len(seg_ids) < 2:
+                continue
+            by_layer = {}
+            for i in seg_ids:
+                pi, ei = seg_owner[i]
+                by_layer.setdefault(parts[pi][ei][1].get("layer", "0"), []).append(i)
+            
+            covered = []
+            for layer in sorted(by_layer, key=lambda name: layer_rank.get(name, len(layer_rank))):
+                ids = by_layer[layer]
+                intervals = []
+                exact = {}
+                for i in ids:
+                    p, q = seg_points[i]
+                    tp, tq = ux * p[0] + uy * p[1], ux * q[0] + uy * q[1]
+                    exact.setdefault(tp, p)
+                    exact.setdefault(tq, q)
+                    intervals.append((min(tp, tq), max(tp, tq)))
+                
+                intervals.sort()
+                overlapping = any(intervals[k + 1][0] < intervals[k][1] - tol
+                                  for k in range(len(intervals) - 1))
+                merged = _merge_intervals(intervals, tol)
+                kept = _subtract_intervals(merged, covered, tol) if covered else merged
+                covered = _merge_intervals(covered + merged, tol)
+                if not overlapping and kept == merged:
+                    continue
+                
+                # Zamiana odcinków warstwy na sumę przedziałów (bez części już pokrytych)
+                pi, ei = seg_owner[ids[0]]
+                dxfattribs = parts[pi][ei][1]
+                removed.update(ids)
+                for t0, t1 in kept:
+                    p = exact.get(t0) or (ref[0] + (t0 - t_ref) * ux, ref[1] + (t0 - t_ref) * uy)
+                    q = exact.get(t1) or (ref[0] + (t1 - t_ref) * ux, ref[1] + (t1 - t_ref) * uy)
+                    added.append((pi, dxfattribs, p, q))
+    
+    if not removed:
+        return 0, 0
+    
+    # Przebudowa zmienionych polilinii: pozostałe odcinki + nowe kawałki, łączone w ciągi
+    changed = {}
+    for i in removed:
+        changed.setdefault(seg_owner[i], True)
+    rebuilt = {}   # indeks części → {klucz atrybutów: (dxfattribs, odcinki)}
+    for i, owner in enumerate(seg_owner):
+        if owner in changed and i not in removed:
+            pi, ei = owner
+            dxfattribs = parts[pi][ei][1]
+            slot = rebuilt.setdefault(pi, {}).setdefault(repr(sorted(dxfattribs.items())), (dxfattribs, []))
+            slot[1].append(seg_points[i])
+    for pi, dxfattribs, p, q in added:
+        slot = rebuilt.setdefault(pi, {}).setdefault(repr(sorted(dxfattribs.items())), (dxfattribs, []))
+        slot[1].append((p, q))
+    
+    for pi, entities in enumerate(parts):
+        if pi not in rebuilt and not any((pi, ei) in changed for ei in range(len(entities))):
+            continue
+        kept_entities = [entity for ei, entity in enumerate(entities) if (pi, ei) not in changed]
+        for dxfattribs, segments in rebuilt.get(pi, {}).values():
+            for points, closed in _chain_segments(segments):
+                kept_entities.append(('LWPOLYLINE', dxfattribs, {'close': closed}, [points]))
+        entities[:] = kept_entities
+    
+    return len(removed), len(added)
+
+# -----------------------------------------------------------------------------
+# DXF – suma wielokątów hatchy -------------------------------------------------
+# -----------------------------------------------------------------------------
+
+def _polygon_area_2d(pts):
+    """Pole ze znakiem (wzór shoelace) - dodatnie dla obiegu CCW."""
+    n = len(pts)
+    area = 0.0
+    for i in range(n):
+        x1, y1 = pts[i]
+        x2, y2 = pts[(i + 1) % n]
+        area += x1 * y2 - x2 * y1
+    return area / 2.0
+
+def _point_in_polygon_2d(x, y, pts):
+    """Test parzystości przecięć (ray casting)."""
+    inside = False
+    n = len(pts)
+    x1, y1 = pts[-1]
+    for i in range(n):
+        x2, y2 = pts[i]
+        if (y1 > y) != (y2 > y):
+            if x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+                inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+def _grid_cells(bbox, cell):
+    x0, y0, x1, y1 = bbox
+    for gx in range(int(math.floor(x0 / cell)), int(math.floor(x1 / cell)) + 1):
+        for gy in range(int(math.floor(y0 / cell)), int(math.floor(y1 / cell)) + 1):
+            yield gx, gy
+
+def _segment_split_params(a, b, c, d, tol):
+    """Zwraca parametry podziału odcinków ab i cd w punktach wspólnych."""
+    rx, ry = b[0] - a[0], b[1] - a[1]
+    sx, sy = d[0] - c[0], d[1] - c[1]
+    denom = rx * sy - ry * sx
+    qx, qy = c[0] - a[0], c[1] - a[1]
+    len_r = math.hypot(rx, ry)
+    len_s = math.hypot(sx, sy)
+    if len_r == 0.0 or len_s == 0.0:
+        return [], []
+    
+    if abs(denom) <= tol * len_r * len_s:
+        # Równoległe - interesuje nas tylko nakładanie współliniowe
+        if abs(qx * ry - qy * rx) > tol * len_r:
+            return [], []
+        rr = rx * rx + ry * ry
+        ss = sx * sx + sy * sy
+        t_ab = [((p[0] - a[0]) * rx + (p[1] - a[1]) * ry) / rr for p in (c, d)]
+        t_cd = [((p[0] - c[0]) * sx + (p[1] - c[1]) * sy) / ss for p in (a, b)]
+        eps_r = tol / len_r
+        eps_s = tol / len_s
+        return ([t for t in t_ab if eps_r < t < 1.0 - eps_r],
+                [t for t in t_cd if eps_s < t < 1.0 - eps_s])
+    
+    t = (qx * sy - qy * sx) / denom
+    u = (qx * ry - qy * rx) / denom
+    eps_r = tol / len_r
+    eps_s = tol / len_s
+    if -eps_r <= t <= 1.0 + eps_r and -eps_s <= u <= 1.0 + eps_s:
+        return ([t] if eps_r < t < 1.0 - eps_r else [],
+                [u] if eps_s < u < 1.0 - eps_s else [])
+    return [], []
+
+def _union_polygons_2d(polygons, tol=HATCH_UNION_TOL):
+    """Suma wielokątów 2D.
+    
+    Krawędzie wszystkich wielokątów są dzielone w punktach przecięć,
+    a zostają tylko te, po których zewnętrznej stronie nie ma żadnego
+    wielokąta. Z pozostałych krawędzi składane są pętle: CCW to obrysy,
+    CW to otwory. Zwraca listę (obrys, [otwory]).
+    """
+    key = lambda p: (round(p[0] / tol), round(p[1] / tol))
+    
+    # Przyciągnij punkty do siatki tolerancji i ujednolić obieg na CCW
+    polys = []
+    for pts in polygons:
+        snapped = []
+        last = None
+        for p in pts:
+            k = key(p)
+            if k != last:
+                snapped.append((k[0] * tol, k[1] * tol))
+                last = k
+        if len(snapped) > 1 and key(snapped[0]) == key(snapped[-1]):
+            snapped.pop()
+        if len(snapped) < 3:
+            continue
+        area = _polygon_area_2d(snapped)
+        if abs(area) < tol * tol:
+            continue
+        if area < 0:
+            snapped.reverse()
+        xs = [p[0] for p in snapped]
+        ys = [p[1] for p in snapped]
+        polys.append((snapped, (min(xs), min(ys), max(xs), max(ys))))
+    
+    if not polys:
+        return []
+    
+    edges = []
+    for pts, _ in polys:
+        n = len(pts)
+        for i in range(n):
+            edges.append((pts[i], pts[(i + 1) % n]))
+    
+    # Siatka przestrzenna - rozmiar komórki ze średniej długości krawędzi
+    avg_len = sum(math.hypot(b[0] - a[0], b[1] - a[1]) for a, b in edges) / len(edges)
+    cell = max(avg_len * 2.0, tol * 1000.0)
+    
+    edge_grid = {}
+    for ei, (a, b) in enumerate(edges):
+        bbox = (min(a[0], b[0]), min(a[1], b[1]), max(a[0], b[0]), max(a[1], b[1]))
+        for c in _grid_cells(bbox, cell):
+            edge_grid.setdefault(c, []).append(ei)
+    
+    splits = [[] for _ in edges]
+    tested = set()
+    for bucket in edge_grid.values():
+        for i in range(len(bucket)):
+            ei = bucket[i]
+            a, b = edges[ei]
+            for j in range(i + 1, len(bucket)):
+                ej = bucket[j]
+                pair = (ei, ej) if ei < ej else (ej, ei)
+                if pair in tested:
+                    continue
+                tested.add(pair)
+                c, d = edges[ej]
+                t_i, t_j = _segment_split_params(a, b, c, d, tol)
+                splits[ei].extend(t_i)
+                splits[ej].extend(t_j)
+    
+    # Podziel krawędzie i usuń zduplikowane odcinki skierowane
+    sub_edges = {}
+    for (a, b), params in zip(edges, splits):
+        ts = [0.0] + sorted(set(params)) + [1.0]
+        pts = [(a[0] + (b[0] - a[0]) * t, a[1] + (b[1] - a[1]) * t) for t in ts]
+        keys = [key(p) for p in pts]
+        for k in range(len(pts) - 1):
+            if keys[k] != keys[k + 1]:
+                sub_edges.setdefault((keys[k], keys[k + 1]), (pts[k], pts[k + 1]))
+    
+    poly_grid = {}
+    for pi, (_, bbox) in enumerate(polys):
+        for c in _grid_cells(bbox, cell):
+            poly_grid.setdefault(c, []).append(pi)
+    
+    # Zostaw krawędzie, po których prawej (zewnętrznej) stronie nie ma wypełnienia
+    eps = tol * 10.0
+    outgoing = {}
+    points = {}
+    for (ka, kb), (a, b) in sub_edges.items():
+        dx, dy = b[0] - a[0], b[1] - a[1]
+        length = math.hypot(dx, dy)
+        tx = (a[0] + b[0]) / 2.0 + dy / length * eps
+        ty = (a[1] + b[1]) / 2.0 - dx / length * eps
+        covered = False
+        for pi in poly_grid.get((int(math.floor(tx / cell)), int(math.floor(ty / cell))), ()):
+            pts, (x0, y0, x1, y1) = polys[pi]
+            if x0 <= tx <= x1 and y0 <= ty <= y1 and _point_in_polygon_2d(tx, ty, pts):
+                covered = True
+                break
+        if not covered:
+            outgoing.setdefault(ka, []).append(kb)
+            points[ka] = a
+            points[kb] = b
+    
+    # Złóż pętle - w węzłach wielokrotnych wybieraj najostrzejszy skręt w lewo
+    loops = []
+    while outgoing:
+        start = next(iter(outgoing))
+        loop = [start]
+        prev, cur = None, start
+        while True:
+            candidates = outgoing.get(cur)
+            if not candidates:
+                break
+            if prev is None or len(candidates) == 1:
+                nxt = candidates[0]
+            else:
+                px, py = points[prev]
+                cx, cy = points[cur]
+                ix, iy = cx - px, cy - py
+                def turn(k):
+                    ox, oy = points[k][0] - cx, points[k][1] - cy
+                    return math.atan2(ix * oy - iy * ox, ix * ox + iy * oy)
+                nxt = max(candidates, key=turn)
+            candidates.remove(nxt)
+            if not candidates:
+                del outgoing[cur]
+            prev, cur = cur, nxt
+            if cur == start:
+                break
+            loop.append(cur)
+        if len(loop) >= 3:
+            loops.append([points[k] for k in loop])
+    
+    outers = []
+    holes = []
+    for loop in loops:
+        area = _polygon_area_2d(loop)
+        if area > 0:
+            outers.append((loop, area))
+        elif area < 0:
+            holes.append(loop)
+    
+    result = [(loop, []) for loop, _ in outers]
+    for hole in holes:
+        # Otwór należy do najmniejszego obrysu, który go zawiera
+        hx = (hole[0][0] + hole[1][0]) / 2.0
+        hy = (hole[0][1] + hole[1][1]) / 2.0
+        best = None
+        for idx, (loop, area) in enumerate(outers):
+            if _point_in_polygon_2d(hx, hy, loop) and (best is None or area < outers[best][1]):
+                best = idx
+        if best is not None:
+            result[best][1].append(hole)
+    
+    return result
+
+def _nest_loops_2d(loops):
+    """Grupuje zamknięte pętle w (obrys, [otwory]) wg zagnieżdżenia.
+    
+    Pętla zawarta w parzystej liczbie innych pętli jest obrysem,
+    w nieparzystej - otworem najbliższego obrysu. Kierunek obiegu
+    nie ma znaczenia.
+    """
+    loops = sorted(loops, key=lambda l: -abs(_polygon_area_2d(l)))
+    parents = []
+    depths = []
+    for i, loop in enumerate(loops):
+        tx = (loop[0][0] + loop[1][0]) / 2.0
+        ty = (loop[0][1] + loop[1][1]) / 2.0
+        parent = None
+        depth = 0
+        # Większe pętle są wcześniej - ostatnia zawierająca to najbliższy rodzic
+        for j in range(i):
+            if _point_in_polygon_2d(tx, ty, loops[j]):
+                depth += 1
+                parent = j
+        parents.append(parent)
+        depths.append(depth)
+    
+    result = {}
+    for i, loop in enumerate(loops):
+        if depths[i] % 2 == 0:
+            result[i] = (loop, [])
+    for i, loop in enumerate(loops):
+        if depths[i] % 2 == 1 and parents[i] in result:
+            result[parents[i]][1].append(loop)
+    return list(result.values())
+
+def _mesh_face_islands(mesh, to_2d):
+    """Wyznacza obrysy spójnych wysp ścian siatki.
+    
+    Ściany łączone są w wyspy przez wspólne krawędzie, a z krawędzi
+    brzegowych (należących do jednej ściany) każdej wyspy składane są
+    pętle. to_2d mapuje indeks wierzchołka na punkt 2D.
+    Zwraca listę list (obrys, [otwory]) - jedną na wyspę.
+    """
+    parent = list(range(len(mesh.polygons)))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    edge_faces = {}
+    for poly in mesh.polygons:
+        vs = poly.vertices
+        n = len(vs)
+        for k in range(n):
+            a, b = vs[k], vs[(k + 1) % n]
+            key = (a, b) if a < b else (b, a)
+            faces = edge_faces.setdefault(key, [])
+            if faces:
+                ra, rb = find(faces[0]), find(poly.index)
+                if ra != rb:
+                    parent[rb] = ra
+            faces.append(poly.index)
+    
+    # Krawędzie brzegowe per wyspa
+    island_adj = {}
+    for (a, b), faces in edge_faces.items():
+        if len(faces) != 1:
+            continue
+        adj = island_adj.setdefault(find(faces[0]), {})
+        adj.setdefault(a, []).append(b)
+        adj.setdefault(b, []).append(a)
+    
+    islands = []
+    for adj in island_adj.values():
+        loops = []
+        while adj:
+            start = next(iter(adj))
+            loop = [start]
+            prev, cur = None, start
+            while True:
+                candidates = adj.get(cur)
+                if not candidates:
+                    break
+                nxt = candidates[0]
+                if prev is not None and len(candidates) > 1:
+                    # Wierzchołek wspólny kilku pętli - skręcaj najostrzej
+                    px, py = to_2d(prev)
+                    cx, cy = to_2d(cur)
+                    ix, iy = cx - px, cy - py
+                    def turn(k):
+                        ox, oy = to_2d(k)[0] - cx, to_2d(k)[1] - cy
+                        return math.atan2(ix * oy - iy * ox, ix * ox + iy * oy)
+                    nxt = max(candidates, key=turn)
+                candidates.remove(nxt)
+                if not candidates:
+                    del adj[cur]
+                back = adj.get(nxt)
+                if back is not None:
+                    back.remove(cur)
+                    if not back:
+                        del adj[nxt]
+                prev, cur = cur, nxt
+                if cur == start:
+                    break
+                loop.append(cur)
+            if len(loop) >= 3:
+                loops.append([to_2d(v) for v in loop])
+        if loops:
+            islands.append(_nest_loops_2d(loops))
+    return islands
+
+# -----------------------------------------------------------------------------
+# DXF – zapis strumieniowy -----------------------------------------------------
+# -----------------------------------------------------------------------------
+# Alternatywa dla doc.saveas(): encje nie trafiają do bazy ezdxf, tylko od razu
+# są zapisywane jako tagi do pliku roboczego. Nagłówek, tabele, bloki i OBJECTS
+# generuje ezdxf z pustego modelspace, więc warstwy i typy linii są identyczne.
+# Obsługiwany jest podzbiór API modelspace używany przez eksportery:
+# add_line / add_lwpolyline / add_hatch / add_text / add_mtext
+# (+ add_lines dla spakowanych tablic).
+
+class _StreamDXFAttribs:
+    """Atrybuty .dxf encji strumieniowej (podzbiór ezdxf)."""
+    layer = "0"
+    linetype = None
+    color = None
+    lineweight = None
+    ltscale = 1.0
+    true_color = None
+    flags = 0
+    insert = (0.0, 0.0)
+    align_point = None
+    height = 1.0
+    char_height = 1.0
+    rotation = None
+    style = None
+    halign = None
+    valign = None
+    attachment_point = 1
+    
+    def __init__(self, dxfattribs):
+        if dxfattribs:
+            for key, value in dxfattribs.items():
+                setattr(self, key, value)
+
+class _StreamEntity:
+    def __init__(self, dxftype, dxfattribs):
+        self.dxftype = dxftype
+        self.dxf = _StreamDXFAttribs(dxfattribs)
+
+class _StreamHatchPaths:
+    def __init__(self):
+        self.items = []
+    
+    def add_polyline_path(self, path_vertices, is_closed=True, flags=1):
+        self.items.append((flags, is_closed, [(p[0], p[1]) for p in path_vertices]))
+
+class _StreamHatch(_StreamEntity):
+    def __init__(self, dxfattribs):
+        super().__init__('HATCH', dxfattribs)
+        self.paths = _StreamHatchPaths()
+        self.pattern = None
+    
+    def set_solid_fill(self, color=7, style=1, rgb=None):
+        self.pattern = None
+        self.dxf.color = color
+        if rgb is not None:
+            self.dxf.true_color = rgb_to_truecolor_int(rgb)
+    
+    def set_pattern_fill(self, name, color=7, angle=0.0, scale=1.0, **kwargs):
+        self.pattern = (name, float(scale), float(angle))
+        self.dxf.color = color
+
+def _stream_common_tags(dxf):
+    """Tagi AcDbEntity wspólne dla wszystkich encji."""
+    tags = f"100\nAcDbEntity\n  8\n{dxf.layer}\n"
+    if dxf.linetype:
+        tags += f"  6\n{dxf.linetype}\n"
+    if dxf.color is not None and dxf.color != 256:
+        tags += f" 62\n{int(dxf.color)}\n"
+    if dxf.lineweight is not None:
+        tags += f"370\n{int(dxf.lineweight)}\n"
+    if dxf.ltscale != 1.0:
+        tags += f" 48\n{float(dxf.ltscale)!r}\n"
+    if dxf.true_color is not None:
+        tags += f"420\n{int(dxf.true_color)}\n"
+    return tags
+
+class DXFStreamWriter:
+    """Strumieniowy writer DXF zgodny z podzbiorem API modelspace ezdxf.
+    
+    Ostatnio dodana encja jest trzymana do czasu dodania następnej (żeby
+    wywołujący mógł jeszcze ustawić .dxf / paths / wypełnienie), potem jej
+    tagi są dopisywane do pliku roboczego. close() składa plik docelowy:
+    sekcje ezdxf do ENTITIES, encje z pliku roboczego, reszta dokumentu.
+    Uchwyty pobierane są z generatora dokumentu, więc $HANDSEED się zgadza.
+    """
+    
+    def __init__(self, doc, path):
+        self.doc = doc
+        self.path = path
+        self.count = 0
+        self._handles = doc.entitydb.handles
+        self._owner = doc.modelspace().block_record_handle
+        self._spool_path = path + ".entities.tmp"
+        self._spool = open(self._spool_path, "w", encoding="utf-8", newline="\n")
+        self._pending = None
+        self._pattern_tags = {}
+        self._template_doc = None
+    
+    # --- API modelspace ---------------------------------------------------
+    
+    def add_line(self, start, end, dxfattribs=None):
+        return self._push(_StreamEntity('LINE', dxfattribs), (start, end))
+    
+    def add_lwpolyline(self, points, format='xy', close=False, dxfattribs=None):
+        entity = _StreamEntity('LWPOLYLINE', dxfattribs)
+        if close:
+            entity.dxf.flags |= 1
+        return self._push(entity, points)
+    
+    def add_hatch(self, color=7, dxfattribs=None):
+        dxfattribs = dict(dxfattribs or {})
+        dxfattribs.setdefault("color", color)
+        return self._push(_StreamHatch(dxfattribs), None)
+    
+    def add_text(self, text, height=None, rotation=None, dxfattribs=None):
+        entity = _StreamEntity('TEXT', dxfattribs)
+        if height is not None:
+            entity.dxf.height = height
+        if rotation is not None:
+            entity.dxf.rotation = rotation
+        return self._push(entity, text)
+    
+    def add_mtext(self, text, dxfattribs=None):
+        return self._push(_StreamEntity('MTEXT', dxfattribs), text)
+    
+    def add_lines(self, coords, dxfattribs=None):
+        """Zapisuje serię LINE ze spakowanej tablicy x1, y1, x2, y2, ..."""
+        self._flush()
+        head = _stream_common_tags(_StreamDXFAttribs(dxfattribs))
+        write = self._spool.write
+        next_handle = self._handles.next
+        owner = self._owner
+        it = iter(coords)
+        n = 0
+        for x1, y1, x2, y2 in zip(it, it, it, it):
+            write(f"  0\nLINE\n  5\n{next_handle()}\n330\n{owner}\n{head}100\nAcDbLine\n"
+                  f" 10\n{float(x1)!r}\n 20\n{float(y1)!r}\n 30\n0.0\n"
+                  f" 11\n{float(x2)!r}\n 21\n{float(y2)!r}\n 31\n0.0\n")
+            n += 1
+        self.count += n
+        return n
+    
+    # --- zapis ------------------------------------------------------------
+    
+    def _push(self, entity, geometry):
+        self._flush()
+        self._pending = (entity, geometry)
+        return entity
+    
+    def _flush(self):
+        if self._pending is None:
+            return
+        entity, geometry = self._pending
+        self._pending = None
+        head = (f"  0\n{entity.dxftype}\n  5\n{self._handles.next()}\n330\n{self._owner}\n"
+                + _stream_common_tags(entity.dxf))
+        
+        if entity.dxftype == 'LINE':
+            (x1, y1, *z1), (x2, y2, *z2) = geometry
+            body = (f"100\nAcDbLine\n 10\n{float(x1)!r}\n 20\n{float(y1)!r}\n 30\n{float(z1[0]) if z1 else 0.0!r}\n"
+                    f" 11\n{float(x2)!r}\n 21\n{float(y2)!r}\n 31\n{float(z2[0]) if z2 else 0.0!r}\n")
+        elif entity.dxftype == 'LWPOLYLINE':
+            pts = list(geometry)
+            body = (f"100\nAcDbPolyline\n 90\n{len(pts)}\n 70\n{int(entity.dxf.flags)}\n"
+                    + "".join(f" 10\n{float(p[0])!r}\n 20\n{float(p[1])!r}\n" for p in pts))
+        elif entity.dxftype == 'HATCH':
+            body = self._hatch_body(entity)
+        else:
+            body = self._text_body(entity, geometry)
+        
+        self._spool.write(head + body)
+        self.count += 1
+    
+    def _hatch_body(self, hatch):
+        if hatch.pattern is None:
+            name, solid, tail = "SOLID", 1, " 75\n1\n 76\n1\n 98\n0\n"
+        else:
+            name, solid = hatch.pattern[0], 0
+            tail = self._pattern_fill_tags(*hatch.pattern)
+        
+        parts = [f"100\nAcDbHatch\n 10\n0.0\n 20\n0.0\n 30\n0.0\n210\n0.0\n220\n0.0\n230\n1.0\n"
+                 f"  2\n{name}\n 70\n{solid}\n 71\n0\n 91\n{len(hatch.paths.items)}\n"]
+        for flags, is_closed, pts in hatch.paths.items:
+            parts.append(f" 92\n{int(flags) | 2}\n 72\n0\n 73\n{1 if is_closed else 0}\n 93\n{len(pts)}\n")
+            parts.append("".join(f" 10\n{float(x)!r}\n 20\n{float(y)!r}\n" for x, y in pts))
+            parts.append(" 97\n0\n")
+        parts.append(tail)
+        return "".join(parts)
+    
+    def _text_body(self, entity, text):
+        dxf = entity.dxf
+        x, y, *z = dxf.insert
+        z = float(z[0]) if z else 0.0
+        if entity.dxftype == 'TEXT':
+            tags = [f"100\nAcDbText\n 10\n{float(x)!r}\n 20\n{float(y)!r}\n 30\n{z!r}\n"
+                    f" 40\n{float(dxf.height)!r}\n  1\n{text}\n"]
+            if dxf.rotation is not None:
+                tags.append(f" 50\n{float(dxf.rotation)!r}\n")
+            if dxf.style is not None:
+                tags.append(f"  7\n{dxf.style}\n")
+            if dxf.halign is not None:
+                tags.append(f" 72\n{int(dxf.halign)}\n")
+            if dxf.align_point is not None:
+                ax, ay, *az = dxf.align_point
+                tags.append(f" 11\n{float(ax)!r}\n 21\n{float(ay)!r}\n 31\n{float(az[0]) if az else 0.0!r}\n")
+            tags.append("100\nAcDbText\n")
+            if dxf.valign is not None:
+                tags.append(f" 73\n{int(dxf.valign)}\n")
+            return "".join(tags)
+        
+        tags = [f"100\nAcDbMText\n 10\n{float(x)!r}\n 20\n{float(y)!r}\n 30\n{z!r}\n"
+                f" 40\n{float(dxf.char_height)!r}\n 71\n{int(dxf.attachment_point)}\n"]
+        # Tekst MTEXT dzielony na fragmenty po 250 znaków (kod 3, ostatni kod 1)
+        while len(text) > 250:
+            tags.append(f"  3\n{text[:250]}\n")
+            text = text[250:]
+        tags.append(f"  1\n{text}\n")
+        if dxf.style is not None:
+            tags.append(f"  7\n{dxf.style}\n")
+        if dxf.rotation is not None:
+            tags.append(f" 50\n{float(dxf.rotation)!r}\n")
+        return "".join(tags)
+    
+    def _pattern_fill_tags(self, name, scale, angle):
+        """Tagi wzoru (od kodu 75) generowane przez ezdxf raz na (wzór, skala, kąt)."""
+        key = (name, scale, angle)
+        tags = self._pattern_tags.get(key)
+        if tags is None:
+            from ezdxf.lldxf.tagwriter import TagWriter
+            if self._template_doc is None:
+                self._template_doc = ezdxf.new(dxfversion=self.doc.dxfversion)
+            tmp_msp = self._template_doc.modelspace()
+            hatch = tmp_msp.add_hatch()
+            hatch.paths.add_polyline_path([(0, 0), (1, 0), (1, 1)], is_closed=True)
+            hatch.set_pattern_fill(name, scale=scale, angle=angle)
+            stream = io.StringIO()
+            hatch.export_dxf(TagWriter(stream, dxfversion=self.doc.dxfversion))
+            text = stream.getvalue()
+            tags = text[text.index("\n 75\n", text.index("\n 97\n")) + 1:]
+            tmp_msp.delete_entity(hatch)
+            self._pattern_tags[key] = tags
+        return tags
+    
+    def close(self):
+        """Domyka plik roboczy i składa docelowy plik DXF."""
+        self._flush()
+        self._spool.close()
+        try:
+            skeleton = io.StringIO()
+            self.doc.write(skeleton)
+            text = skeleton.getvalue()
+            match = re.search(r"\n\s*2\nENTITIES\n", text)
+            with open(self.path, "w", encoding="utf-8") as out:
+                out.write(text[:match.end()])
+                with open(self._spool_path, "r", encoding="utf-8") as spool:
+                    shutil.copyfileobj(spool, out, 1 << 20)
+                out.write(text[match.end():])
+        finally:
+            os.remove(self._spool_path)
+        return self.path
+    
+    def abort(self):
+        """Porzuca zapis (np. po błędzie eksportu)."""
+        self._pending = None
+        if not self._spool.closed:
+            self._spool.close()
+        if os.path.exists(self._spool_path):
+            os.remove(self._spool_path)
+
+# Writery strumieniowe otwarte przez trwający eksport (porzucane po błędzie)
+_open_stream_writers = []
+
+def _dxf_modelspace(ctx, doc, dxf_path):
+    """Modelspace dokumentu albo DXFStreamWriter wg Scene.miixarch_dxf_writer."""
+    if getattr(ctx.scene, "miixarch_dxf_writer", 'EZDXF') == 'STREAM':
+        writer = DXFStreamWriter(doc, dxf_path)
+        _open_stream_writers.append(writer)
+        return writer
+    return doc.modelspace()
+
+def aborts_dxf_stream_on_error(export):
+    """Dekorator eksportera: po wyjątku porzuca otwarte DXFStreamWriter
+    (zamyka i usuwa plik roboczy .entities.tmp), potem przekazuje wyjątek dalej."""
+    @functools.wraps(export)
+    def wrapper(*args, **kwargs):
+        mark = len(_open_stream_writers)
+        try:
+            return export(*args, **kwargs)
+        except BaseException:
+            for writer in _open_stream_writers[mark:]:
+                writer.abort()
+            raise
+        finally:
+            del _open_stream_writers[mark:]
+    return wrapper
+
+def _dxf_save(doc, msp, dxf_path):
+    """Zapisuje dokument odpowiednio do użytego backendu."""
+    if isinstance(msp, DXFStreamWriter):
+        msp.close()
+    else:
+        doc.saveas(dxf_path, encoding='utf-8')
+
+# -----------------------------------------------------------------------------
+# DXF eksport -----------------------------------------------------------------
 # -----------------------------------------------------------------------------
 
 def set_font_resolution(font_obj, resolution=3):
@@ -2086,6 +3722,355 @@ def restore_font_resolution(font_obj, original_resolution):
     if font_obj.type == 'FONT' and font_obj.data and original_resolution is not None:
         font_obj.data.resolution_u = original_resolution
 
+@contextmanager
+def lowered_font_resolution(font_objects, resolution=3):
+    """Obniża resolution_u wszystkich fontów naraz na czas konwersji.
+    
+    Jedna aktualizacja view layera zamiast jednej na font; handlery
+    depsgraph są wyłączone do momentu przywrócenia rozdzielczości.
+    """
+    originals = []
+    seen = set()
+    with suspended_handlers(catch_up=False):
+        try:
+            for obj in font_objects:
+                # Fonty mogą współdzielić dane - zmieniaj każde dane raz
+                if obj.type != 'FONT' or not obj.data or obj.data.as_pointer() in seen:
+                    continue
+                seen.add(obj.data.as_pointer())
+                original = set_font_resolution(obj, resolution)
+                if original is not None and original != resolution:
+                    originals.append((obj, original))
+            if originals:
+                bpy.context.view_layer.update()
+            yield
+        finally:
+            for obj, original in originals:
+                restore_font_resolution(obj, original)
+
+# --- Cache konturów glifów ---------------------------------------------------
+# Etykiety ("+0,00", "m²", spadki...) powtarzają te same znaki tysiące razy.
+# Zamiast konwertować każdy FONT przez depsgraph, kontury pojedynczych znaków
+# (oraz przesunięcia między kolejnymi znakami - szerokość + kerning) są
+# konwertowane raz i składane w etykietę. Obiekty z nieobsługiwanymi
+# ustawieniami tekstu wracają do pełnej konwersji.
+
+GLYPH_CACHE = {}          # (czcionka, wypełnienie, rozdzielczość, znak) → kontur glifu lub None
+GLYPH_PAIR_OFFSETS = {}   # (czcionka, wypełnienie, rozdzielczość, "a" + odstęp + "b") → przesunięcie b
+GLYPH_REFERENCE_CHAR = "I"
+
+def clear_glyph_cache():
+    """Czyści cache konturów glifów"""
+    GLYPH_CACHE.clear()
+    GLYPH_PAIR_OFFSETS.clear()
+
+def _glyph_style_key(curve):
+    font = curve.font
+    font_id = (font.filepath, font.name_full) if font else ("", "")
+    return (font_id, curve.fill_mode, curve.resolution_u)
+
+def _glyph_layout_supported(obj):
+    """Czy tekst da się złożyć z glifów (jedna linia, bez formatowania i efektów)."""
+    curve = obj.data
+    body = curve.body
+    if not body or "\n" in body or len(obj.modifiers) > 0:
+        return False
+    if curve.align_x not in {'LEFT', 'CENTER', 'RIGHT'} or curve.align_y not in {'TOP_BASELINE', 'BOTTOM_BASELINE'}:
+        return False
+    if (curve.shear != 0.0 or curve.offset_x != 0.0 or curve.offset_y != 0.0
+            or curve.space_character != 1.0 or curve.space_word != 1.0
+            or curve.extrude != 0.0 or curve.bevel_depth != 0.0 or getattr(curve, "offset", 0.0) != 0.0
+            or curve.follow_curve is not None or curve.bevel_object is not None or curve.taper_object is not None):
+        return False
+    # Pola tekstowe i formatowanie znaków nie wchodzą do klucza stylu glifów,
+    # więc tylko ustawienia domyślne (jedno puste pole, bez formatowania)
+    if len(curve.text_boxes) != 1:
+        return False
+    box = curve.text_boxes[0]
+    if box.width != 0.0 or box.height != 0.0 or box.x != 0.0 or box.y != 0.0:
+        return False
+    for fmt in curve.body_format:
+        if (fmt.use_bold or fmt.use_italic or fmt.use_underline or fmt.use_small_caps
+                or getattr(fmt, "kerning", 0) != 0):
+            return False
+    return True
+
+def _convert_text_batch(requests):
+    """Konwertuje teksty (size=1, LEFT) do siatek jedną aktualizacją view layera.
+    
+    requests: lista (klucz, źródłowa krzywa FONT, tekst).
+    Zwraca {klucz: (verts 2D, edges, polygons, polylines)}.
+    """
+    if not requests:
+        return {}
+    scene_coll = bpy.context.scene.collection
+    temp = []
+    results = {}
+    try:
+        for key, src_curve, text in requests:
+            curve = bpy.data.curves.new("MIIX_glyph", 'FONT')
+            curve.body = text
+            curve.font = src_curve.font
+            curve.size = 1.0
+            curve.fill_mode = src_curve.fill_mode
+            curve.resolution_u = src_curve.resolution_u
+            ob = bpy.data.objects.new("MIIX_glyph", curve)
+            scene_coll.objects.link(ob)
+            temp.append((key, ob))
+        
+        bpy.context.view_layer.update()
+        deps = bpy.context.evaluated_depsgraph_get()
+        for key, ob in temp:
+            mesh = bpy.data.meshes.new_from_object(ob.evaluated_get(deps), depsgraph=deps)
+            try:
+                verts = [(v.co.x, v.co.y) for v in mesh.vertices]
+                edges = [tuple(e.vertices) for e in mesh.edges]
+                polygons = [tuple(p.vertices) for p in mesh.polygons]
+                polylines = [[(p.x, p.y) for p in line] for line in _group_connected_edges(mesh)] if edges else []
+                results[key] = (verts, edges, polygons, polylines)
+            finally:
+                bpy.data.meshes.remove(mesh)
+    finally:
+        for key, ob in temp:
+            curve = ob.data
+            bpy.data.objects.remove(ob)
+            bpy.data.curves.remove(curve)
+    return results
+
+def _label_runs(body, style):
+    """Dzieli tekst na znaki z geometrią i odstępy (znaki bez geometrii) między nimi.
+    
+    Zwraca (znaki, odstępy, końcówka) lub None, gdy tekst zaczyna się od znaku
+    bez geometrii (wymagałoby to znajomości jego szerokości).
+    """
+    chars = []
+    gaps = []
+    gap = ""
+    for ch in body:
+        if GLYPH_CACHE.get((style, ch)) is None:
+            if not chars:
+                return None
+            gap += ch
+        else:
+            if chars:
+                gaps.append(gap)
+            chars.append(ch)
+            gap = ""
+    return (chars, gaps, gap) if chars else None
+
+def _pair_offset(pair_verts, first_verts, last_verts, tol=1e-5):
+    """Przesunięcie drugiego glifu w skonwertowanej parze znaków.
+    
+    Kolejność wierzchołków w siatce pary nie jest gwarantowana (wypełnienie
+    trianguluje wszystkie splajny razem), więc przesunięcie wynika z prawej
+    krawędzi obwiedni pary i drugiego glifu. Wynik jest weryfikowany: para musi
+    składać się dokładnie z wierzchołków obu glifów, inaczej zwracane jest None.
+    """
+    if not pair_verts or len(pair_verts) != len(first_verts) + len(last_verts):
+        return None
+    offset = max(x for x, _ in pair_verts) - max(x for x, _ in last_verts)
+    
+    # Dopasowanie wierzchołków pary do oczekiwanych (z tolerancją, przez siatkę komórek)
+    cells = {}
+    for x, y in list(first_verts) + [(x + offset, y) for x, y in last_verts]:
+        cells.setdefault((round(x / tol), round(y / tol)), []).append((x, y))
+    for x, y in pair_verts:
+        cx, cy = round(x / tol), round(y / tol)
+        for cell in ((cx + i, cy + j) for i in (-1, 0, 1) for j in (-1, 0, 1)):
+            candidates = cells.get(cell)
+            match = next((k for k, (ex, ey) in enumerate(candidates or ())
+                          if abs(ex - x) <= tol and abs(ey - y) <= tol), None)
+            if match is not None:
+                candidates.pop(match)
+                break
+        else:
+            return None
+    return offset
+
+def prepare_glyph_cache(font_objects):
+    """Uzupełnia cache glifów i przesunięć dla podanych fontów (max 2 aktualizacje).
+    
+    Musi być wywołane przy ustawionej docelowej resolution_u fontów.
+    Zwraca zbiór nazw obiektów, które można złożyć z glifów.
+    """
+    candidates = [obj for obj in font_objects if obj.type == 'FONT' and _glyph_layout_supported(obj)]
+    
+    # Etap 1: pojedyncze znaki (+ znak referencyjny do pomiaru szerokości)
+    requests = {}
+    for obj in candidates:
+        style = _glyph_style_key(obj.data)
+        for ch in set(obj.data.body) | {GLYPH_REFERENCE_CHAR}:
+            key = (style, ch)
+            if key not in GLYPH_CACHE and key not in requests:
+                requests[key] = (key, obj.data, ch)
+    for key, (verts, edges, polygons, polylines) in _convert_text_batch(list(requests.values())).items():
+        GLYPH_CACHE[key] = (verts, edges, polygons, polylines) if verts else None
+    
+    # Etap 2: przesunięcia kolejnych znaków z geometrią ("a" + odstęp + "b")
+    requests = {}
+    supported = set()
+    for obj in candidates:
+        style = _glyph_style_key(obj.data)
+        runs = _label_runs(obj.data.body, style)
+        if runs is None or GLYPH_CACHE.get((style, GLYPH_REFERENCE_CHAR)) is None:
+            continue
+        chars, gaps, tail = runs
+        pairs = [chars[i] + gaps[i] + chars[i + 1] for i in range(len(gaps))]
+        if obj.data.align_x != 'LEFT':
+            pairs.append(chars[-1] + tail + GLYPH_REFERENCE_CHAR)
+        for text in pairs:
+            key = (style, text)
+            if key not in GLYPH_PAIR_OFFSETS and key not in requests:
+                requests[key] = (key, obj.data, text)
+        supported.add(obj.name)
+    
+    for key, (verts, edges, polygons, polylines) in _convert_text_batch(list(requests.values())).items():
+        style, text = key
+        first = GLYPH_CACHE.get((style, text[0]))
+        last = GLYPH_CACHE.get((style, text[-1]))
+        GLYPH_PAIR_OFFSETS[key] = _pair_offset(verts, first[0], last[0]) if first and last else None
+    
+    return supported
+
+def layout_label_from_glyphs(obj):
+    """Składa geometrię etykiety FONT z cache glifów (współrzędne lokalne obiektu).
+    
+    Zwraca (verts 2D, edges, polygons, polylines) lub None, gdy brakuje
+    danych w cache - wtedy należy użyć pełnej konwersji.
+    """
+    curve = obj.data
+    style = _glyph_style_key(curve)
+    runs = _label_runs(curve.body, style)
+    if runs is None:
+        return None
+    chars, gaps, tail = runs
+    
+    positions = [0.0]
+    for i, gap in enumerate(gaps):
+        offset = GLYPH_PAIR_OFFSETS.get((style, chars[i] + gap + chars[i + 1]))
+        if offset is None:
+            return None
+        positions.append(positions[-1] + offset)
+    
+    shift = 0.0
+    if curve.align_x != 'LEFT':
+        width = GLYPH_PAIR_OFFSETS.get((style, chars[-1] + tail + GLYPH_REFERENCE_CHAR))
+        if width is None:
+            return None
+        width += positions[-1]
+        shift = -width / 2.0 if curve.align_x == 'CENTER' else -width
+    
+    size = curve.size
+    verts, edges, polygons, polylines = [], [], [], []
+    for ch, pos in zip(chars, positions):
+        g_verts, g_edges, g_polygons, g_polylines = GLYPH_CACHE[(style, ch)]
+        dx = pos + shift
+        base = len(verts)
+        verts.extend(((x + dx) * size, y * size) for x, y in g_verts)
+        edges.extend((a + base, b + base) for a, b in g_edges)
+        polygons.extend(tuple(i + base for i in poly) for poly in g_polygons)
+        polylines.extend([((x + dx) * size, y * size) for x, y in line] for line in g_polylines)
+    return verts, edges, polygons, polylines
+
+# --- Tekst jako encje TEXT/MTEXT ----------------------------------------------
+
+FONT_ALIGN_X = {'LEFT': 0, 'CENTER': 1, 'RIGHT': 2, 'JUSTIFY': 0, 'FLUSH': 0}
+FONT_ALIGN_Y = {'TOP_BASELINE': 0, 'BOTTOM_BASELINE': 0, 'BOTTOM': 1, 'CENTER': 2, 'TOP': 3}
+MTEXT_ROW = {'TOP_BASELINE': 0, 'TOP': 0, 'CENTER': 1, 'BOTTOM': 2, 'BOTTOM_BASELINE': 2}
+
+def _ensure_text_style(doc, font):
+    """Zwraca styl tekstu DXF odpowiadający czcionce Blendera (tworzy go przy pierwszym użyciu)."""
+    if font is None:
+        return "Standard"
+    name = "MIIX_" + re.sub(r"[^A-Za-z0-9_-]+", "_", font.name)
+    if name not in doc.styles:
+        path = font.filepath
+        ttf = os.path.basename(bpy.path.abspath(path)) if path and path != "<builtin>" else "arial.ttf"
+        doc.styles.new(name, dxfattribs={"font": ttf})
+    return name
+
+def font_text_spec(doc, obj, to_2d):
+    """Parametry encji TEXT/MTEXT dla obiektu FONT - bez konwersji geometrii.
+    
+    to_2d mapuje punkt świata na punkt 2D rysunku (x, y); wysokość i obrót
+    wynikają z osi obiektu po rzutowaniu, więc uwzględniają skalę eksportu.
+    """
+    curve = obj.data
+    mw = obj.matrix_world
+    m3 = mw.to_3x3()
+    origin = mw.translation + m3 @ Vector((curve.offset_x, curve.offset_y, 0.0))
+    
+    x0, y0 = to_2d(origin)
+    x1, y1 = to_2d(origin + m3 @ Vector((1.0, 0.0, 0.0)))
+    x2, y2 = to_2d(origin + m3 @ Vector((0.0, curve.size, 0.0)))
+    
+    return {
+        'lines': curve.body.split("\n"),
+        'insert': (x0, y0),
+        'height': math.hypot(x2 - x0, y2 - y0),
+        'rotation': math.degrees(math.atan2(y1 - y0, x1 - x0)),
+        'halign': FONT_ALIGN_X.get(curve.align_x, 0),
+        'valign': FONT_ALIGN_Y.get(curve.align_y, 0),
+        'attachment': MTEXT_ROW.get(curve.align_y, 0) * 3 + FONT_ALIGN_X.get(curve.align_x, 0) + 1,
+        'style': _ensure_text_style(doc, curve.font),
+    }
+
+def _add_text_entity(msp, spec, dxfattribs):
+    """Zapisuje tekst jako TEXT (jedna linia) lub MTEXT (wiele linii)."""
+    attribs = dict(dxfattribs)
+    attribs["insert"] = spec['insert']
+    attribs["style"] = spec['style']
+    rotation = round(spec['rotation'], 6)
+    if rotation:
+        attribs["rotation"] = rotation
+    
+    if len(spec['lines']) == 1:
+        if spec['halign'] or spec['valign']:
+            attribs["align_point"] = spec['insert']
+            if spec['halign']:
+                attribs["halign"] = spec['halign']
+            if spec['valign']:
+                attribs["valign"] = spec['valign']
+        attribs["height"] = spec['height']
+        return msp.add_text(spec['lines'][0], dxfattribs=attribs)
+    
+    attribs["char_height"] = spec['height']
+    attribs["attachment_point"] = spec['attachment']
+    escaped = [line.replace("\\", "\\\\").replace("{", "\\{").replace("}", "\\}") for line in spec['lines']]
+    return msp.add_mtext("\\P".join(escaped), dxfattribs=attribs)
+
+def _emit_dxf_entities(msp, entities):
+    """Zapisuje listę encji (rodzaj, dxfattribs, opcje, pętle punktów) do modelspace.
+    
+    Dla 'TEXT' opcjami jest specyfikacja z font_text_spec.
+    
+    Ta sama lista trafia do cache encji (cache_dxf_entities), więc ponowny
+    eksport niezmienionego obiektu tylko ją odtwarza w tym samym miejscu.
+    """
+    for kind, dxfattribs, options, loops in entities:
+        if kind == 'LWPOLYLINE':
+            msp.add_lwpolyline(loops[0], close=options.get('close', False), dxfattribs=dxfattribs)
+        elif kind == 'HATCH':
+            hatch = msp.add_hatch(dxfattribs=dxfattribs)
+            holes = set(options.get('holes', ()))
+            for i, loop in enumerate(loops):
+                if i in holes:
+                    hatch.paths.add_polyline_path(loop, is_closed=True, flags=0)
+                else:
+                    hatch.paths.add_polyline_path(loop, is_closed=True)
+            # set_*_fill nadpisuje kolor - kolor z opcji ustawiany po wypełnieniu
+            if options.get('pattern'):
+                hatch.set_pattern_fill(options['pattern'], scale=options.get('scale', 1.0),
+                                       angle=options.get('angle', 0.0))
+            elif options.get('solid'):
+                hatch.set_solid_fill()
+            if 'color' in options:
+                hatch.dxf.color = options['color']
+            if options.get('true_color') is not None:
+                hatch.dxf.true_color = options['true_color']
+        elif kind == 'TEXT':
+            _add_text_entity(msp, options, dxfattribs)
+
 def _ensure_linetype(doc, name):
     if name in (None, "", "CENTER") or name in doc.linetypes:
         return
@@ -2111,85 +4096,72 @@ def _add_layer(doc, name, color, weight, linetype=None):
         })
 
 def _group_connected_edges(mesh):
-    """Grupuje połączone krawędzie w ciągi dla polilinii."""
-    import bmesh
+    """Grupuje połączone krawędzie w ciągi dla polilinii.
     
-    bm = bmesh.new()
-    bm.from_mesh(mesh)
-    bm.edges.ensure_lookup_table()
-    bm.verts.ensure_lookup_table()
+    Tablica stopni wierzchołków + sąsiedztwo CSR z edges.foreach_get (bez bmesh).
+    Ciągi są maksymalne między rozgałęzieniami / końcami, a pętla zamknięta
+    kończy się powtórzonym pierwszym punktem.
+    """
+    n_edges = len(mesh.edges)
+    n_verts = len(mesh.vertices)
+    if not n_edges:
+        return []
+    
+    ev = array('i', bytes(8 * n_edges))
+    mesh.edges.foreach_get("vertices", ev)
+    co = array('f', bytes(12 * n_verts))
+    mesh.vertices.foreach_get("co", co)
+    
+    # Stopnie wierzchołków i CSR: krawędzie wierzchołka v to adj[offsets[v]:offsets[v + 1]]
+    degree = [0] * n_verts
+    for v in ev:
+        degree[v] += 1
+    offsets = [0] * (n_verts + 1)
+    for v in range(n_verts):
+        offsets[v + 1] = offsets[v] + degree[v]
+    cursor = offsets[:-1]
+    adj = [0] * (2 * n_edges)
+    for e in range(n_edges):
+        for v in (ev[2 * e], ev[2 * e + 1]):
+            adj[cursor[v]] = e
+            cursor[v] += 1
+    
+    used = bytearray(n_edges)
+    
+    def walk(v, e):
+        """Idzie od v przez wierzchołki stopnia 2, zwraca kolejne wierzchołki"""
+        path = []
+        while degree[v] == 2:
+            s = offsets[v]
+            e = adj[s + 1] if adj[s] == e else adj[s]
+            if used[e]:
+                break
+            used[e] = 1
+            a = ev[2 * e]
+            v = ev[2 * e + 1] if a == v else a
+            path.append(v)
+        return path
     
-    visited_edges = set()
     polylines = []
-    
-    for edge in bm.edges:
-        if edge.index in visited_edges:
-                continue
-            
-        # Rozpocznij nową polilinię od tej krawędzi
-        polyline = []
-        current_edge = edge
-        current_vert = current_edge.verts[0]
-        
-        # Idź w jedną stronę
-        while current_edge and current_edge.index not in visited_edges:
-            visited_edges.add(current_edge.index)
-            
-            # Dodaj wierzchołek do polilini
-            if not polyline:
-                polyline.append(current_vert.co.copy())
-            
-            # Znajdź drugi wierzchołek krawędzi
-            other_vert = current_edge.verts[1] if current_edge.verts[0] == current_vert else current_edge.verts[0]
-            polyline.append(other_vert.co.copy())
-            
-            # Znajdź następną połączoną krawędź
-            next_edge = None
-            for next_candidate in other_vert.link_edges:
-                if next_candidate != current_edge and next_candidate.index not in visited_edges:
-                    # Sprawdź czy ma tylko 2 połączone krawędzie (nie rozgałęzienie)
-                    if len([e for e in other_vert.link_edges if e.index not in visited_edges]) <= 2:
-                        next_edge = next_candidate
-                        break
-            
-            current_edge = next_edge
-            current_vert = other_vert
-        
-        # Jeśli mamy tylko jeden punkt, sprawdź czy możemy iść w drugą stronę od początkowego edge
-        if len(polyline) == 2:
-            # Spróbuj iść w drugą stronę od oryginalnej krawędzi
-            current_edge = edge
-            current_vert = edge.verts[1]  # Druga strona
-            temp_polyline = [polyline[0].copy()]  # Zaczynamy od pierwszego punktu
-            
-            # Znajdź krawędzie w drugą stronę
-            while True:
-                found_edge = None
-                for candidate in current_vert.link_edges:
-                    if candidate != edge and candidate.index not in visited_edges:
-                        if len([e for e in current_vert.link_edges if e.index not in visited_edges]) <= 2:
-                            found_edge = candidate
-                            break
-                
-                if not found_edge:
-                    break
-                    
-                visited_edges.add(found_edge.index)
-                other_vert = found_edge.verts[1] if found_edge.verts[0] == current_vert else found_edge.verts[0]
-                temp_polyline.insert(0, other_vert.co.copy())  # Dodaj na początek
-                current_vert = other_vert
-                edge = found_edge
-            
-            if len(temp_polyline) > 1:
-                polyline = temp_polyline + polyline[1:]  # Połącz, unikając duplikacji środkowego punktu
+    for e in range(n_edges):
+        if used[e]:
+            continue
+        used[e] = 1
+        a, b = ev[2 * e], ev[2 * e + 1]
+        if a == b:
+            continue
         
-        if len(polyline) >= 2:
-            polylines.append(polyline)
+        forward = walk(b, e)
+        if forward and forward[-1] == a:
+            chain = [a, b] + forward  # Pętla zamknięta
+        else:
+            chain = walk(a, e)[::-1] + [a, b] + forward
+        polylines.append([Vector(co[3 * v:3 * v + 3]) for v in chain])
     
-    bm.free()
     return polylines
 
 
+@aborts_dxf_stream_on_error
 def export_dxf(ctx, coll):
     if ezdxf is None:
         raise RuntimeError("ezdxf not installed (pip install ezdxf)")
@@ -2268,7 +4240,7 @@ def export_dxf(ctx, coll):
 
     doc = ezdxf.new(setup=True)
     doc.header["$LTSCALE"] = 10
-    msp = doc.modelspace()
+    msp = _dxf_modelspace(ctx, doc, dxf_path)
 
     # Twórz warstwy raz
     for cat in LAYER_CFG.values():
@@ -2287,15 +4259,90 @@ def export_dxf(ctx, coll):
     # Funkcja pomocnicza do mapowania nazw obiektów na warstwy
     def get_layer_for_object(obj):
         """Zwraca konfigurację warstwy dla obiektu."""
-        name = obj.name
-        
-        # Użyj parse_layer_from_name która teraz zwraca pełną konfigurację
-        layer_config = parse_layer_from_name(name)
+        # Klasyfikacja zapisana na obiekcie lub memoizowany parser nazwy
+        layer_config = get_object_layer_config(obj)
         if layer_config:
             return layer_config
         else:
             return {"layer": "0"}
 
+    # Cache encji per kamera: klucz "kamera|obiekt", fingerprint = obiekt + parametry widoku.
+    # Niezmienione obiekty dostają zapisaną listę encji w tym samym miejscu
+    # kolejności rysowania, ponownie generowane są tylko zmienione.
+    # Upraszczanie polilinii: zawsze scalanie współliniowych, opcjonalnie Douglas-Peucker
+    simplify_tol = SIMPLIFY_TOL_M * SCALE_DXF if getattr(ctx.scene, "miixarch_dxf_simplify", False) else 0.0
+    view_key = hashlib.md5(repr((
+        cam.name, [tuple(row) for row in cam.matrix_world],
+        SCALE_DXF, LINE_SCALE, USE_ALTERNATIVE_TRANSFORM, COS_TOL, simplify_tol,
+    )).encode()).hexdigest()
+    entity_stats = {'cached': 0, 'built': 0, 'vertices': 0, 'removed_vertices': 0,
+                    'dedup_segments': 0, 'dedup_pieces': 0}
+    object_fingerprints = {}
+    # Listy encji w kolejności rysowania: (encje, czy linie do deduplikacji)
+    drawing_parts = []
+    
+    def view_fingerprint(part, *objects):
+        """Fingerprint encji części eksportu: obiekty źródłowe + widok (None = bez cache)"""
+        h = hashlib.md5(f"{view_key}|{part}".encode())
+        for ob in objects:
+            fingerprint = object_fingerprints.get(ob.name)
+            if fingerprint is None:
+                fingerprint = object_fingerprints[ob.name] = calculate_object_fingerprint(ob)
+            if not fingerprint:
+                return None
+            h.update(fingerprint.encode())
+        return h.hexdigest()
+    
+    def emit_cached(part, fingerprint, build, lines=False):
+        """Encje z cache (gdy fingerprint się zgadza) albo build() i zapis do cache"""
+        key = f"{cam.name}|{part}"
+        entities = get_cached_entities(key, fingerprint) if fingerprint else None
+        if entities is None:
+            entities = build()
+            entity_stats['built'] += 1
+            if fingerprint:
+                cache_dxf_entities(key, fingerprint, entities)
+        else:
+            entity_stats['cached'] += 1
+        drawing_parts.append((entities, lines))
+    
+    def polyline_entities(ob, polylines, dxf_attribs):
+        """Polilinie (lokalne punkty obiektu) → encje LWPOLYLINE w przestrzeni kamery"""
+        entities = []
+        attribs = {**dxf_attribs, "ltscale": LINE_SCALE}
+        for polyline in polylines:
+            # Transformuj punkty do przestrzeni kamery
+            pts_cam = []
+            for pt in polyline:
+                world_pt = ob.matrix_world @ pt
+                pts_cam.append(transform_func(world_pt))
+            
+            # Sprawdź czy to zamknięta polilinia
+            is_closed = len(pts_cam) > 2 and (abs(pts_cam[0][0] - pts_cam[-1][0]) < 1e-6 and 
+                                             abs(pts_cam[0][1] - pts_cam[-1][1]) < 1e-6)
+            
+            if len(pts_cam) >= 2:
+                simplified = _simplify_polyline(pts_cam, is_closed, tolerance=simplify_tol)
+                # Powtórzony punkt zamykający pętli nie jest osobnym wierzchołkiem
+                n_vertices = len(pts_cam) - 1 if is_closed else len(pts_cam)
+                entity_stats['vertices'] += n_vertices
+                entity_stats['removed_vertices'] += n_vertices - len(simplified)
+                # Zdegenerowana pętla (mniej niż 3 punkty) - jako zwykły odcinek
+                close = is_closed and len(simplified) >= 3
+                if len(simplified) >= 2:
+                    entities.append(('LWPOLYLINE', attribs, {'close': close}, [simplified]))
+        return entities
+    
+    def evaluated_polylines(ob):
+        """Polilinie z ewaluowanego mesh obiektu (z modyfikatorami)"""
+        deps = ctx.evaluated_depsgraph_get()
+        eval_obj = ob.evaluated_get(deps)
+        tmp_mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps, preserve_all_data_layers=False)
+        try:
+            return _group_connected_edges(tmp_mesh) if tmp_mesh.edges else []
+        finally:
+            bpy.data.meshes.remove(tmp_mesh)
+
     # Cache obiektów po typach (wszystkie obiekty MESH - linie dla wszystkich)
     mesh_objects = [ob for ob in coll.objects if ob.type == 'MESH']
     
@@ -2309,115 +4356,95 @@ def export_dxf(ctx, coll):
             # Wyklucz obiekty z _widok i _nad (także po split: nazwa_widok.001, nazwa_nad.002 itd.)
             if '_widok' in ob.name or '_nad' in ob.name:
                 continue
-            layer_config = parse_layer_from_name(ob.name)
+            layer_config = get_object_layer_config(ob)
             if layer_config and layer_config.get("layer", "0") != "0":
                 pattern_objects.append(ob)
     
     transform_func = get_transform_func()
     
+    # Obiekty per warstwa hatchy - sąsiednie ściany jednego materiału
+    # scalane są w jeden region zamiast osobnego hatcha na każdy polygon
+    layer_objects = {}
+    layer_props = {}
     for ob in pattern_objects:
         layer_config = get_layer_for_object(ob)
         if not layer_config:
                 continue
         
-        hatch_layer = layer_config.get("layer", "0")
-        props = layer_config
-        
-        polygon_count = 0
-        for poly in ob.data.polygons:
-            
-            # Transformuj wierzchołki
-            poly2d = []
-            for vi in poly.vertices:
-                world_point = ob.matrix_world @ ob.data.vertices[vi].co
-                x, y = transform_func(world_point)
-                poly2d.append((x, y))
-            
-            # Sprawdź czy polygon nie jest zdegenerowany
-            if len(poly2d) < 3:
-                polygon_count += 1
-                continue
-            
-            # Oblicz bounding box i pole 2D
-            xs = [p[0] for p in poly2d]
-            ys = [p[1] for p in poly2d]
-            bbox_area = (max(xs) - min(xs)) * (max(ys) - min(ys))
-            
-            # Sprawdź pole używając wzoru shoelace
-            def shoelace_area(points):
-                n = len(points)
-                area = 0.0
-                for i in range(n):
-                    j = (i + 1) % n
-                    area += points[i][0] * points[j][1]
-                    area -= points[j][0] * points[i][1]
-                return abs(area) / 2.0
-            
-            shoelace_area_val = shoelace_area(poly2d)
-            
-            if shoelace_area_val < 1e-6:
-                polygon_count += 1
-                continue
+        hatch_layer_name = layer_config.get("layer", "0") + "_h"
+        layer_props.setdefault(hatch_layer_name, layer_config)
+        layer_objects.setdefault(hatch_layer_name, []).append(ob)
     
-            # Tworz hatche dla KAŻDEGO polygonu
-            try:
-                # Dodaj sufiks _h dla warstwy hatchy
-                hatch_layer_name = hatch_layer + "_h"
+    def hatch_entities(hatch_layer_name):
+        """Suma polygonów warstwy → po jednym hatchu SOLID i PATTERN na region"""
+        props = layer_props[hatch_layer_name]
+        polys = []
+        for ob in layer_objects[hatch_layer_name]:
+            for poly in ob.data.polygons:
                 
-                # SOLID
-                sol = msp.add_hatch(dxfattribs={"layer": hatch_layer_name})
-                if isinstance(props.get("solid_color"), tuple):
-                    sol.dxf.true_color = rgb_to_truecolor_int(props["solid_color"])
-                else:
-                    sol.dxf.color = props.get("solid_color", 7)
-                sol.paths.add_polyline_path(poly2d, is_closed=True)
-                    
-                # PATTERN
-                hp = msp.add_hatch(dxfattribs={"layer": hatch_layer_name})
-                hp.paths.add_polyline_path(poly2d, is_closed=True)
-                hp.set_pattern_fill(props.get("pattern", "SOLID"), scale=props.get("scale", 1.0))
-                hp.dxf.color = 256
-
-                hatch_count += 1
+                # Transformuj wierzchołki
+                poly2d = []
+                for vi in poly.vertices:
+                    world_point = ob.matrix_world @ ob.data.vertices[vi].co
+                    x, y = transform_func(world_point)
+                    poly2d.append((x, y))
                 
-            except Exception as e:
-                pass
-        polygon_count += 1
+                # Sprawdź czy polygon nie jest zdegenerowany
+                if len(poly2d) < 3:
+                    continue
+                
+                if abs(_polygon_area_2d(poly2d)) < 1e-6:
+                    continue
+                
+                polys.append(poly2d)
+        
+        try:
+            regions = _union_polygons_2d(polys)
+        except Exception as e:
+            debug_log(f"Błąd sumowania hatchy {hatch_layer_name}: {e}", level='ERROR')
+            regions = [(poly2d, []) for poly2d in polys]
+        
+        if isinstance(props.get("solid_color"), tuple):
+            solid_options = {'true_color': rgb_to_truecolor_int(props["solid_color"])}
+        else:
+            solid_options = {'color': props.get("solid_color", 7)}
+        pattern_options = {'pattern': props.get("pattern", "SOLID"), 'scale': props.get("scale", 1.0), 'color': 256}
+        
+        entities = []
+        attribs = {"layer": hatch_layer_name}
+        for outer, holes in regions:
+            loops = [outer, *holes]
+            hole_indices = list(range(1, len(loops)))
+            # SOLID + PATTERN
+            entities.append(('HATCH', attribs, {**solid_options, 'holes': hole_indices}, loops))
+            entities.append(('HATCH', attribs, {**pattern_options, 'holes': hole_indices}, loops))
+        return entities
+    
+    for hatch_layer_name, obs in layer_objects.items():
+        try:
+            emit_cached(f"hatch|{hatch_layer_name}", view_fingerprint("hatch", *obs),
+                        lambda: hatch_entities(hatch_layer_name))
+            hatch_count += 1
+        except Exception as e:
+            debug_log(f"Błąd hatchy {hatch_layer_name}: {e}", level='ERROR')
     
 
     # PASS 2: LINES jako polilinie - szybko
     for ob in mesh_objects:
         layer_config = get_layer_for_object(ob)
         base_layer = layer_config.get("layer", "0") if isinstance(layer_config, dict) else "0"
-        me = ob.data
         
         # Grupuj połączone krawędzie w polilinie
-        polylines = _group_connected_edges(me)
-        
-        for polyline in polylines:
-            # Transformuj punkty do przestrzeni kamery
-            pts_cam = []
-            for pt in polyline:
-                world_pt = ob.matrix_world @ pt
-                pts_cam.append(transform_func(world_pt))
-            
-            # Sprawdź czy to zamknięta polilinia
-            is_closed = len(pts_cam) > 2 and (abs(pts_cam[0][0] - pts_cam[-1][0]) < 1e-6 and 
-                                             abs(pts_cam[0][1] - pts_cam[-1][1]) < 1e-6)
-            
-            # Dodaj polilinię do DXF
-            if len(pts_cam) >= 2:
-                lwpoly = msp.add_lwpolyline(pts_cam, close=is_closed, 
-                                 dxfattribs={"layer": base_layer})
-                lwpoly.dxf.ltscale = LINE_SCALE
+        emit_cached(f"lines|{ob.name}", view_fingerprint("lines", ob),
+                    lambda: polyline_entities(ob, _group_connected_edges(ob.data), {"layer": base_layer}),
+                    lines=True)
 
     # PASS 3: TEKST - szybko, bez szczegółowego logowania
     text_objects = [o for o in ctx.scene.objects if o.type == 'FONT' and o.visible_get()]
     
-    font_processed = 0
-    for ob in text_objects:
-        # Pobierz właściwości warstwy
-        props = parse_layer_from_name(ob.name)
+    def text_dxf_attribs(ob):
+        """Warstwa (i grubość) dla obiektu tekstowego"""
+        props = get_object_layer_config(ob)
         if props:
             base_layer = props.get("layer", "0")
         elif OPIS_RE.search(_strip(ob.name)):
@@ -2427,278 +4454,318 @@ def export_dxf(ctx, coll):
         else:
             base_layer = "PNK_AR_03_tekst"
         
-        # Ustaw rozdzielczość i konwertuj
-        original_resolution = set_font_resolution(ob)
-        
-        try:
-            deps = ctx.evaluated_depsgraph_get()
-            eval_obj = ob.evaluated_get(deps)
-            tmp_mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps)
-            
+        # Specjalna obsługa dla #Przekrój-opis - ustaw grubość 13
+        dxf_attribs = {"layer": base_layer}
+        if "#przekrój-opis" in ob.name.lower() or "#przekroj-opis" in ob.name.lower():
+            dxf_attribs["lineweight"] = 13
+        return dxf_attribs
+    
+    def text_entities(ob):
+        """Polilinie obrysu tekstu - z cache glifów albo pełnej konwersji"""
+        label = layout_label_from_glyphs(ob) if ob.name in glyph_objects else None
+        if label is not None:
+            polylines = [[Vector((x, y, 0.0)) for x, y in line] for line in label[3]]
+        else:
             # Eksportuj polilinie zamiast pojedynczych krawędzi
-            polylines = _group_connected_edges(tmp_mesh)
-            
-            for polyline in polylines:
-                # Transformuj punkty do przestrzeni kamery
-                pts_cam = []
-                for pt in polyline:
-                    world_pt = ob.matrix_world @ pt
-                    pts_cam.append(transform_func(world_pt))
-                
-                # Sprawdź czy to zamknięta polilinia
-                is_closed = len(pts_cam) > 2 and (abs(pts_cam[0][0] - pts_cam[-1][0]) < 1e-6 and 
-                                                 abs(pts_cam[0][1] - pts_cam[-1][1]) < 1e-6)
-                
-                # Dodaj polilinię do DXF
-                if len(pts_cam) >= 2:
-                    # Specjalna obsługa dla #Przekrój-opis - ustaw grubość 13
-                    dxf_attribs = {"layer": base_layer}
-                    if "#przekrój-opis" in ob.name.lower() or "#przekroj-opis" in ob.name.lower():
-                        dxf_attribs["lineweight"] = 13
-                    
-                    lwpoly = msp.add_lwpolyline(pts_cam, close=is_closed, dxfattribs=dxf_attribs)
-                    lwpoly.dxf.ltscale = LINE_SCALE
-                
-            bpy.data.meshes.remove(tmp_mesh)
-        finally:
-            restore_font_resolution(ob, original_resolution)
-        font_processed += 1
-
-
-    # PASS 4: MEBLE ze sceny - obiektów które nie są w kolekcji roboczej
-    meble_objects = [o for o in ctx.scene.objects if o.type == 'MESH' and o.visible_get() and o.name.startswith('#Meble')]
+            polylines = evaluated_polylines(ob)
+        return polyline_entities(ob, polylines, text_dxf_attribs(ob))
     
-    meble_processed = 0
-    for ob in meble_objects:
-        # Użyj funkcji mapowania warstw
-        layer_config = get_layer_for_object(ob)
-        base_layer = layer_config.get("layer", "0") if isinstance(layer_config, dict) else "0"
-        
-        # Eksportuj krawędzie mesh
-        try:
-            deps = ctx.evaluated_depsgraph_get()
-            eval_obj = ob.evaluated_get(deps)
-            tmp_mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps, preserve_all_data_layers=False)
-            
-            if tmp_mesh.edges:
-                # Eksportuj polilinie zamiast pojedynczych krawędzi
-                polylines = _group_connected_edges(tmp_mesh)
-                
-                for polyline in polylines:
-                    # Transformuj punkty do przestrzeni kamery
-                    pts_cam = []
-                    for pt in polyline:
-                        world_pt = ob.matrix_world @ pt
-                        pts_cam.append(transform_func(world_pt))
-                    
-                    # Sprawdź czy to zamknięta polilinia
-                    is_closed = len(pts_cam) > 2 and (abs(pts_cam[0][0] - pts_cam[-1][0]) < 1e-6 and 
-                                                     abs(pts_cam[0][1] - pts_cam[-1][1]) < 1e-6)
-                    
-                    # Dodaj polilinię do DXF
-                    if len(pts_cam) >= 2:
-                        lwpoly = msp.add_lwpolyline(pts_cam, close=is_closed,
-                                                  dxfattribs={"layer": base_layer})
-                        lwpoly.dxf.ltscale = LINE_SCALE
-                    
-            bpy.data.meshes.remove(tmp_mesh)
-            meble_processed += 1
-        except Exception as e:
-                continue
+    font_processed = 0
+    if getattr(ctx.scene, "miixarch_dxf_text_mode", 'GEOMETRY') == 'TEXT':
+        # Tekst jako encje TEXT/MTEXT - bez konwersji geometrii
+        for ob in text_objects:
+            drawing_parts.append(([('TEXT', text_dxf_attribs(ob), font_text_spec(doc, ob, transform_func), [])], False))
+            font_processed += 1
+    else:
+        # Fingerprinty przed obniżeniem rozdzielczości - konwertowane są tylko zmienione teksty
+        text_parts = []
+        for ob in text_objects:
+            fingerprint = view_fingerprint("text", ob)
+            key = f"{cam.name}|text|{ob.name}"
+            cached = get_cached_entities(key, fingerprint) if fingerprint else None
+            text_parts.append((ob, fingerprint, cached))
+        dirty_texts = [ob for ob, _, cached in text_parts if cached is None]
+        
+        with lowered_font_resolution(dirty_texts):
+            # Etykiety z powtarzalnych glifów składane są z cache, reszta - pełna konwersja
+            glyph_objects = prepare_glyph_cache(dirty_texts)
+            for ob, fingerprint, cached in text_parts:
+                if cached is not None:
+                    drawing_parts.append((cached, False))
+                    entity_stats['cached'] += 1
+                else:
+                    emit_cached(f"text|{ob.name}", fingerprint, lambda: text_entities(ob))
+                font_processed += 1
 
 
-    # PASS 5: OŚ ze sceny - obiektów które nie są w kolekcji roboczej
-    os_objects = [o for o in ctx.scene.objects if o.type == 'MESH' and o.visible_get() and ('#Oś' in o.name or '#Os' in o.name)]
-    
-    os_processed = 0
-    for ob in os_objects:
-        # Użyj funkcji mapowania warstw
-        layer_config = get_layer_for_object(ob)
-        base_layer = layer_config.get("layer", "0") if isinstance(layer_config, dict) else "0"
-        
-        # Eksportuj krawędzie mesh
-        try:
-            deps = ctx.evaluated_depsgraph_get()
-            eval_obj = ob.evaluated_get(deps)
-            tmp_mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps, preserve_all_data_layers=False)
+    # PASS 4-6: MEBLE, OŚ i PRZEKRÓJ ze sceny - obiekty spoza kolekcji roboczej
+    scene_passes = [
+        ("meble", lambda o: o.name.startswith('#Meble')),
+        ("os", lambda o: '#Oś' in o.name or '#Os' in o.name),
+        ("przekroj", lambda o: '#Przekrój' in o.name or '#Przekroj' in o.name),
+    ]
+    for part, matches in scene_passes:
+        pass_objects = [o for o in ctx.scene.objects if o.type == 'MESH' and o.visible_get() and matches(o)]
+        for ob in pass_objects:
+            # Użyj funkcji mapowania warstw
+            layer_config = get_layer_for_object(ob)
+            base_layer = layer_config.get("layer", "0") if isinstance(layer_config, dict) else "0"
             
-            if tmp_mesh.edges:
-                # Eksportuj polilinie zamiast pojedynczych krawędzi
-                polylines = _group_connected_edges(tmp_mesh)
-                
-                for polyline in polylines:
-                    # Transformuj punkty do przestrzeni kamery
-                    pts_cam = []
-                    for pt in polyline:
-                        world_pt = ob.matrix_world @ pt
-                        pts_cam.append(transform_func(world_pt))
-                    
-                    # Sprawdź czy to zamknięta polilinia
-                    is_closed = len(pts_cam) > 2 and (abs(pts_cam[0][0] - pts_cam[-1][0]) < 1e-6 and 
-                                                     abs(pts_cam[0][1] - pts_cam[-1][1]) < 1e-6)
-                    
-                    # Dodaj polilinię do DXF
-                    if len(pts_cam) >= 2:
-                        lwpoly = msp.add_lwpolyline(pts_cam, close=is_closed,
-                                                  dxfattribs={"layer": base_layer})
-                        lwpoly.dxf.ltscale = LINE_SCALE
-                    
-            bpy.data.meshes.remove(tmp_mesh)
-            os_processed += 1
-        except Exception as e:
+            # Eksportuj krawędzie ewaluowanego mesh jako polilinie
+            try:
+                emit_cached(f"{part}|{ob.name}", view_fingerprint(part, ob),
+                            lambda: polyline_entities(ob, evaluated_polylines(ob), {"layer": base_layer}),
+                            lines=True)
+            except Exception as e:
                 continue
-
-
-    # PASS 6: PRZEKRÓJ ze sceny - obiektów które nie są w kolekcji roboczej
-    przekroj_objects = [o for o in ctx.scene.objects if o.type == 'MESH' and o.visible_get() and ('#Przekrój' in o.name or '#Przekroj' in o.name)]
     
-    przekroj_processed = 0
-    for ob in przekroj_objects:
-        # Użyj funkcji mapowania warstw
-        layer_config = get_layer_for_object(ob)
-        base_layer = layer_config.get("layer", "0") if isinstance(layer_config, dict) else "0"
-        
-        # Eksportuj krawędzie mesh
-        try:
-            deps = ctx.evaluated_depsgraph_get()
-            eval_obj = ob.evaluated_get(deps)
-            tmp_mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps, preserve_all_data_layers=False)
-            
-            if tmp_mesh.edges:
-                # Eksportuj polilinie zamiast pojedynczych krawędzi
-                polylines = _group_connected_edges(tmp_mesh)
-                
-                for polyline in polylines:
-                    # Transformuj punkty do przestrzeni kamery
-                    pts_cam = []
-                    for pt in polyline:
-                        world_pt = ob.matrix_world @ pt
-                        pts_cam.append(transform_func(world_pt))
-                    
-                    # Sprawdź czy to zamknięta polilinia
-                    is_closed = len(pts_cam) > 2 and (abs(pts_cam[0][0] - pts_cam[-1][0]) < 1e-6 and 
-                                                     abs(pts_cam[0][1] - pts_cam[-1][1]) < 1e-6)
-                    
-                    # Dodaj polilinię do DXF
-                    if len(pts_cam) >= 2:
-                        lwpoly = msp.add_lwpolyline(pts_cam, close=is_closed,
-                                                  dxfattribs={"layer": base_layer})
-                        lwpoly.dxf.ltscale = LINE_SCALE
-                    
-            bpy.data.meshes.remove(tmp_mesh)
-            przekroj_processed += 1
-        except Exception as e:
-                continue
-
+    # Odcinki pokrywające się między obiektami (ta sama warstwa / reguła konfliktu warstw)
+    dedup_rule = getattr(ctx.scene, "miixarch_dxf_dedup", 'LAYER')
+    if dedup_rule != 'OFF':
+        line_parts = [entities for entities, is_lines in drawing_parts if is_lines]
+        entity_stats['dedup_segments'], entity_stats['dedup_pieces'] = \
+            _dedup_collinear_segments(line_parts, dedup_rule)
+    
+    for entities, _ in drawing_parts:
+        _emit_dxf_entities(msp, entities)
+    
+    debug_log(f"Eksport {cam.name}: {entity_stats['cached']} części z cache encji, "
+              f"{entity_stats['built']} wygenerowanych, uproszczenie: usunięto "
+              f"{entity_stats['removed_vertices']}/{entity_stats['vertices']} wierzchołków, "
+              f"duplikaty: {entity_stats['dedup_segments']} odcinków zastąpiono "
+              f"{entity_stats['dedup_pieces']} kawałkami", level='INFO')
+    DXF_EXPORT_STATS.clear()
+    DXF_EXPORT_STATS.update(entity_stats)
+    # Jeden zbiorczy zapis cache na koniec eksportu (bez części nieużytych przez tę kamerę)
+    save_dxf_cache(prune_prefix=f"{cam.name}|")
 
-    # Polilinie są teraz eksportowane bezpośrednio, nie ma potrzeby łączenia linii
-    # _merge_lines_to_polylines(msp)
 
     # Zapisz
-    doc.saveas(dxf_path, encoding='utf-8')
+    _dxf_save(doc, msp, dxf_path)
     
     # Zakończ debugowanie
     _debug_file = None  # Reset debug file
     
     return dxf_path
 
-# -----------------------------------------------------------------------------
-# Eksport DXF dla obszarów ----------------------------------------------------
-# -----------------------------------------------------------------------------
+# -----------------------------------------------------------------------------
+# Eksport DXF dla obszarów ----------------------------------------------------
+# -----------------------------------------------------------------------------
+
+def all_collections_recursive(parent):
+    """Zwraca generator wszystkich kolekcji zagnieżdżonych w parent (włącznie z parent)."""
+    yield parent
+    for child in parent.children:
+        yield from all_collections_recursive(child)
+
+# --- SYSTEM LOGOWANIA --------------------------------------------------------
+# Komunikaty trafiają do kolejki w pamięci, a zapisem do plików zajmuje się
+# osobny wątek. Eksport nie otwiera więc pliku przy każdym komunikacie.
+# Logowanie jest domyślnie wyłączone (Scene.miixarch_debug_log_enabled).
+
+LOG_LEVELS = {'DEBUG': 10, 'INFO': 20, 'WARNING': 30, 'ERROR': 40}
+
+LOG_CHANNELS = {
+    'miix': ("miix_debug.txt", "DEBUG"),
+    'contours': ("warstwice_debug.txt", "CONTOURS"),
+}
+
+_log_settings = {'enabled': False, 'level': LOG_LEVELS['INFO'], 'directory': ""}
+_log_queue = queue.Queue()
+_log_thread = None
+_LOG_STOP = object()
+_LOG_BATCH = 500
+
+def get_debug_log_path(channel='miix'):
+    """Zwraca ścieżkę pliku logu dla kanału (domyślnie katalog tymczasowy systemu)"""
+    directory = _log_settings['directory'] or tempfile.gettempdir()
+    return os.path.join(directory, LOG_CHANNELS[channel][0])
+
+def debug_log_enabled(level='DEBUG'):
+    """Sprawdza czy komunikat o danym poziomie zostałby zapisany"""
+    return _log_settings['enabled'] and LOG_LEVELS.get(level, 10) >= _log_settings['level']
+
+def _log_writer():
+    """Wątek zapisujący - zbiera komunikaty z kolejki i zapisuje je paczkami"""
+    while True:
+        item = _log_queue.get()
+        batch = [item]
+        while len(batch) < _LOG_BATCH:
+            try:
+                batch.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        
+        lines_by_path = {}
+        stop = False
+        for entry in batch:
+            if entry is _LOG_STOP:
+                stop = True
+                continue
+            kind, path, payload = entry
+            if kind == 'reset':
+                lines_by_path.pop(path, None)
+                try:
+                    if os.path.exists(path):
+                        os.remove(path)
+                except OSError:
+                    pass
+                continue
+            timestamp, prefix, level, message = payload
+            ms = int((timestamp % 1) * 1000)
+            stamp = time.strftime("%H:%M:%S", time.localtime(timestamp)) + f".{ms:03d}"
+            lines_by_path.setdefault(path, []).append(f"[{stamp}] [{level}] {message}\n")
+            print(f"[{prefix}] {message}")
+        
+        for path, lines in lines_by_path.items():
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+            except OSError:
+                pass
+        
+        if stop:
+            return
+
+def _ensure_log_writer():
+    global _log_thread
+    if _log_thread is None or not _log_thread.is_alive():
+        _log_thread = threading.Thread(target=_log_writer, name="MIIX-log-writer", daemon=True)
+        _log_thread.start()
+
+def configure_debug_log(enabled=None, level=None, directory=None):
+    """Ustawia parametry logowania (wywoływane z właściwości sceny)"""
+    if enabled is not None:
+        _log_settings['enabled'] = bool(enabled)
+    if level is not None:
+        _log_settings['level'] = LOG_LEVELS.get(level, LOG_LEVELS['INFO'])
+    if directory is not None:
+        _log_settings['directory'] = bpy.path.abspath(directory) if directory else ""
+
+def configure_debug_log_from_scene(scene):
+    """Przenosi ustawienia logowania ze sceny do loggera"""
+    if not hasattr(scene, 'miixarch_debug_log_enabled'):
+        return
+    configure_debug_log(scene.miixarch_debug_log_enabled,
+                        scene.miixarch_debug_log_level,
+                        scene.miixarch_debug_log_dir)
+
+def update_debug_log_settings(self, context):
+    configure_debug_log_from_scene(context.scene)
+
+def reset_debug_log(channel='miix'):
+    """Czyści plik logu kanału przed nowym eksportem"""
+    if not _log_settings['enabled']:
+        return
+    _ensure_log_writer()
+    _log_queue.put(('reset', get_debug_log_path(channel), None))
+
+def shutdown_debug_log(timeout=2.0):
+    """Zapisuje zaległe komunikaty i zatrzymuje wątek zapisujący"""
+    global _log_thread
+    if _log_thread is not None and _log_thread.is_alive():
+        _log_queue.put(_LOG_STOP)
+        _log_thread.join(timeout)
+    _log_thread = None
+
+def _enqueue_log(channel, message, level):
+    if not debug_log_enabled(level):
+        return
+    _ensure_log_writer()
+    _log_queue.put(('line', get_debug_log_path(channel),
+                    (time.time(), LOG_CHANNELS[channel][1], level, message)))
+
+def debug_log(message, level='DEBUG'):
+    """Zapisuje komunikat debugowania (asynchronicznie, tylko gdy logowanie jest włączone)"""
+    _enqueue_log('miix', message, level)
 
-def all_collections_recursive(parent):
-    """Zwraca generator wszystkich kolekcji zagnieżdżonych w parent (włącznie z parent)."""
-    yield parent
-    for child in parent.children:
-        yield from all_collections_recursive(child)
+def debug_contours_log(message, level='DEBUG'):
+    """Zapisuje komunikat debugowania warstwic do osobnego pliku"""
+    _enqueue_log('contours', message, level)
 
-def debug_log(message):
-    """Zapisuje komunikaty debugowania do pliku txt"""
-    import os
-    import datetime
-    
-    # Ścieżka do pliku debug na Desktop
-    debug_file = "/Users/michalmalewczyk/Desktop/miix_debug.txt"
-    
-    timestamp = datetime.datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    with open(debug_file, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
-    
-    # Również wypisz do konsoli
-    print(f"[DEBUG] {message}")
-
-def debug_contours_log(message):
-    """Zapisuje komunikaty debugowania warstwic do osobnego pliku"""
-    import os
-    import datetime
-    
-    # Ścieżka do pliku debug warstwic na Desktop
-    debug_file = "/Users/michalmalewczyk/Desktop/warstwice_debug.txt"
-    
-    timestamp = datetime.datetime.now().strftime("%H:%M:%S.%f")[:-3]
-    with open(debug_file, "a", encoding="utf-8") as f:
-        f.write(f"[{timestamp}] {message}\n")
-    
-    # Również wypisz do konsoli
-    print(f"[CONTOURS] {message}")
-
-def temporarily_disable_handlers():
-    """Tymczasowo wyłącza handlery podczas eksportu"""
-    disabled_handlers = []
-    
-    # Lista handlerów do wyłączenia
-    handlers_to_disable = [
-        'update_etykieta_rectangles',
-        'update_ogrod_deszczowy_properties', 
-        'auto_create_etykieta_mesh_objects',
-        'auto_create_ogrod_deszczowy_labels',
-        'update_ogrod_deszczowy_labels',
-        'secure_opis_poziom_positions',
-        'update_poziom_texts',
-        'update_rzedna_texts',
-        'update_spadek_texts',
-        'auto_create_opis_spadek_text_objects',
-        'update_surface_text_objects',
-        'update_lokal_summary_text_objects'
-    ]
-    
-    # Usuń handlery z depsgraph_update_post
-    for handler in bpy.app.handlers.depsgraph_update_post[:]:
-        if hasattr(handler, '__name__') and handler.__name__ in handlers_to_disable:
-            bpy.app.handlers.depsgraph_update_post.remove(handler)
-            disabled_handlers.append(('post', handler))
-            print(f"[DEBUG] Wyłączono handler: {handler.__name__}")
-    
-    # Usuń handlery z depsgraph_update_pre
-    for handler in bpy.app.handlers.depsgraph_update_pre[:]:
-        if hasattr(handler, '__name__') and handler.__name__ in handlers_to_disable:
-            bpy.app.handlers.depsgraph_update_pre.remove(handler)
-            disabled_handlers.append(('pre', handler))
-            print(f"[DEBUG] Wyłączono handler: {handler.__name__}")
-    
-    return disabled_handlers
-
-def restore_handlers(disabled_handlers):
-    """Przywraca wyłączone handlery"""
-    for handler_type, handler in disabled_handlers:
-        if handler_type == 'post':
-            bpy.app.handlers.depsgraph_update_post.append(handler)
-        else:
-            bpy.app.handlers.depsgraph_update_pre.append(handler)
-        print(f"[DEBUG] Przywrócono handler: {handler.__name__}")
+@persistent
+def sync_debug_log_on_load(dummy):
+    """Wczytuje ustawienia logowania z otwieranego pliku"""
+    try:
+        configure_debug_log_from_scene(bpy.context.scene)
+    except Exception:
+        pass
+
+# Zawieszanie handlerów depsgraph dodatku na czas operacji masowych.
+# Handlery rozpoznawane po module (bez ręcznej listy nazw), blok jest zagnieżdżalny.
+_handler_suspension = {"depth": 0, "removed": [], "catch_up": False}
+DEPSGRAPH_HANDLER_LISTS = ("depsgraph_update_pre", "depsgraph_update_post")
 
+def _run_handler_once(handler, scene):
+    """Wywołuje handler depsgraph poza depsgraphem (przebieg nadrabiający)"""
+    code = getattr(handler, "__code__", None)
+    if code is not None and code.co_argcount >= 2:
+        handler(scene, bpy.context.evaluated_depsgraph_get())
+    else:
+        handler(scene)
+
+@contextmanager
+def suspended_handlers(catch_up=True):
+    """Zawiesza handlery depsgraph tego dodatku na czas bloku.
+    
+    Zagnieżdżone bloki tylko zwiększają licznik - handlery wracają na swoje
+    miejsca przy wyjściu z zewnętrznego bloku, także po wyjątku. Jeśli któryś
+    poziom prosił o catch_up, każdy zawieszony handler jest wtedy wywołany raz.
+    """
+    state = _handler_suspension
+    if state["depth"] == 0:
+        state["catch_up"] = False
+        for kind in DEPSGRAPH_HANDLER_LISTS:
+            handlers = getattr(bpy.app.handlers, kind)
+            for index in reversed(range(len(handlers))):
+                handler = handlers[index]
+                if getattr(handler, "__module__", None) == __name__:
+                    del handlers[index]
+                    state["removed"].append((kind, index, handler))
+    state["depth"] += 1
+    state["catch_up"] = state["catch_up"] or catch_up
+    try:
+        yield
+    finally:
+        state["depth"] -= 1
+        if state["depth"] == 0:
+            removed = sorted(state["removed"], key=lambda r: (DEPSGRAPH_HANDLER_LISTS.index(r[0]), r[1]))
+            state["removed"] = []
+            try:
+                # Nadrabianie jeszcze przy odpiętych handlerach - zmiany, które robią,
+                # nie wywołają ich ponownie przez depsgraph
+                scene = bpy.context.scene
+                if state["catch_up"] and scene is not None:
+                    for kind, index, handler in removed:
+                        try:
+                            _run_handler_once(handler, scene)
+                        except Exception as e:
+                            debug_log(f"Błąd handlera {getattr(handler, '__name__', handler)}: {e}", level='ERROR')
+            finally:
+                for kind, index, handler in removed:
+                    handlers = getattr(bpy.app.handlers, kind)
+                    if handler not in handlers:
+                        handlers.insert(min(index, len(handlers)), handler)
+
+def suspends_handlers(execute):
+    """Dekorator execute operatora masowego - całość w suspended_handlers()"""
+    @functools.wraps(execute)
+    def wrapper(self, context):
+        with suspended_handlers():
+            return execute(self, context)
+    return wrapper
+
+@aborts_dxf_stream_on_error
 def export_obszar_dxf_new(ctx):
     """Nowa funkcja eksportu DXF z Z-order i per-object properties"""
     if ezdxf is None:
         raise RuntimeError("ezdxf not installed (pip install ezdxf)")
 
     # Wyczyść poprzedni log i rozpocznij nowy
-    import os
-    debug_file = "/Users/michalmalewczyk/Desktop/miix_debug.txt"
-    if os.path.exists(debug_file):
-        os.remove(debug_file)
+    reset_debug_log('miix')
     
-    debug_log("=== ROZPOCZYNAM NOWY EKSPORT DXF Z Z-ORDER ===")
+    debug_log("=== ROZPOCZYNAM NOWY EKSPORT DXF Z Z-ORDER ===", level='INFO')
     
     # Pobierz wszystkie widoczne obiekty MESH i FONT
     visible_objects = []
@@ -2722,16 +4789,17 @@ def export_obszar_dxf_new(ctx):
         return (0 if is_opis else 1, -z_coord)
     
     sorted_objects = sorted(visible_objects, key=sort_key)
-    debug_log(f"Posortowano obiekty wg Z-order:")
-    for i, obj in enumerate(sorted_objects):
-        debug_log(f"  {i+1}. {obj.name} Z={obj.location.z:.3f} {'(#Opis*)' if obj.name.startswith('#Opis') else ''}")
+    if debug_log_enabled():
+        debug_log(f"Posortowano obiekty wg Z-order:")
+        for i, obj in enumerate(sorted_objects):
+            debug_log(f"  {i+1}. {obj.name} Z={obj.location.z:.3f} {'(#Opis*)' if obj.name.startswith('#Opis') else ''}")
 
     # Ustawienia DXF
     directory = os.path.dirname(bpy.path.abspath(ctx.scene.render.filepath)) or bpy.path.abspath('//') or os.getcwd()
     dxf_path = os.path.join(directory, f"{ctx.view_layer.name}.dxf")
     doc = ezdxf.new(setup=True)
     doc.header["$LTSCALE"] = 0.5
-    msp = doc.modelspace()
+    msp = _dxf_modelspace(ctx, doc, dxf_path)
 
     # Twórz typy linii
     def create_linetype(name, pattern, description):
@@ -2746,369 +4814,290 @@ def export_obszar_dxf_new(ctx):
     create_linetype("DASHDOT2", [2.5, -1.25, 0.5, -1.25], "Dash dot line 2")
     create_linetype("DOTTED", [0.5, -0.5], "Dotted line")
     
-    # Twórz warstwy z ustawień sceny (jeśli są) lub z domyślnych OBSZARY_LAYERS
-    def create_dxf_layers():
-        scene_layers = ctx.scene.miixarch_dxf_layers
-        if len(scene_layers) > 0:
-            # Użyj warstw z ustawień sceny
-            debug_log(f"Używam {len(scene_layers)} warstw z ustawień sceny")
-            for layer_prop in scene_layers:
-                line_color = layer_prop.line_color_index if layer_prop.line_color_type == 'INDEX' else layer_prop.line_color_rgb
-                _add_obszar_layer(doc, layer_prop.name, line_color, layer_prop.line_weight, None)
-        else:
-            # Fallback do domyślnych warstw OBSZARY_LAYERS
-            debug_log("Używam domyślnych warstw z OBSZARY_LAYERS")
+    # Twórz warstwy z ustawień sceny (jeśli są), potem brakujące z domyślnych OBSZARY_LAYERS
+    scene_layers = {layer.name: layer for layer in ctx.scene.miixarch_dxf_layers}
+    debug_log(f"Używam {len(scene_layers)} warstw z ustawień sceny")
+    for layer_prop in scene_layers.values():
+        index, rgb = _resolve_layer_color(layer_prop.line_color_type, layer_prop.line_color_index,
+                                          layer_prop.line_color_rgb, layer_prop.line_color_proneko)
+        _add_obszar_layer(doc, layer_prop.name, rgb if rgb is not None else index, layer_prop.line_weight, None)
     for layer_name, layer_cfg in OBSZARY_LAYERS.items():
         _add_obszar_layer(doc, layer_cfg["layer"], layer_cfg.get("color", 7), 
                          layer_cfg.get("weight", 13), layer_cfg.get("linetype"))
-
-    create_dxf_layers()
     
-    # Funkcje pomocnicze dla per-object properties
-    def get_layer_properties(obj):
-        """Pobiera właściwości warstwy dla obiektu"""
+    # Tabela rozwiązanych warstw: klucz warstwy → ObszarLayerStyle (liczona raz na eksport)
+    layer_styles = {}
+    
+    def resolve_layer_style(obj):
+        """Warstwa obiektu: Custom Property, potem typ obszaru z nazwy/kolekcji"""
         layer_name = get_object_dxf_layer(obj)
-        if layer_name:
-            # Znajdź warstwę z ustawień sceny po nazwie
-            scene_layers = ctx.scene.miixarch_dxf_layers
-            for layer in scene_layers:
-                if layer.name == layer_name:
-                    return layer
-        
-        # Fallback - znajdź warstwę z OBSZARY_LAYERS na podstawie nazwy/kolekcji
-        return get_fallback_layer_properties(obj)
-    
-    def get_fallback_layer_properties(obj):
-        """Fallback do automatycznego określania warstwy na podstawie nazwy/kolekcji"""
-        obszar_type = get_obszar_type_from_object_name(obj.name)
-        if not obszar_type and obj.users_collection:
-            obszar_type = get_obszar_type_from_collection(obj.users_collection[0].name)
-        
-        if obszar_type and obszar_type in OBSZARY_LAYERS:
-            layer_cfg = OBSZARY_LAYERS[obszar_type]
-            # Zwróć dane w formacie podobnym do MIIXARCH_LayerProperty
-            class FallbackLayer:
-                def __init__(self, cfg):
-                    self.name = cfg.get("layer", "0")
-                    self.line_color_type = 'RGB' if isinstance(cfg.get("color"), tuple) else 'INDEX'
-                    self.line_color_index = cfg.get("color", 7) if not isinstance(cfg.get("color"), tuple) else 7
-                    self.line_color_rgb = tuple(c/255.0 for c in cfg.get("color", (255,255,255))) if isinstance(cfg.get("color"), tuple) else (1,1,1)
-                    self.hatch_color_type = self.line_color_type
-                    self.hatch_color_index = self.line_color_index
-                    self.hatch_color_rgb = self.line_color_rgb
-                    self.line_weight = cfg.get("weight", 13)
-                    self.hatch_pattern = cfg.get("hatch_pattern", "SOLID")
-                    self.hatch_scale = cfg.get("hatch_scale", 1.0)
-                    self.hatch_rotation = cfg.get("hatch_rotation", 0.0)
-            return FallbackLayer(layer_cfg)
-        
-        # Domyślna warstwa
-        class DefaultLayer:
-            name = "0"
-            line_color_type = 'INDEX'
-            line_color_index = 7
-            line_color_rgb = (1,1,1)
-            hatch_color_type = 'INDEX'
-            hatch_color_index = 7
-            hatch_color_rgb = (1,1,1)
-            line_weight = 13
-            hatch_pattern = "SOLID"
-            hatch_scale = 1.0
-            hatch_rotation = 0.0
-        return DefaultLayer()
+        if layer_name and layer_name in scene_layers:
+            key = ('SCENE', layer_name)
+        else:
+            obszar_type = get_obszar_type_from_object_name(obj.name)
+            if not obszar_type and obj.users_collection:
+                obszar_type = get_obszar_type_from_collection(obj.users_collection[0].name)
+            key = ('CFG', obszar_type) if obszar_type in OBSZARY_LAYERS else ('DEFAULT', None)
+        
+        style = layer_styles.get(key)
+        if style is None:
+            if key[0] == 'SCENE':
+                style = ObszarLayerStyle.from_scene_layer(doc, scene_layers[key[1]])
+            elif key[0] == 'CFG':
+                style = ObszarLayerStyle.from_config(doc, OBSZARY_LAYERS[key[1]])
+            else:
+                style = ObszarLayerStyle(doc, "0", (7, None), (7, None))
+            layer_styles[key] = style
+        return style
+
+    object_styles = {}
+    for obj in sorted_objects:
+        try:
+            object_styles[obj.name] = resolve_layer_style(obj)
+        except (AttributeError, ReferenceError, RuntimeError) as e:
+            debug_log(f"Błąd ustalania warstwy {obj.name}: {e}", level='ERROR')
+    debug_log(f"Rozwiązano {len(layer_styles)} warstw dla {len(object_styles)} obiektów")
 
     SCALE = 1.0  # Bez skalowania dla obszarów
     
-    # Funkcje eksportu dla różnych typów obiektów
-    def export_mesh_object(obj, layer_props, msp, doc, ctx, export_mode='both'):
-        """Eksportuje obiekt MESH z użyciem per-object properties
-        export_mode: 'hatches', 'edges', 'both'
-        """
+    # Każdy obiekt jest ewaluowany tylko raz do rekordu 2D:
+    #   'hatches' - lista wysp [(obrys, [otwory]), ...]
+    #   'solid'   - True gdy hatche zawsze pełne (fonty)
+    #   'lines'   - spakowane odcinki x1, y1, x2, y2, ...
+    # Przebiegi 1-4 tylko zapisują rekordy w wymaganej kolejności.
+    def mesh_to_2d(obj, mesh):
+        """Wierzchołki mesh w 2D (XY świata)"""
+        mw = obj.matrix_world
+        verts2d = []
+        for v in mesh.vertices:
+            p = mw @ v.co
+            verts2d.append((p.x * SCALE, p.y * SCALE))
+        return verts2d
+    
+    # Fingerprinty liczone przed obniżeniem rozdzielczości fontów (klucz cache)
+    fingerprints = {}
+    
+    def cached_record(obj):
+        """Rekord 2D z cache geometrii (None gdy brak lub obiekt zmieniony)"""
+        fingerprint = calculate_object_fingerprint(obj)
+        fingerprints[obj.name] = fingerprint
+        cached_data = get_cached_geometry(obj, fingerprint) if fingerprint else None
+        return unpack_dxf_record(cached_data) if cached_data is not None else None
+    
+    def cache_record(obj, record, export_type):
+        """Zapisuje rekord 2D (światowe XY) do cache geometrii"""
+        fingerprint = fingerprints.get(obj.name)
+        if fingerprint:
+            cache_object_geometry(obj, dict(pack_dxf_record(record), export_type=export_type), fingerprint)
+    
+    def evaluate_mesh_object(obj):
+        """Ewaluuje obiekt MESH do rekordu 2D wg per-object properties"""
+        debug_log(f"  Przetwarzam mesh dla {obj.name} (brak cache lub zmieniony)")
+        
         # Pobierz ustawienia z Custom Properties
         export_hatches = get_object_hatches(obj)
         export_boundary_edges = get_object_boundary_edges(obj)
         export_internal_edges = get_object_internal_edges(obj)
         
-        # Sprawdź cache
-        cached_data = get_cached_geometry(obj)
-        
-        if cached_data:
-            debug_log(f"  Używam cached mesh dla {obj.name}")
-        else:
-            debug_log(f"  Przetwarzam mesh dla {obj.name} (brak cache lub zmieniony)")
-        
-        # Zawsze twórz mesh - cache zostanie zaimplementowany później
         deps = ctx.evaluated_depsgraph_get()
         eval_obj = obj.evaluated_get(deps)
         try:
             mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps)
         except Exception as e:
-            debug_log(f"  Błąd tworzenia mesh dla {obj.name}: {e}")
-            return
-            
+            debug_log(f"  Błąd tworzenia mesh dla {obj.name}: {e}", level='ERROR')
+            return None
+        
+        record = {'hatches': [], 'solid': False, 'lines': []}
         try:
-            # Eksportuj hatches (jeśli włączone i w odpowiednim trybie)
-            if (export_mode in ['hatches', 'both']) and export_hatches and mesh.polygons:
-                debug_log(f"  Eksportuję {len(mesh.polygons)} hatches")
-                for poly in mesh.polygons:
-                    pts = [obj.matrix_world @ mesh.vertices[i].co for i in poly.vertices]
-                    poly2d = [(p.x * SCALE, p.y * SCALE) for p in pts]
-                    
-                    hatch = msp.add_hatch(dxfattribs={"layer": layer_props.name})
-                    hatch.paths.add_polyline_path(poly2d, is_closed=True)
-                    
-                    # Ustawienia hatchu z właściwości warstwy
-                    if layer_props.hatch_pattern == "SOLID":
-                        hatch.set_solid_fill()
-                    else:
-                        hatch.set_pattern_fill(layer_props.hatch_pattern, 
-                         scale=layer_props.hatch_scale,
-                         angle=layer_props.hatch_rotation)
-                    
-                    # Kolor hatchu
-                    if layer_props.hatch_color_type == 'RGB':
-                        hatch.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in layer_props.hatch_color_rgb])
-                    elif layer_props.hatch_color_type == 'PRONEKO':
-                        proneko_rgb = get_proneko_color_rgb(layer_props.hatch_color_proneko)
-                        hatch.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in proneko_rgb])
-                    else:
-                        hatch.dxf.color = layer_props.hatch_color_index
+            verts2d = mesh_to_2d(obj, mesh)
             
-            # Eksportuj krawędzie (jeśli w odpowiednim trybie)
-            if export_mode in ['edges', 'both']:
-                mesh.calc_loop_triangles()
+            # Jeden hatch na wyspę ścian (obrys + otwory) zamiast na polygon
+            if export_hatches and mesh.polygons:
+                record['hatches'] = _mesh_face_islands(mesh, verts2d.__getitem__)
+                debug_log(f"  {len(mesh.polygons)} polygonów → {len(record['hatches'])} wysp hatchy")
+            
+            if export_boundary_edges or export_internal_edges:
+                # Liczba ścian przy każdej krawędzi - jeden przebieg po polygonach
+                face_count = {}
+                for poly in mesh.polygons:
+                    for key in poly.edge_keys:
+                        face_count[key] = face_count.get(key, 0) + 1
                 
-                # Krawędzie brzegowe
-                if export_boundary_edges:
-                    debug_log(f"  Eksportuję krawędzie brzegowe")
-                    for edge in mesh.edges:
-                        # Sprawdź czy krawędź jest brzegowa (połączona z <= 1 ścianą)
-                        v1, v2 = edge.vertices
-                        connected_faces = [poly for poly in mesh.polygons if v1 in poly.vertices and v2 in poly.vertices]
-                        
-                        if len(connected_faces) <= 1:  # Brzegowe lub wolne krawędzie
-                            p1 = obj.matrix_world @ mesh.vertices[v1].co
-                            p2 = obj.matrix_world @ mesh.vertices[v2].co
-                            
-                            line = msp.add_line(
-                                (p1.x * SCALE, p1.y * SCALE),
-                                (p2.x * SCALE, p2.y * SCALE),
-                                dxfattribs={"layer": layer_props.name}
-                            )
-                            
-                            # Kolor linii
-                            if layer_props.line_color_type == 'RGB':
-                                line.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in layer_props.line_color_rgb])
-                            elif layer_props.line_color_type == 'PRONEKO':
-                                proneko_rgb = get_proneko_color_rgb(layer_props.line_color_proneko)
-                                line.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in proneko_rgb])
+                boundary = []
+                internal = []
+                for edge in mesh.edges:
+                    v1, v2 = edge.vertices
+                    # Brzegowe lub wolne krawędzie (<= 1 ściana) / wewnętrzne (> 1)
+                    target = boundary if face_count.get(edge.key, 0) <= 1 else internal
+                    target.extend(verts2d[v1])
+                    target.extend(verts2d[v2])
                 
-                # Krawędzie wewnętrzne
+                if export_boundary_edges:
+                    debug_log(f"  Krawędzie brzegowe: {len(boundary) // 4}")
+                    record['lines'].extend(boundary)
                 if export_internal_edges:
-                    debug_log(f"  Eksportuję krawędzie wewnętrzne")
-                    for edge in mesh.edges:
-                        # Sprawdź czy krawędź jest wewnętrzna (połączona z > 1 ścianą)
-                        v1, v2 = edge.vertices
-                        connected_faces = [poly for poly in mesh.polygons if v1 in poly.vertices and v2 in poly.vertices]
-                        
-                        if len(connected_faces) > 1:  # Krawędzie wewnętrzne
-                            p1 = obj.matrix_world @ mesh.vertices[v1].co
-                            p2 = obj.matrix_world @ mesh.vertices[v2].co
-                            
-                            line = msp.add_line(
-                                (p1.x * SCALE, p1.y * SCALE),
-                                (p2.x * SCALE, p2.y * SCALE),
-                                dxfattribs={"layer": layer_props.name}
-                            )
-                        if layer_props.line_color_type == 'RGB':
-                            line.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in layer_props.line_color_rgb])
-                        elif layer_props.line_color_type == 'PRONEKO':
-                            proneko_rgb = get_proneko_color_rgb(layer_props.line_color_proneko)
-                            line.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in proneko_rgb])
-                        else:
-                            line.dxf.color = layer_props.line_color_index
+                    debug_log(f"  Krawędzie wewnętrzne: {len(internal) // 4}")
+                    record['lines'].extend(internal)
         
+            cache_record(obj, record, 'mesh')
         except Exception as e:
-            debug_log(f"  Błąd eksportu mesh {obj.name}: {e}")
+            debug_log(f"  Błąd eksportu mesh {obj.name}: {e}", level='ERROR')
         finally:
-            if mesh:
-                # Zapisz do cache przed usunięciem mesh
-                if not cached_data:
-                    debug_log(f"  Zapisuję mesh {obj.name} do cache")
-                    geometry_data = {
-                        'vertices': [(v.co.x, v.co.y, v.co.z) for v in mesh.vertices],
-                        'edges': [(e.vertices[0], e.vertices[1]) for e in mesh.edges],
-                        'polygons': [list(p.vertices) for p in mesh.polygons],
-                        'export_type': 'mesh'
-                    }
-                    cache_object_geometry(obj, geometry_data)
-                
-                bpy.data.meshes.remove(mesh)
-                
-    def export_font_object(obj, layer_props, msp, doc, ctx, export_mode='both'):
-        """Eksportuje obiekt FONT jako mesh krawędzie (zachowuje formatowanie)
-        export_mode: 'hatches', 'edges', 'both'
-        """
+            bpy.data.meshes.remove(mesh)
         
-        # DIAGNOSTYKA: sprawdź podstawowe właściwości obiektu font
-        debug_log(f"  Font {obj.name}: data.body='{getattr(obj.data, 'body', 'BRAK')}', visible={obj.visible_get()}")
+        return record
+    
+    def font_to_mesh(obj):
+        """Konwertuje FONT do mesh z zachowaniem formatowania (None gdy brak geometrii)"""
+        # Pobierz evaluated object z dependency graph
+        deps = ctx.evaluated_depsgraph_get()
+        eval_obj = obj.evaluated_get(deps)
         
-        # Sprawdź cache dla fontów
-        cached_data = get_cached_geometry(obj)
+        # Sprawdź czy obiekt ma geometrię
+        if eval_obj is None:
+            debug_log(f"  Font {obj.name}: brak evaluated object")
+            return None
         
-        if cached_data:
-            debug_log(f"  Używam cached font mesh dla {obj.name}")
-        else:
-            debug_log(f"  Przetwarzam font {obj.name} (brak cache lub zmieniony)")
+        # Konwertuj do mesh
+        mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps)
         
-        # OPTYMALIZACJA: Obniż resolution_u dla przyspieszenia eksportu
-        original_resolution_u = None
-        if hasattr(obj.data, 'resolution_u'):
-            original_resolution_u = obj.data.resolution_u
-            obj.data.resolution_u = 2
-            debug_log(f"  Font {obj.name}: resolution_u zmieniona z {original_resolution_u} na 2")
+        debug_log(f"  Font {obj.name} → mesh: {len(mesh.vertices)} vertices, {len(mesh.edges)} edges, {len(mesh.polygons)} polygons")
         
-        # WYMUSZENIE AKTUALIZACJI SCENY dla poprawnej konwersji
-        try:
-            bpy.context.view_layer.update()
-        except:
-            pass
+        if len(mesh.vertices) > 0:
+            return mesh
         
-        # KONWERSJA DO MESH z zachowaniem formatowania
+        debug_log(f"  Font {obj.name}: brak vertices - sprawdzam alternatywne metody")
+        bpy.data.meshes.remove(mesh)
+        
+        # ALTERNATYWNA METODA: Spróbuj convert to mesh w kontekście
         try:
-            # Pobierz evaluated object z dependency graph
-            deps = ctx.evaluated_depsgraph_get()
-            eval_obj = obj.evaluated_get(deps)
+            # Duplikuj obiekt tymczasowo dla konwersji
+            temp_obj = obj.copy()
+            temp_obj.data = obj.data.copy()
             
-            # Sprawdź czy obiekt ma geometrię
-            if eval_obj is None:
-                debug_log(f"  Font {obj.name}: brak evaluated object")
-                return
+            # Dodaj do sceny tymczasowo
+            bpy.context.collection.objects.link(temp_obj)
+            bpy.context.view_layer.update()
             
-            # Konwertuj do mesh
-            mesh = bpy.data.meshes.new_from_object(eval_obj, depsgraph=deps)
+            # Konwertuj używając modifiers
+            temp_obj.select_set(True)
+            bpy.context.view_layer.objects.active = temp_obj
             
-            debug_log(f"  Font {obj.name} → mesh: {len(mesh.vertices)} vertices, {len(mesh.edges)} edges, {len(mesh.polygons)} polygons")
+            # Spróbuj konwersji
+            deps2 = bpy.context.evaluated_depsgraph_get()
+            eval_temp = temp_obj.evaluated_get(deps2)
+            mesh2 = bpy.data.meshes.new_from_object(eval_temp, depsgraph=deps2)
             
-            # Sprawdź czy mamy jakąkolwiek geometrię
-            if len(mesh.vertices) == 0:
-                debug_log(f"  Font {obj.name}: brak vertices - sprawdzam alternatywne metody")
-                bpy.data.meshes.remove(mesh)
-                
-                # ALTERNATYWNA METODA: Spróbuj convert to mesh w kontekście
-                try:
-                    # Duplikuj obiekt tymczasowo dla konwersji
-                    temp_obj = obj.copy()
-                    temp_obj.data = obj.data.copy()
-                    
-                    # Dodaj do sceny tymczasowo
-                    bpy.context.collection.objects.link(temp_obj)
-                    bpy.context.view_layer.update()
-                    
-                    # Konwertuj używając modifiers
-                    temp_obj.select_set(True)
-                    bpy.context.view_layer.objects.active = temp_obj
-                    
-                    # Spróbuj konwersji
-                    deps2 = bpy.context.evaluated_depsgraph_get()
-                    eval_temp = temp_obj.evaluated_get(deps2)
-                    mesh2 = bpy.data.meshes.new_from_object(eval_temp, depsgraph=deps2)
-                    
-                    debug_log(f"  Font {obj.name} → mesh2: {len(mesh2.vertices)} vertices, {len(mesh2.edges)} edges, {len(mesh2.polygons)} polygons")
-                    
-                    # Usuń tymczasowy obiekt
-                    bpy.context.collection.objects.unlink(temp_obj)
-                    bpy.data.objects.remove(temp_obj)
-                    
-                    if len(mesh2.vertices) > 0:
-                        mesh = mesh2
-                    else:
-                        bpy.data.meshes.remove(mesh2)
-                        debug_log(f"  Font {obj.name}: nie udało się wygenerować geometrii")
-                        return
-                                                                        
-                except Exception as e:
-                    debug_log(f"  Font {obj.name}: błąd alternatywnej konwersji: {e}")
-                    return
+            debug_log(f"  Font {obj.name} → mesh2: {len(mesh2.vertices)} vertices, {len(mesh2.edges)} edges, {len(mesh2.polygons)} polygons")
             
-            if len(mesh.vertices) == 0:
-                debug_log(f"  Font {obj.name}: nadal brak geometrii - pomijam")
-                bpy.data.meshes.remove(mesh)
-                return
+            # Usuń tymczasowy obiekt
+            bpy.context.collection.objects.unlink(temp_obj)
+            bpy.data.objects.remove(temp_obj)
             
-            # EKSPORTUJ WSZYST­KIE KRAWĘDZIE (dla zachowania pełnego wyglądu tekstu)
-            if export_mode in ['edges', 'both']:
-                debug_log(f"  Eksportuję font {obj.name} jako {len(mesh.edges)} krawędzi")
-                
-                # Dla fontów eksportujemy WSZYSTKIE krawędzie, nie tylko brzegowe
-                for edge in mesh.edges:
-                    v1, v2 = edge.vertices
-                    p1 = obj.matrix_world @ mesh.vertices[v1].co
-                    p2 = obj.matrix_world @ mesh.vertices[v2].co
-                    
-                    line = msp.add_line(
-                        (p1.x * SCALE, p1.y * SCALE),
-                        (p2.x * SCALE, p2.y * SCALE),
-                        dxfattribs={"layer": layer_props.name}
-                    )
-                    
-                    # Kolor krawędzi
-                    if layer_props.line_color_type == 'RGB':
-                        line.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in layer_props.line_color_rgb])
-                    elif layer_props.line_color_type == 'PRONEKO':
-                        proneko_rgb = get_proneko_color_rgb(layer_props.line_color_proneko)
-                        line.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in proneko_rgb])
-                    else:
-                        line.dxf.color = layer_props.line_color_index
-                
-                debug_log(f"  Font {obj.name}: wyeksportowano {len(mesh.edges)} krawędzi")
+            if len(mesh2.vertices) > 0:
+                return mesh2
+            bpy.data.meshes.remove(mesh2)
+            debug_log(f"  Font {obj.name}: nie udało się wygenerować geometrii")
+        except Exception as e:
+            debug_log(f"  Font {obj.name}: błąd alternatywnej konwersji: {e}")
+        return None
+    
+    def font_record(obj, verts2d, edges, polygons):
+        """Rekord 2D fontu: wszystkie krawędzie + pełne hatche"""
+        # Dla fontów eksportujemy WSZYSTKIE krawędzie, nie tylko brzegowe
+        lines = []
+        for v1, v2 in edges:
+            lines.extend(verts2d[v1])
+            lines.extend(verts2d[v2])
+        
+        # Hatche (pełne wypełnienie) - po jednym na polygon
+        hatches = [[([verts2d[i] for i in poly], [])] for poly in polygons]
+        
+        debug_log(f"  Font {obj.name}: {len(edges)} krawędzi, {len(hatches)} hatchy")
+        return {'hatches': hatches, 'solid': True, 'lines': lines}
+    
+    def evaluate_font_object(obj):
+        """Ewaluuje obiekt FONT do rekordu 2D (wszystkie krawędzie + pełne hatche)"""
+        
+        # DIAGNOSTYKA: sprawdź podstawowe właściwości obiektu font
+        debug_log(f"  Font {obj.name}: data.body='{getattr(obj.data, 'body', 'BRAK')}', visible={obj.visible_get()}")
+        
+        debug_log(f"  Przetwarzam font {obj.name} (brak cache lub zmieniony)")
+        
+        # resolution_u jest obniżana dla wszystkich fontów naraz (lowered_font_resolution)
+        try:
+            # Etykieta złożona z cache glifów - bez konwersji przez depsgraph
+            label = layout_label_from_glyphs(obj) if obj.name in glyph_objects else None
+            if label is not None:
+                verts_local, edges, polygons, _ = label
+                mw = obj.matrix_world
+                verts2d = []
+                for x, y in verts_local:
+                    p = mw @ Vector((x, y, 0.0))
+                    verts2d.append((p.x * SCALE, p.y * SCALE))
+                debug_log(f"  Font {obj.name}: złożony z cache glifów")
+                record = font_record(obj, verts2d, edges, polygons)
+                cache_record(obj, record, 'font')
+                return record
             
-            # EKSPORTUJ HATCHES (opcjonalnie dla wypełnień)
-            if export_mode in ['hatches', 'both'] and len(mesh.polygons) > 0:
-                debug_log(f"  Eksportuję font {obj.name} jako {len(mesh.polygons)} hatches")
-                
-                for poly in mesh.polygons:
-                    pts = [obj.matrix_world @ mesh.vertices[i].co for i in poly.vertices]
-                    poly2d = [(p.x * SCALE, p.y * SCALE) for p in pts]
-                    
-                    hatch = msp.add_hatch(dxfattribs={"layer": layer_props.name})
-                    hatch.paths.add_polyline_path(poly2d, is_closed=True)
-                    hatch.set_solid_fill()
-                    
-                    # Kolor hatchu
-                    if layer_props.hatch_color_type == 'RGB':
-                        hatch.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in layer_props.hatch_color_rgb])
-                    elif layer_props.hatch_color_type == 'PRONEKO':
-                        proneko_rgb = get_proneko_color_rgb(layer_props.hatch_color_proneko)
-                        hatch.dxf.true_color = rgb_to_truecolor_int([int(c*255) for c in proneko_rgb])
-                    else:
-                        hatch.dxf.color = layer_props.hatch_color_index
-                    
-            # Zapisz do cache przed usunięciem mesh
-            if not cached_data:
-                debug_log(f"  Zapisuję font {obj.name} do cache")
-                geometry_data = {
-                    'vertices': [(v.co.x, v.co.y, v.co.z) for v in mesh.vertices],
-                    'edges': [(e.vertices[0], e.vertices[1]) for e in mesh.edges],
-                    'polygons': [list(p.vertices) for p in mesh.polygons],
-                    'export_type': 'font',
-                    'font_body': getattr(obj.data, 'body', '')
-                }
-                cache_object_geometry(obj, geometry_data)
+            mesh = font_to_mesh(obj)
+            if mesh is None:
+                return None
             
-                bpy.data.meshes.remove(mesh)
+            record = font_record(obj, mesh_to_2d(obj, mesh),
+                                 [tuple(e.vertices) for e in mesh.edges],
+                                 [tuple(p.vertices) for p in mesh.polygons])
+            bpy.data.meshes.remove(mesh)
+            cache_record(obj, record, 'font')
             
-        except Exception as e:
-            debug_log(f"  Błąd eksportu font {obj.name}: {e}")
+            return record
         
-        finally:
-            # PRZYWRÓĆ ORYGINALNĄ RESOLUTION_U
-            if original_resolution_u is not None and hasattr(obj.data, 'resolution_u'):
-                obj.data.resolution_u = original_resolution_u
-                debug_log(f"  Font {obj.name}: resolution_u przywrócona do {original_resolution_u}")
+        except Exception as e:
+            debug_log(f"  Font {obj.name}: błąd konwersji: {e}", level='ERROR')
+            return None
+    
+    def write_hatches(record, layer_props):
+        """Zapisuje hatche rekordu (jeden hatch na wyspę)"""
+        for regions in record['hatches']:
+            hatch = msp.add_hatch(dxfattribs={"layer": layer_props.name})
+            for outer, holes in regions:
+                hatch.paths.add_polyline_path(outer, is_closed=True)
+                for hole in holes:
+                    hatch.paths.add_polyline_path(hole, is_closed=True, flags=0)
+            
+            # Ustawienia hatchu z właściwości warstwy
+            if record['solid'] or layer_props.hatch_pattern == "SOLID":
+                hatch.set_solid_fill()
+            else:
+                hatch.set_pattern_fill(layer_props.hatch_pattern, 
+                 scale=layer_props.hatch_scale,
+                 angle=layer_props.hatch_rotation)
+            
+            # Kolor hatchu
+            layer_props.apply_hatch_color(hatch)
+    
+    def write_lines(record, layer_props):
+        """Zapisuje odcinki rekordu jako LINE lub ciągi LWPOLYLINE (tekst jako TEXT/MTEXT)"""
+        if record.get('text'):
+            _add_text_entity(msp, record['text'], layer_props.line_attribs)
+        lines = record['lines']
+        if lines_as_polylines:
+            # Odcinki obiektu (jedna warstwa) łączone w ciągi przed zapisem
+            segments = [((lines[i], lines[i + 1]), (lines[i + 2], lines[i + 3]))
+                        for i in range(0, len(lines), 4)]
+            attribs = dict(layer_props.line_attribs, flags=PLINEGEN_FLAG)
+            for points, closed in _chain_segments(segments):
+                msp.add_lwpolyline(points, close=closed, dxfattribs=attribs)
+            return
+        if isinstance(msp, DXFStreamWriter):
+            msp.add_lines(lines, dxfattribs=layer_props.line_attribs)
+            return
+        for i in range(0, len(lines), 4):
+            msp.add_line((lines[i], lines[i + 1]), (lines[i + 2], lines[i + 3]),
+                         dxfattribs=layer_props.line_attribs)
 
     # GŁÓWNA PĘTLA EKSPORTU - 4-przepustowy system
-    debug_log("=== ROZPOCZYNAM 4-PRZEPUSTOWY EKSPORT ===")
+    debug_log("=== ROZPOCZYNAM 4-PRZEPUSTOWY EKSPORT ===", level='INFO')
     
     # Podziel obiekty na grupy: z "#Opis" i bez "#Opis"
     non_opis_objects = []
@@ -3123,83 +5112,86 @@ def export_obszar_dxf_new(ctx):
     debug_log(f"Obiekty bez '#Opis': {len(non_opis_objects)}")
     debug_log(f"Obiekty z '#Opis': {len(opis_objects)}")
     
-    exported_count = 0
-    
-    # PASS 1: Hatches obiektów bez "#Opis" (Z-order: wysokie → niskie)
-    debug_log("=== PASS 1: HATCHES obiektów bez '#Opis' ===")
-    for obj in non_opis_objects:
-        try:
-            debug_log(f"PASS 1 - Hatches: {obj.name} ({obj.type}) Z={obj.location.z:.3f}")
-            layer_props = get_layer_properties(obj)
-            
-            if obj.type == 'MESH':
-                export_mesh_object(obj, layer_props, msp, doc, ctx, export_mode='hatches')
-            elif obj.type == 'FONT':
-                export_font_object(obj, layer_props, msp, doc, ctx, export_mode='hatches')
-            
-            exported_count += 1
-            
-        except Exception as e:
-            debug_log(f"PASS 1 błąd eksportu {obj.name}: {e}")
-            continue
+    # EWALUACJA: każdy obiekt raz (mesh / font → rekord 2D)
+    debug_log("=== EWALUACJA OBIEKTÓW ===")
+    records = {}
+    # Tryb TEXT: fonty jako encje TEXT/MTEXT, bez konwersji geometrii
+    text_as_entities = getattr(ctx.scene, "miixarch_dxf_text_mode", 'GEOMETRY') == 'TEXT'
+    # Tryb POLYLINES: krawędzie obiektu jako ciągi LWPOLYLINE zamiast osobnych LINE
+    lines_as_polylines = getattr(ctx.scene, "miixarch_dxf_line_mode", 'LINES') == 'POLYLINES'
     
-    # PASS 2: Edges obiektów bez "#Opis" (Z-order: wysokie → niskie)
-    debug_log("=== PASS 2: EDGES obiektów bez '#Opis' ===")
-    for obj in non_opis_objects:
-        try:
-            debug_log(f"PASS 2 - Edges: {obj.name} ({obj.type}) Z={obj.location.z:.3f}")
-            layer_props = get_layer_properties(obj)
-            
-            if obj.type == 'MESH':
-                export_mesh_object(obj, layer_props, msp, doc, ctx, export_mode='edges')
-            elif obj.type == 'FONT':
-                export_font_object(obj, layer_props, msp, doc, ctx, export_mode='edges')
-            
-        except Exception as e:
-            debug_log(f"PASS 2 błąd eksportu {obj.name}: {e}")
+    # Cache geometrii: niezmienione obiekty bez ewaluacji depsgraph
+    for obj in sorted_objects:
+        if obj.type == 'FONT' and text_as_entities:
             continue
-    
-    # PASS 3: Hatches obiektów z "#Opis" (Z-order: wysokie → niskie)
-    debug_log("=== PASS 3: HATCHES obiektów z '#Opis' ===")
-    for obj in opis_objects:
         try:
-            debug_log(f"PASS 3 - Hatches: {obj.name} ({obj.type}) Z={obj.location.z:.3f}")
-            layer_props = get_layer_properties(obj)
-            
-            if obj.type == 'MESH':
-                export_mesh_object(obj, layer_props, msp, doc, ctx, export_mode='hatches')
-            elif obj.type == 'FONT':
-                export_font_object(obj, layer_props, msp, doc, ctx, export_mode='hatches')
-            
+            record = cached_record(obj)
         except Exception as e:
-            debug_log(f"PASS 3 błąd eksportu {obj.name}: {e}")
+            debug_log(f"Błąd odczytu cache {obj.name}: {e}", level='ERROR')
             continue
+        if record is not None:
+            debug_log(f"Cache: {obj.name} bez ewaluacji")
+            records[obj.name] = record
+    debug_log(f"Cache geometrii: {len(records)}/{len(sorted_objects)} obiektów")
+    
+    # OPTYMALIZACJA: resolution_u = 2 dla wszystkich fontów, jedna aktualizacja sceny
+    font_objects = [] if text_as_entities else [obj for obj in sorted_objects
+                                                if obj.type == 'FONT' and obj.name not in records]
+    with lowered_font_resolution(font_objects, 2):
+        glyph_objects = prepare_glyph_cache(font_objects)
+        for obj in sorted_objects:
+            if obj.name in records:
+                continue
+            try:
+                debug_log(f"Ewaluacja: {obj.name} ({obj.type}) Z={obj.location.z:.3f}")
+                if obj.type == 'MESH':
+                    record = evaluate_mesh_object(obj)
+                elif obj.type == 'FONT' and text_as_entities:
+                    spec = font_text_spec(doc, obj, lambda p: (p.x * SCALE, p.y * SCALE))
+                    record = {'hatches': [], 'solid': True, 'lines': [], 'text': spec}
+                elif obj.type == 'FONT':
+                    record = evaluate_font_object(obj)
+                else:
+                    record = None
+                if record is not None:
+                    records[obj.name] = record
+            except Exception as e:
+                debug_log(f"Błąd ewaluacji {obj.name}: {e}", level='ERROR')
+    
+    exported_count = len(records)
+    
+    # PASS 1: Hatches obiektów bez "#Opis", PASS 2: Edges obiektów bez "#Opis",
+    # PASS 3: Hatches obiektów z "#Opis", PASS 4: Edges obiektów z "#Opis"
+    # (w każdym przebiegu Z-order: wysokie → niskie)
+    export_passes = [
+        ("PASS 1: HATCHES obiektów bez '#Opis'", non_opis_objects, write_hatches),
+        ("PASS 2: EDGES obiektów bez '#Opis'", non_opis_objects, write_lines),
+        ("PASS 3: HATCHES obiektów z '#Opis'", opis_objects, write_hatches),
+        ("PASS 4: EDGES obiektów z '#Opis'", opis_objects, write_lines),
+    ]
+    for pass_name, pass_objects, write_record in export_passes:
+        debug_log(f"=== {pass_name} ===")
+        for obj in pass_objects:
+            record = records.get(obj.name)
+            if record is None:
+                continue
+            try:
+                write_record(record, object_styles[obj.name])
+            except Exception as e:
+                debug_log(f"{pass_name} błąd eksportu {obj.name}: {e}", level='ERROR')
     
-    # PASS 4: Edges obiektów z "#Opis" (Z-order: wysokie → niskie)
-    debug_log("=== PASS 4: EDGES obiektów z '#Opis' ===")
-    for obj in opis_objects:
-        try:
-            debug_log(f"PASS 4 - Edges: {obj.name} ({obj.type}) Z={obj.location.z:.3f}")
-            layer_props = get_layer_properties(obj)
-            
-            if obj.type == 'MESH':
-                export_mesh_object(obj, layer_props, msp, doc, ctx, export_mode='edges')
-            elif obj.type == 'FONT':
-                export_font_object(obj, layer_props, msp, doc, ctx, export_mode='edges')
-            
-        except Exception as e:
-            debug_log(f"PASS 4 błąd eksportu {obj.name}: {e}")
-            continue
+    debug_log(f"=== 4-PRZEPUSTOWY EKSPORT ZAKOŃCZONY: {exported_count}/{len(sorted_objects)} obiektów ===", level='INFO')
     
-    debug_log(f"=== 4-PRZEPUSTOWY EKSPORT ZAKOŃCZONY: {exported_count}/{len(sorted_objects)} obiektów ===")
+    # Jeden zbiorczy zapis cache geometrii na koniec eksportu
+    save_dxf_cache()
     
     # Zapisz plik DXF
     try:
-        doc.saveas(dxf_path)
-        debug_log(f"Plik DXF zapisany: {dxf_path}")
+        _dxf_save(doc, msp, dxf_path)
+        debug_log(f"Plik DXF zapisany: {dxf_path}", level='INFO')
         return {'FINISHED'}
     except Exception as e:
-        debug_log(f"Błąd zapisu pliku DXF: {e}")
+        debug_log(f"Błąd zapisu pliku DXF: {e}", level='ERROR')
         raise RuntimeError(f"Nie udało się zapisać pliku DXF: {e}")
 
 
@@ -3447,6 +5439,24 @@ class MIIXARCH_OT_ImportLayersFromText(Operator):
             self.report({'ERROR'}, message)
         return result
 
+class MIIXARCH_OT_ToggleHiddenLines(Operator):
+    bl_idname = "miixarch.toggle_hidden_lines"
+    bl_label = "Krawędzie zasłonięte"
+    bl_description = "Przełącza usuwanie krawędzi zasłoniętych w widoku aktywnej kamery"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    def execute(self, context):
+        cam = context.scene.camera
+        if cam is None:
+            self.report({'ERROR'}, "Brak aktywnej kamery")
+            return {'CANCELLED'}
+        
+        value = not get_camera_hidden_lines(cam)
+        set_camera_hidden_lines(cam, value)
+        state = "usuwane" if value else "zachowane"
+        self.report({'INFO'}, f"{cam.name}: krawędzie zasłonięte {state}")
+        return {'FINISHED'}
+
 class MIIXARCH_OT_ClearDXFCache(Operator):
     bl_idname = "miixarch.clear_dxf_cache"
     bl_label = "Wyczyść cache DXF"
@@ -3454,16 +5464,8 @@ class MIIXARCH_OT_ClearDXFCache(Operator):
     bl_options = {'REGISTER', 'UNDO'}
     
     def execute(self, context):
-        global _dxf_memory_cache
-        _dxf_memory_cache = {
-            'version': '1.0',
-            'blend_file': bpy.data.filepath,
-            'last_updated': datetime.now().isoformat(),
-            'objects': {}
-        }
-        
-        # Zapisz wyczyszczony cache do Text bloku
-        save_dxf_cache()
+        clear_dxf_cache()
+        clear_glyph_cache()
         
         self.report({'INFO'}, "Cache DXF wyczyszczony")
         return {'FINISHED'}
@@ -3503,25 +5505,31 @@ class MIIXARCH_OT_SetMaterialVisibility(Operator):
             self.report({'INFO'}, f"Nie znaleziono obiektów dla: {self.material_type}")
             return {'FINISHED'}
         
-        # Sprawdź obecny stan większości obiektów aby zdecydować czy włączyć czy wyłączyć
-        if self.action == 'DISABLE_VIEWPORT':
-            # Sprawdź ile obiektów jest wyłączonych (hide_get() == True)
-            disabled_count = sum(1 for obj in objects if obj.hide_get())
-            new_state = disabled_count < len(objects) / 2  # Jeśli mniej niż połowa wyłączona, wyłącz wszystkie
-            for obj in objects:
-                obj.hide_set(new_state)
-        elif self.action == 'HIDE_VIEWPORT':
-            # Sprawdź ile obiektów ma hide_viewport == True
-            hidden_count = sum(1 for obj in objects if obj.hide_viewport)
-            new_state = hidden_count < len(objects) / 2  # Jeśli mniej niż połowa ukryta, ukryj wszystkie
-            for obj in objects:
-                obj.hide_viewport = new_state
-        elif self.action == 'HIDE_RENDER':
-            # Sprawdź ile obiektów ma hide_render == True
-            hidden_count = sum(1 for obj in objects if obj.hide_render)
-            new_state = hidden_count < len(objects) / 2  # Jeśli mniej niż połowa ukryta, ukryj wszystkie
-            for obj in objects:
-                obj.hide_render = new_state
+        # Zmiany w jednej partii przy wyłączonych handlerach i z jedną aktualizacją view layer
+        with suspended_handlers(catch_up=False):
+            # Sprawdź obecny stan większości obiektów aby zdecydować czy włączyć czy wyłączyć
+            if self.action == 'DISABLE_VIEWPORT':
+                # Sprawdź ile obiektów jest wyłączonych (hide_get() == True)
+                disabled_count = sum(1 for obj in objects if obj.hide_get())
+                new_state = disabled_count < len(objects) / 2  # Jeśli mniej niż połowa wyłączona, wyłącz wszystkie
+                for obj in objects:
+                    if obj.hide_get() != new_state:
+                        obj.hide_set(new_state)
+            elif self.action == 'HIDE_VIEWPORT':
+                # Sprawdź ile obiektów ma hide_viewport == True
+                hidden_count = sum(1 for obj in objects if obj.hide_viewport)
+                new_state = hidden_count < len(objects) / 2  # Jeśli mniej niż połowa ukryta, ukryj wszystkie
+                for obj in objects:
+                    if obj.hide_viewport != new_state:
+                        obj.hide_viewport = new_state
+            elif self.action == 'HIDE_RENDER':
+                # Sprawdź ile obiektów ma hide_render == True
+                hidden_count = sum(1 for obj in objects if obj.hide_render)
+                new_state = hidden_count < len(objects) / 2  # Jeśli mniej niż połowa ukryta, ukryj wszystkie
+                for obj in objects:
+                    if obj.hide_render != new_state:
+                        obj.hide_render = new_state
+            context.view_layer.update()
         
         # Odśwież viewport
         for area in context.screen.areas:
@@ -3545,8 +5553,6 @@ class MIIX_OT_export_drawing_layers(bpy.types.Operator):
     bl_label  = "Rysunek CAD - rzut"
 
     def execute(self, context):
-        global _log_file
-        import time
         start_time = time.time()
         
         # Sprawdź płaszczyznę cięcia
@@ -3565,12 +5571,6 @@ class MIIX_OT_export_drawing_layers(bpy.types.Operator):
             self.report({'ERROR'}, f"Brak kolekcji '{camera_coll_name}'. Użyj najpierw 'Aktualizuj rysunek'")
             return {'CANCELLED'}
         
-        # Inicjalizuj logowanie
-            directory = os.path.dirname(bpy.path.abspath(context.scene.render.filepath)) or bpy.path.abspath('//') or os.getcwd()
-            log_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        global _log_file
-        # _log_file = os.path.join(directory, f"export_{cam.name}_{log_time}.txt")  # Logowanie dezaktywowane
-            
         
         # Sprawdź czy są jakieś obiekty do eksportu
         if not coll.objects:
@@ -3589,6 +5589,12 @@ class MIIX_OT_export_drawing_layers(bpy.types.Operator):
         success_msg = f"Eksport w {elapsed_time:.1f}s z kolekcji '{camera_coll_name}'"
         
         
+        if DXF_EXPORT_STATS.get('removed_vertices'):
+            success_msg += f", uproszczenie: -{DXF_EXPORT_STATS['removed_vertices']} wierzchołków"
+        if DXF_EXPORT_STATS.get('dedup_segments'):
+            success_msg += (f", duplikaty: {DXF_EXPORT_STATS['dedup_segments']} → "
+                            f"{DXF_EXPORT_STATS['dedup_pieces']} odcinków")
+        
         # Automatyczne czyszczenie cache po eksporcie
         clear_bmesh_cache()
         
@@ -3638,6 +5644,7 @@ class MIIXARCH_OT_AssignSurface(Operator):
         items=surface_types
     )
 
+    @suspends_handlers
     def execute(self, context):
         for obj in context.selected_objects:
             if obj.type in {'MESH', 'CURVE'}:
@@ -3663,6 +5670,7 @@ class MIIXARCH_OT_AssignObjectType(Operator):
         items=get_object_type_items
     )
 
+    @suspends_handlers
     def execute(self, context):
         for obj in context.selected_objects:
             if obj.type == 'MESH':
@@ -3725,21 +5733,19 @@ class MIIXARCH_OT_GenerateContours(Operator):
         layout = self.layout
         layout.prop(self, "interval")
 
+    @suspends_handlers
     def execute(self, context):
         import bmesh
         import mathutils
         
         # Wyczyść plik debug warstwic
-        import os
-        debug_file = "/Users/michalmalewczyk/Desktop/warstwice_debug.txt"
-        if os.path.exists(debug_file):
-            os.remove(debug_file)
+        reset_debug_log('contours')
         
         debug_contours_log("=== ROZPOCZYNAM GENEROWANIE WARSTWIC ===")
 
         selected_meshes = [obj for obj in context.selected_objects if obj.type == 'MESH']
         if not selected_meshes:
-            debug_contours_log("BŁĄD: Brak zaznaczonych obiektów mesh")
+            debug_contours_log("BŁĄD: Brak zaznaczonych obiektów mesh", level='ERROR')
             self.report({'ERROR'}, "Brak zaznaczonych obiektów mesh")
             return {'CANCELLED'}
 
@@ -3810,14 +5816,21 @@ class MIIXARCH_OT_GenerateContours(Operator):
 
         contours = []
         
-        for i, level in enumerate(levels):
-            debug_contours_log(f"Tworzę warstwicę na poziomie {level:.3f}")
-            contour_obj = self.create_contour_at_level(target_obj, mesh, level, i + 1)
-            if contour_obj:
+        if np is not None:
+            # Wszystkie poziomy w jednym przebiegu
+            for index, verts, edges in self.contour_levels(target_obj, mesh, levels):
+                contour_obj = self.create_contour_object(target_obj, verts, edges, index)
                 contours.append(contour_obj)
-                debug_contours_log(f"Utworzono warstwicę {contour_obj.name}")
-            else:
-                debug_contours_log(f"Nie udało się utworzyć warstwicy na poziomie {level:.3f}")
+                debug_contours_log(f"Utworzono warstwicę {contour_obj.name} na poziomie {levels[index - 1]:.3f}")
+        else:
+            for i, level in enumerate(levels):
+                debug_contours_log(f"Tworzę warstwicę na poziomie {level:.3f}")
+                contour_obj = self.create_contour_at_level(target_obj, mesh, level, i + 1)
+                if contour_obj:
+                    contours.append(contour_obj)
+                    debug_contours_log(f"Utworzono warstwicę {contour_obj.name}")
+                else:
+                    debug_contours_log(f"Nie udało się utworzyć warstwicy na poziomie {level:.3f}")
 
         # Zwolnij mesh
         eval_obj.to_mesh_clear()
@@ -3825,6 +5838,113 @@ class MIIXARCH_OT_GenerateContours(Operator):
         debug_contours_log(f"Łącznie utworzono {len(contours)} warstwic dla {target_obj.name}")
         return contours
 
+    def contour_levels(self, parent_obj, mesh, levels, tolerance=0.001):
+        """Warstwice wszystkich poziomów w jednym przebiegu (NumPy).
+        
+        Przecięcie liczone jest raz na parę (krawędź, poziom) i współdzielone przez
+        sąsiednie ściany, więc punkty są spawane po tożsamości krawędzi (przecięcie
+        w granicy tolerancji od wierzchołka - po wierzchołku) zamiast remove_doubles. Ściana daje odcinek,
+        gdy dokładnie dwie jej krawędzie przecinają poziom (jak create_contour_at_level).
+        Zwraca [(numer poziomu od 1, wierzchołki w przestrzeni rodzica, krawędzie)].
+        """
+        n_verts, n_edges = len(mesh.vertices), len(mesh.edges)
+        n_loops, n_polys = len(mesh.loops), len(mesh.polygons)
+        if not n_polys or not levels:
+            return []
+        
+        co = np.empty(3 * n_verts, dtype=np.float32)
+        mesh.vertices.foreach_get("co", co)
+        co = co.reshape(-1, 3).astype(np.float64)
+        matrix = np.array(parent_obj.matrix_world, dtype=np.float64)
+        z = co @ matrix[2, :3] + matrix[2, 3]
+        ev = np.empty(2 * n_edges, dtype=np.int32)
+        mesh.edges.foreach_get("vertices", ev)
+        ev = ev.reshape(-1, 2)
+        level_z = np.asarray(levels, dtype=np.float64)
+        
+        # Przecięcia (krawędź, poziom): poziomy z zakresu Z każdej krawędzi
+        z1, z2 = z[ev[:, 0]], z[ev[:, 1]]
+        lo = np.searchsorted(level_z, np.minimum(z1, z2), 'left')
+        hi = np.searchsorted(level_z, np.maximum(z1, z2), 'right')
+        count = np.where(np.abs(z1 - z2) > tolerance, hi - lo, 0)
+        start = np.cumsum(count) - count
+        cross_edge = np.repeat(np.arange(n_edges), count)
+        cross_level = lo[cross_edge] + np.arange(int(count.sum())) - start[cross_edge]
+        if not len(cross_level):
+            return []
+        a, b = ev[cross_edge, 0], ev[cross_edge, 1]
+        t = (level_z[cross_level] - z1[cross_edge]) / (z2 - z1)[cross_edge]
+        # Interpolacja w przestrzeni lokalnej - bez powrotu macierzą odwrotną
+        points = co[a] + (co[b] - co[a]) * t[:, None]
+        # Przecięcie bliżej niż tolerancja od wierzchołka (odległość wzdłuż krawędzi
+        # w przestrzeni świata, jak dawne remove_doubles(0.001)) jest z nim spawane
+        edge_len = np.linalg.norm((co[b] - co[a]) @ matrix[:3, :3].T, axis=1)
+        near_a = t * edge_len <= tolerance
+        near_b = (1.0 - t) * edge_len <= tolerance
+        node = np.where(near_a & (t <= 0.5), a,
+                        np.where(near_b, b, np.where(near_a, a, n_verts + np.arange(len(t)))))
+        
+        # Przecięcia krawędzi każdej ściany, grupowane po (ściana, poziom)
+        loop_edge = np.empty(n_loops, dtype=np.int32)
+        mesh.loops.foreach_get("edge_index", loop_edge)
+        loop_total = np.empty(n_polys, dtype=np.int32)
+        mesh.polygons.foreach_get("loop_total", loop_total)
+        loop_face = np.repeat(np.arange(n_polys), loop_total)
+        loop_count = count[loop_edge]
+        rep_loop = np.repeat(np.arange(n_loops), loop_count)
+        loop_start = np.cumsum(loop_count) - loop_count
+        rep_cross = start[loop_edge][rep_loop] + np.arange(len(rep_loop)) - loop_start[rep_loop]
+        key = loop_face[rep_loop].astype(np.int64) * len(level_z) + cross_level[rep_cross]
+        order = np.argsort(key, kind='stable')
+        _, first, group_size = np.unique(key[order], return_index=True, return_counts=True)
+        pair = first[group_size == 2]
+        ca, cb = rep_cross[order[pair]], rep_cross[order[pair + 1]]
+        
+        # Odcinki zdegenerowane (oba końce w jednym punkcie) odpadają
+        na, nb = node[ca], node[cb]
+        valid = na != nb
+        seg_level = cross_level[ca][valid]
+        seg = np.sort(np.stack((na[valid], nb[valid]), axis=1), axis=1)
+        
+        by_level = np.argsort(seg_level, kind='stable')
+        seg_level, seg = seg_level[by_level], seg[by_level]
+        bounds = np.flatnonzero(np.diff(seg_level)) + 1
+        result = []
+        for first_seg, level_seg in zip(np.concatenate(([0], bounds)), np.split(seg, bounds)):
+            if not len(level_seg):
+                continue
+            level_index = int(seg_level[first_seg])
+            level_seg = np.unique(level_seg, axis=0)
+            nodes, edges = np.unique(level_seg, return_inverse=True)
+            verts = np.where((nodes < n_verts)[:, None],
+                             co[np.minimum(nodes, n_verts - 1)],
+                             points[np.maximum(nodes - n_verts, 0)])
+            result.append((level_index + 1, verts.tolist(), edges.reshape(-1, 2).tolist()))
+        return result
+
+    def create_contour_object(self, parent_obj, verts, edges, index):
+        """Tworzy obiekt #Warstwice.NNN z krawędzi w przestrzeni lokalnej rodzica."""
+        contour_mesh = bpy.data.meshes.new(f"Warstwice_{index:03d}")
+        contour_mesh.from_pydata(verts, edges, [])
+        contour_mesh.update()
+
+        # Stwórz obiekt
+        contour_name = f"#Warstwice.{index:03d}"
+        contour_obj = bpy.data.objects.new(contour_name, contour_mesh)
+        
+        # Dodaj do sceny
+        bpy.context.collection.objects.link(contour_obj)
+        
+        # Ustaw jako dziecko obiektu źródłowego
+        contour_obj.parent = parent_obj
+        contour_obj.parent_type = 'OBJECT'
+
+        # Ustaw lokację na (0,0,0) - warstwice są już w lokalnej przestrzeni rodzica
+        contour_obj.location = (0, 0, 0)
+        
+        debug_contours_log(f"Utworzono obiekt warstwicy: {contour_name} z {len(contour_mesh.edges)} edges")
+        return contour_obj
+
     def create_contour_at_level(self, parent_obj, mesh, z_level, index):
         """Tworzy obiekt warstwicy na danym poziomie Z."""
         import bmesh
@@ -3912,32 +6032,16 @@ class MIIXARCH_OT_GenerateContours(Operator):
         parent_matrix_inv = parent_obj.matrix_world.inverted()
         contour_bm.transform(parent_matrix_inv)
         
-        # Stwórz nowy mesh
-        contour_mesh = bpy.data.meshes.new(f"Warstwice_{index:03d}")
-        contour_bm.to_mesh(contour_mesh)
+        verts = [v.co[:] for v in contour_bm.verts]
+        edges = [[v.index for v in e.verts] for e in contour_bm.edges]
         contour_bm.free()
-
-        # Stwórz obiekt
-        contour_name = f"#Warstwice.{index:03d}"
-        contour_obj = bpy.data.objects.new(contour_name, contour_mesh)
-        
-        # Dodaj do sceny
-        bpy.context.collection.objects.link(contour_obj)
-        
-        # Ustaw jako dziecko obiektu źródłowego
-        contour_obj.parent = parent_obj
-        contour_obj.parent_type = 'OBJECT'
-
-        # Ustaw lokację na (0,0,0) - warstwice są już w lokalnej przestrzeni rodzica
-        contour_obj.location = (0, 0, 0)
-        
-        debug_contours_log(f"Utworzono obiekt warstwicy: {contour_name} z {len(contour_mesh.edges)} edges")
-        return contour_obj
+        return self.create_contour_object(parent_obj, verts, edges, index)
 
 class MIIXARCH_OT_CreateBuilding(Operator):
     bl_idname = "miixarch.create_building"
     bl_label = "Stwórz budynek"
 
+    @suspends_handlers
     def execute(self, context):
         idx = 1
         while f"#Budynek.{idx}" in bpy.data.collections:
@@ -3951,6 +6055,7 @@ class MIIXARCH_OT_CreateArea(Operator):
     bl_idname = "miixarch.create_area"
     bl_label = "Stwórz obszar"
 
+    @suspends_handlers
     def execute(self, context):
         idx = 1
         while f"#Obszar.{idx}" in bpy.data.collections:
@@ -3964,6 +6069,7 @@ class MIIXARCH_OT_UpdateBuilding(Operator):
     bl_idname = "miixarch.update_building"
     bl_label = "Zaktualizuj budynek"
 
+    @suspends_handlers
     def execute(self, context):
         old = context.scene.miixarch_building_enum
         new = context.scene.miixarch_rename_target.strip()
@@ -3976,6 +6082,7 @@ class MIIXARCH_OT_UpdateArea(Operator):
     bl_idname = "miixarch.update_area"
     bl_label = "Zaktualizuj obszar"
 
+    @suspends_handlers
     def execute(self, context):
         old = context.scene.miixarch_area_enum
         new = context.scene.miixarch_area_name.strip()
@@ -4027,7 +6134,17 @@ class MIIXARCH_PT_ObszaryMainPanel(Panel):
         row.operator("miixarch.export_layers_to_text", text="Eksportuj", icon='EXPORT')
         row.operator("miixarch.import_layers_from_text", text="Importuj", icon='IMPORT')
         
+        # Logowanie debug
+        log_box = layout.box()
+        log_box.prop(context.scene, "miixarch_debug_log_enabled", text="Log debug")
+        if context.scene.miixarch_debug_log_enabled:
+            log_box.prop(context.scene, "miixarch_debug_log_level", text="Poziom")
+            log_box.prop(context.scene, "miixarch_debug_log_dir", text="Katalog")
+        
         layout.separator()
+        layout.prop(context.scene, "miixarch_dxf_writer", text="Zapis")
+        layout.prop(context.scene, "miixarch_dxf_text_mode", text="Tekst")
+        layout.prop(context.scene, "miixarch_dxf_line_mode", text="Krawędzie")
         layout.operator("miix.export_obszar_drawing", icon='EXPORT')
 
 class MIIXARCH_PT_ObszaryLayersPanel(Panel):
@@ -4204,6 +6321,16 @@ class MIIXARCH_PT_BudynkiMainPanel(Panel):
         # Przycisk eksportu DXF na końcu panelu
         layout.separator()
         layout.operator("miix.update_drawing", icon='FILE_REFRESH')
+        cam = context.scene.camera
+        if cam:
+            hidden = get_camera_hidden_lines(cam)
+            layout.operator("miixarch.toggle_hidden_lines",
+                            text=f"Krawędzie zasłonięte: {'usuwane' if hidden else 'zachowane'}",
+                            icon='HIDE_ON' if hidden else 'HIDE_OFF', depress=hidden)
+        layout.prop(context.scene, "miixarch_dxf_writer", text="Zapis")
+        layout.prop(context.scene, "miixarch_dxf_text_mode", text="Tekst")
+        layout.prop(context.scene, "miixarch_dxf_simplify", text="Upraszczaj polilinie")
+        layout.prop(context.scene, "miixarch_dxf_dedup", text="Duplikaty")
         layout.operator("miix.export_drawing_layers", icon='EXPORT')
 
 class MIIXARCH_PT_BudynkiLayersPanel(Panel):
@@ -5367,6 +7494,7 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
     bl_label = "Aktualizuj rysunek"
     bl_description = "Generuje geometrię przekroju, widoku i warstwy 'nad' dla aktywnej kamery"
 
+    @suspends_handlers
     def execute(self, context):
         import time
         start_time = time.time()
@@ -5379,12 +7507,6 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
         
         cam, origin, normal = plane
         
-        # Inicjalizuj logowanie
-        directory = os.path.dirname(bpy.path.abspath(context.scene.render.filepath)) or bpy.path.abspath('//') or os.getcwd()
-        log_time = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        global _log_file
-        # _log_file = os.path.join(directory, f"update_{cam.name}_{log_time}.txt")  # Logowanie dezaktywowane
-        
         
         # Znajdź lub utwórz kolekcję o nazwie kamery
         camera_coll_name = cam.name
@@ -5406,18 +7528,45 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
             else:
                 # Dodaj do sceny
                 context.scene.collection.children.link(camera_coll)
-        else:
-            # Kolekcja istnieje - wyczyść jej zawartość
-            for obj in list(camera_coll.objects):
-                bpy.data.objects.remove(obj, do_unlink=True)
         
-        # Zbierz widoczne obiekty MESH (wykluczając #Meble, #Oś i #Przekrój)
+        # Zbierz widoczne obiekty MESH (wykluczając #Meble, #Oś, #Przekrój i wygenerowane dla tej kamery)
+        generated = {o.name for o in camera_coll.objects}
         visible = [o for o in context.scene.objects 
                   if o.type == 'MESH' and o.visible_get() and not o.name.startswith('#Meble') 
                   and not ('#Oś' in o.name or '#Os' in o.name) 
-                  and not ('#Przekrój' in o.name or '#Przekroj' in o.name)]
-        
-
+                  and not ('#Przekrój' in o.name or '#Przekroj' in o.name)
+                  and o.name not in generated]
+        
+        # Diff z poprzednią generacją: obiekty pochodne (także części po split) niosą
+        # nazwę źródła w "miix_source", kolekcja kamery - sygnaturę i liczbę pochodnych
+        # każdego źródła w "miix_sources". Regenerowane są tylko zmienione źródła.
+        # Usuwanie krawędzi zasłoniętych (ustawienie kamery): widok zależy od wszystkich
+        # przesłaniających obiektów, więc ich wspólna sygnatura wchodzi do każdej sygnatury źródła
+        hidden_lines = get_camera_hidden_lines(cam)
+        if hidden_lines and np is None:
+            self.report({'WARNING'}, "Brak NumPy - krawędzie zasłonięte nie są usuwane")
+            hidden_lines = False
+        fingerprints = {o.name: calculate_object_fingerprint(o) for o in visible}
+        occluders_key = None
+        if hidden_lines:
+            occluders_key = hashlib.md5(repr(sorted(fingerprints.items())).encode()).hexdigest()
+        signatures = {o.name: derived_source_signature(o, cam, fingerprints[o.name], occluders_key,
+                                                       context.scene)
+                      for o in visible}
+        stored = camera_coll.get("miix_sources")
+        stored = stored.to_dict() if stored else {}
+        derived = {}
+        for obj in camera_coll.objects:
+            derived.setdefault(obj.get("miix_source"), []).append(obj)
+        
+        dirty = [o for o in visible
+                 if signatures[o.name] is None
+                 or stored.get(o.name) != f"{signatures[o.name]}:{len(derived.get(o.name, []))}"]
+        dirty_names = {o.name for o in dirty}
+        stale = [obj for src_name, objs in derived.items()
+                 if src_name not in signatures or src_name in dirty_names
+                 for obj in objs]
+        remove_objects_with_data(stale)
         
         if not visible:
             self.report({'WARNING'}, "Brak widocznych obiektów mesh do przetworzenia")
@@ -5436,8 +7585,15 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
         # Reset statystyk cache na początku
         CACHE_STATS["section_objects"].clear()
         
-        # Przetwarzaj obiekty MESH
-        for i, obj in enumerate(visible):
+        new_objects = []
+        processed_names = []
+        
+        occlusion = None
+        if hidden_lines and dirty:
+            occlusion = DepthBuffer(context, cam, visible, cam_clip_start, occluders_key)
+        
+        # Przetwarzaj tylko zmienione obiekty MESH - pozostałe pochodne zostają na miejscu
+        for i, obj in enumerate(dirty):
             # Sprawdź timeout co 50 obiektów
             if i % 50 == 0 and time.time() - start_time > 300:  # 5 minut
                 self.report({'ERROR'}, f"Timeout po 5 minutach. Przetworzono {successful_objects}/{total_objects} obiektów.")
@@ -5451,7 +7607,8 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
                     section_objects += 1
                 
                 # 2. depth_mesh tylko jeśli NIE ma przekroju (automatyczne wykluczanie)
-                widok_result = depth_mesh(obj, cam, origin, normal, camera_coll, context, cam_clip_start, cam_clip_end, "_widok")
+                widok_result = depth_mesh(obj, cam, origin, normal, camera_coll, context, cam_clip_start, cam_clip_end, "_widok",
+                                          occlusion=occlusion)
                 if widok_result:
                     depth_objects += 1
                     
@@ -5463,13 +7620,21 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
                 if section_result or widok_result or nad_result:
                     successful_objects += 1
                 
+                for result in (section_result, widok_result, nad_result):
+                    if result:
+                        result["miix_source"] = obj.name
+                        new_objects.append(result)
+                processed_names.append(obj.name)
+                
             except Exception as e:
                 continue
         
         # Raport końcowy
         elapsed_time = time.time() - start_time
         cache_info = get_cache_stats()
-        success_msg = f"Aktualizacja w {elapsed_time:.1f}s. {successful_objects}/{total_objects} obj. {cache_info}"
+        kept_objects = total_objects - len(dirty)
+        success_msg = (f"Aktualizacja w {elapsed_time:.1f}s. {successful_objects}/{len(dirty)} zmienionych obj., "
+                       f"{kept_objects} bez zmian. {cache_info}")
         
         
 
@@ -5526,9 +7691,10 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
                     except:
                         pass
         
-        # Zastosuj Split by Loose Parts na obiektach MESH w kolekcji kamery
+        # Zastosuj Split by Loose Parts na nowych obiektach MESH w kolekcji kamery
+        # (części dziedziczą "miix_source" po obiekcie dzielonym)
         split_count = 0
-        objects_to_split = [obj for obj in camera_coll.objects if obj.type == 'MESH']
+        objects_to_split = [obj for obj in new_objects if obj.type == 'MESH']
         
         for obj in objects_to_split:
             # Sprawdź czy obiekt ma więcej niż jedną wyspę geometrii
@@ -5557,6 +7723,18 @@ class MIIX_OT_update_drawing(bpy.types.Operator):
         # Odznacz wszystkie obiekty
         bpy.ops.object.select_all(action='DESELECT')
         
+        # Zapisz sygnatury źródeł (z liczbą pochodnych po split) dla następnej aktualizacji
+        derived_counts = {}
+        for obj in camera_coll.objects:
+            src_name = obj.get("miix_source")
+            derived_counts[src_name] = derived_counts.get(src_name, 0) + 1
+        sources = {name: value for name, value in stored.items()
+                   if name in signatures and name not in dirty_names}
+        for name in processed_names:
+            if signatures[name] is not None:
+                sources[name] = f"{signatures[name]}:{derived_counts.get(name, 0)}"
+        camera_coll["miix_sources"] = sources
+        
         self.report({'INFO'}, success_msg)
         
         return {'FINISHED'}
@@ -5623,6 +7801,7 @@ class MIIXARCH_OT_UpdateFontProperties(Operator):
     bl_label = "Aktualizuj właściwości fontów"
     bl_description = "Wymusza aktualizację właściwości fontów do wartości z kodu"
 
+    @suspends_handlers
     def execute(self, context):
         updated_count = 0
         
@@ -5994,6 +8173,7 @@ classes = (
     MIIXARCH_OT_CopyDXFSettings,
     MIIXARCH_OT_ExportLayersToText,
     MIIXARCH_OT_ImportLayersFromText,
+    MIIXARCH_OT_ToggleHiddenLines,
     MIIXARCH_OT_ClearDXFCache,
     MIIXARCH_OT_ShowDXFCacheStats,
     MIIXARCH_OT_SetMaterialVisibility,
@@ -6194,6 +8374,77 @@ def register():
         default=True
     )
     
+    # Ustawienia logowania debug
+    bpy.types.Scene.miixarch_debug_log_enabled = BoolProperty(
+        name="Log debug",
+        description="Zapisuj komunikaty debugowania do pliku (w tle, bez spowalniania eksportu)",
+        default=False,
+        update=update_debug_log_settings
+    )
+    
+    bpy.types.Scene.miixarch_debug_log_level = EnumProperty(
+        name="Poziom logowania",
+        items=[
+            ('DEBUG', 'Debug', 'Wszystkie komunikaty'),
+            ('INFO', 'Info', 'Komunikaty informacyjne i błędy'),
+            ('WARNING', 'Ostrzeżenia', 'Ostrzeżenia i błędy'),
+            ('ERROR', 'Błędy', 'Tylko błędy'),
+        ],
+        default='INFO',
+        update=update_debug_log_settings
+    )
+    
+    bpy.types.Scene.miixarch_debug_log_dir = StringProperty(
+        name="Katalog logów",
+        description="Katalog plików logu (puste = katalog tymczasowy systemu)",
+        default="",
+        subtype='DIR_PATH',
+        update=update_debug_log_settings
+    )
+    bpy.types.Scene.miixarch_dxf_text_mode = EnumProperty(
+        name="Tekst DXF",
+        description="Sposób eksportu obiektów tekstowych (FONT)",
+        items=[
+            ('GEOMETRY', "Kontury", "Tekst jako kontury liter (polilinie/linie i hatche)"),
+            ('TEXT', "TEXT/MTEXT", "Tekst jako edytowalne encje TEXT/MTEXT, bez konwersji geometrii"),
+        ],
+        default='GEOMETRY'
+    )
+    bpy.types.Scene.miixarch_dxf_writer = EnumProperty(
+        name="Zapis DXF",
+        description="Sposób zapisu pliku DXF",
+        items=[
+            ('EZDXF', "Dokument ezdxf", "Cały dokument budowany w pamięci i zapisywany na końcu"),
+            ('STREAM', "Strumieniowy", "Encje zapisywane na bieżąco na dysk (mniej pamięci przy dużych eksportach)"),
+        ],
+        default='EZDXF'
+    )
+    bpy.types.Scene.miixarch_dxf_simplify = BoolProperty(
+        name="Upraszczaj polilinie",
+        description="Douglas-Peucker z tolerancją 1 mm modelu (× SCALE_DXF) po scaleniu wierzchołków współliniowych",
+        default=False
+    )
+    bpy.types.Scene.miixarch_dxf_dedup = EnumProperty(
+        name="Duplikaty odcinków",
+        description="Usuwanie pokrywających się odcinków różnych obiektów w eksporcie rzutu",
+        items=[
+            ('OFF', "Wyłączone", "Wszystkie odcinki zapisywane bez zmian"),
+            ('LAYER', "W warstwie", "Pokrywające się odcinki tylko w obrębie tej samej warstwy"),
+            ('KIND', "Przekrój > widok > nad", "Także między warstwami - wygrywa przekrój, potem widok, potem nad"),
+            ('ORDER', "Kolejność rysowania", "Także między warstwami - wygrywa warstwa rysowana wcześniej"),
+        ],
+        default='LAYER'
+    )
+    bpy.types.Scene.miixarch_dxf_line_mode = EnumProperty(
+        name="Krawędzie DXF",
+        description="Sposób zapisu krawędzi obszarów i konturów tekstu",
+        items=[
+            ('LINES', "Linie", "Każda krawędź jako osobna encja LINE"),
+            ('POLYLINES', "Polilinie", "Krawędzie obiektu łączone w ciągi LWPOLYLINE (zamknięte dla pętli)"),
+        ],
+        default='LINES'
+    )
+    
     # NOTE: PropertyGroups zastąpione Custom Properties dla kompatybilności
     # Wszystkie ustawienia DXF przechowywane są teraz w obj["miix_dxf_*"]
     
@@ -6224,6 +8475,8 @@ def register():
     
     # Handler dla ładowania pliku
     bpy.app.handlers.load_post.append(auto_import_layers_on_load)
+    bpy.app.handlers.load_post.append(sync_debug_log_on_load)
+    bpy.app.handlers.load_post.append(reset_dxf_cache_on_load)
 
 
 def unregister():
@@ -6266,6 +8519,10 @@ def unregister():
         bpy.app.handlers.depsgraph_update_post.remove(auto_export_layers_on_change)
     if auto_import_layers_on_load in bpy.app.handlers.load_post:
         bpy.app.handlers.load_post.remove(auto_import_layers_on_load)
+    if sync_debug_log_on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(sync_debug_log_on_load)
+    if reset_dxf_cache_on_load in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(reset_dxf_cache_on_load)
     if auto_create_opis_kota_text_objects in bpy.app.handlers.depsgraph_update_post:
         bpy.app.handlers.depsgraph_update_post.remove(auto_create_opis_kota_text_objects)
     if update_kota_texts in bpy.app.handlers.depsgraph_update_post:
@@ -6314,6 +8571,9 @@ def unregister():
     
     for c in reversed(classes):
         bpy.utils.unregister_class(c)
+    
+    # Zapisz zaległe komunikaty logu
+    shutdown_debug_log()
 
 if __name__ == "__main__":
     register()
\ No newline at end of file